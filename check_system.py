@@ -10,6 +10,11 @@ import subprocess
 import importlib
 import platform
 import os
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Colors for output
@@ -20,17 +25,28 @@ class Colors:
     BLUE = '\033[0;34m'
     NC = '\033[0m'  # No Color
 
+# Checks running concurrently collect their output here instead of
+# interleaving it on the terminal
+_output = threading.local()
+
+def _emit(line):
+    lines = getattr(_output, 'lines', None)
+    if lines is None:
+        print(line)
+    else:
+        lines.append(line)
+
 def print_status(message):
-    print(f"{Colors.BLUE}[INFO]{Colors.NC} {message}")
+    _emit(f"{Colors.BLUE}[INFO]{Colors.NC} {message}")
 
 def print_success(message):
-    print(f"{Colors.GREEN}[✓]{Colors.NC} {message}")
+    _emit(f"{Colors.GREEN}[✓]{Colors.NC} {message}")
 
 def print_warning(message):
-    print(f"{Colors.YELLOW}[⚠]{Colors.NC} {message}")
+    _emit(f"{Colors.YELLOW}[⚠]{Colors.NC} {message}")
 
 def print_error(message):
-    print(f"{Colors.RED}[✗]{Colors.NC} {message}")
+    _emit(f"{Colors.RED}[✗]{Colors.NC} {message}")
 
 def check_python_version():
     """Check if Python version is 3.9 or higher"""
@@ -189,7 +205,184 @@ def check_disk_space():
         print_warning(f"Could not check disk space: {e}")
         return True
 
-def main():
+def check_relay_state():
+    """Report the live relay state published by a running controller"""
+    print_status("Checking running relay controller...")
+    try:
+        from state_shm import read_state, writer_alive
+        snapshot = read_state()
+    except (OSError, ValueError, RuntimeError):
+        print_warning("Relay controller is not running (no shared state page)")
+        return True
+    if not writer_alive(snapshot):
+        print_warning(f"Stale state page left by pid {snapshot['pid']}")
+        return True
+    on = [str(index + 1) for index, state in enumerate(snapshot['states']) if state]
+    print_success(f"Controller pid {snapshot['pid']} running, state version {snapshot['version']} ✓")
+    print_status(f"Relays ON: {', '.join(on) if on else 'none'}")
+    return True
+
+def _run_buffered(check_func):
+    """Run one check in a worker thread, returning (result, output lines)"""
+    _output.lines = []
+    try:
+        result = check_func()
+    except Exception as e:
+        print_error(f"Check crashed: {e}")
+        result = False
+    lines = _output.lines
+    _output.lines = None
+    return result, lines
+
+def run_checks_concurrently(checks):
+    """Run independent checks in parallel and print their output in order"""
+    with ThreadPoolExecutor(max_workers=len(checks)) as pool:
+        futures = [pool.submit(_run_buffered, check_func) for _, check_func in checks]
+        results = []
+        for (name, _), future in zip(checks, futures):
+            result, lines = future.result()
+            print()
+            for line in lines:
+                print(line)
+            results.append((name, result))
+    return results
+
+# ---------------------------------------------------------
+# Hardware benchmark (--bench)
+# ---------------------------------------------------------
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    return {
+        'median': statistics.median(samples),
+        'p99': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+    }
+
+def _time_calls(func, iterations):
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - start)
+    return _percentiles(samples)
+
+# Relay lines of a default install; --bench only drives them after --lines
+# names them and the user confirms
+RELAY_PORTS = [10, 12, 13, 14, 15, 6, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26]
+# Toggle-rate cap on real hardware: a mechanical relay is rated for a few
+# operations per second at most, and every toggle wears its contacts
+SAFE_TOGGLE_HZ = 5.0
+# Backends that never touch real GPIO lines
+VIRTUAL_BACKENDS = ('sim', 'mock')
+
+def bench_backend(name, ports, iterations=1000, toggle_seconds=0.5, max_toggle_hz=None):
+    """Measure write/read latency and toggle rate for one relay_lib backend
+
+    The latency loops write every line OFF over and over, so they time the
+    write path without switching anything; only the toggle test switches
+    line 0 on and off, at most ``max_toggle_hz`` times a second.
+
+    Returns:
+        dict: Latency figures in seconds and the toggle rate in Hz, or an
+        ``error`` key when the backend could not be opened.
+    """
+    import relay_lib
+    try:
+        backend = relay_lib.open_backend(name, ports)
+    except Exception as e:
+        return {'error': f"{type(e).__name__}: {e}"}
+
+    try:
+        backend.write_mask(0)
+        result = {
+            'single_write': _time_calls(lambda i: backend.write(0, False), iterations),
+            'bulk_write': _time_calls(lambda i: backend.write_mask(0), iterations),
+            'read_back': _time_calls(lambda i: backend.read_mask(), iterations),
+        }
+
+        # Toggle one line, verifying every write; the rate only counts
+        # toggles whose read-back matched
+        toggles = 0
+        mismatches = 0
+        deadline = time.perf_counter() + toggle_seconds
+        started = time.perf_counter()
+        while time.perf_counter() < deadline:
+            on = not toggles & 1
+            backend.write(0, on)
+            if bool(backend.read_mask() & 1) != on:
+                mismatches += 1
+            toggles += 1
+            if max_toggle_hz:
+                pause = started + toggles / max_toggle_hz - time.perf_counter()
+                if pause > 0:
+                    time.sleep(pause)
+        elapsed = time.perf_counter() - started
+        result['toggle_rate'] = (toggles - mismatches) / elapsed
+        result['toggle_mismatches'] = mismatches
+        result['toggle_capped'] = bool(max_toggle_hz)
+        return result
+    except Exception as e:
+        return {'error': f"{type(e).__name__}: {e}"}
+    finally:
+        try:
+            backend.write_mask(0)
+        finally:
+            backend.close()
+
+def print_bench_table(results):
+    """Print the backend comparison"""
+    header = f"{'Backend':<10}{'write µs':>12}{'bulk µs':>12}{'read µs':>12}{'toggle Hz':>12}"
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        if 'error' in result:
+            print(f"{name:<10}  unavailable: {result['error']}")
+            continue
+        print(f"{name:<10}"
+              f"{result['single_write']['median'] * 1e6:>12.1f}"
+              f"{result['bulk_write']['median'] * 1e6:>12.1f}"
+              f"{result['read_back']['median'] * 1e6:>12.1f}"
+              f"{result['toggle_rate']:>12.0f}"
+              f"{' (capped)' if result['toggle_capped'] else ''}")
+        if result['toggle_mismatches']:
+            print_warning(f"{name}: {result['toggle_mismatches']} read-back mismatches while toggling")
+    usable = {name: r for name, r in results.items()
+              if 'error' not in r and name not in VIRTUAL_BACKENDS}
+    if usable:
+        fastest = min(usable, key=lambda name: usable[name]['bulk_write']['median'])
+        print_success(f"Fastest backend on this box: {fastest}")
+    print_status(f"Latencies are medians; on hardware the toggle test is capped at {SAFE_TOGGLE_HZ:g} Hz")
+
+def run_bench(ports, backends, iterations):
+    """Benchmark each backend in turn on the given lines"""
+    print("\n" + "=" * 40)
+    shown = ports if len(ports) <= 16 else f"{ports[0]}..{ports[-1]} ({len(ports)} lines)"
+    print(f"⏱  Backend benchmark on lines {shown}")
+    print("=" * 40)
+    results = {}
+    for name in backends:
+        print_status(f"Benchmarking {name}...")
+        cap = None if name in VIRTUAL_BACKENDS else SAFE_TOGGLE_HZ
+        results[name] = bench_backend(name, ports, iterations, max_toggle_hz=cap)
+    print()
+    print_bench_table(results)
+    return results
+
+def confirm_hardware(ports, assume_yes=False):
+    """Ask before the benchmark drives lines wired to relays"""
+    relays = sorted(set(ports) & set(RELAY_PORTS))
+    if not relays:
+        return True
+    print_warning(f"Lines {relays} drive relays: the benchmark will switch line {ports[0]} "
+                  f"up to {SAFE_TOGGLE_HZ:g} times a second and leave every line OFF")
+    if assume_yes:
+        return True
+    try:
+        return input("Type 'yes' to continue: ").strip().lower() == 'yes'
+    except EOFError:
+        return False
+
+def main(parallel=False):
     """Main system check function"""
     print("🔍 Pi-5 Relay Controller System Check")
     print("=" * 40)
@@ -202,13 +395,17 @@ def main():
         ("Python Packages", check_python_packages),
         ("Network", check_network),
         ("Disk Space", check_disk_space),
+        ("Relay Controller", check_relay_state),
     ]
     
-    results = []
-    for name, check_func in checks:
-        print()
-        result = check_func()
-        results.append((name, result))
+    if parallel:
+        results = run_checks_concurrently(checks)
+    else:
+        results = []
+        for name, check_func in checks:
+            print()
+            result = check_func()
+            results.append((name, result))
     
     print("\n" + "=" * 40)
     print("📋 System Check Summary:")
@@ -241,5 +438,46 @@ def main():
         return True
 
 if __name__ == "__main__":
-    success = main()
+    parser = argparse.ArgumentParser(description="Pi-5 Relay Controller system check")
+    parser.add_argument('--bench', action='store_true',
+                        help="run the checks concurrently, then benchmark the GPIO backends")
+    parser.add_argument('--lines', default=None,
+                        help="comma separated GPIO lines or ranges such as 0-1023 to benchmark; "
+                             "required with --hardware, use unconnected lines to avoid clicking "
+                             "the relays")
+    parser.add_argument('--hardware', action='store_true',
+                        help="benchmark gpiod, gpiozero and RPi.GPIO on the real --lines "
+                             "(default: only the simulated gpiochip and the mock backend)")
+    parser.add_argument('--yes', action='store_true',
+                        help="do not ask before driving lines wired to relays")
+    parser.add_argument('--mock', action='store_true',
+                        help="benchmark only the in-memory mock backend")
+    parser.add_argument('--sim', action='store_true',
+                        help="benchmark the simulated gpiochip (configured by RELAY_SIM_*) "
+                             "and the mock backend (the default)")
+    parser.add_argument('--iterations', type=int, default=1000,
+                        help="samples per latency measurement")
+    args = parser.parse_args()
+    if args.hardware and not args.lines:
+        parser.error("--hardware needs --lines: name the lines the benchmark may drive")
+
+    success = main(parallel=args.bench)
+    if args.bench:
+        if args.lines:
+            ports = []
+            for part in args.lines.split(','):
+                first, _, last = part.partition('-')
+                ports.extend(range(int(first), int(last or first) + 1))
+        else:
+            ports = RELAY_PORTS
+        if args.mock:
+            backends = ["mock"]
+        elif args.hardware:
+            backends = ["gpiod", "gpiozero", "RPi.GPIO", "mock"]
+            if not confirm_hardware(ports, args.yes):
+                print_error("Hardware benchmark cancelled")
+                sys.exit(1)
+        else:
+            backends = ["sim", "mock"]
+        run_bench(ports, backends, args.iterations)
     sys.exit(0 if success else 1)
@@ -0,0 +1,18 @@
+"""Client library for the Pi-5 Relay Controller HTTP API.
+
+`RelayClient` (blocking) and `AsyncRelayClient` (asyncio) keep a pool of
+keep-alive connections, log in through ``/login`` and log in again when the
+session expires, and turn the server's ``{msg:"..."}`` answers into return
+values or `RelayError` exceptions.
+"""
+
+from ._protocol import (AuthenticationError, Busy, InterlockRejected, InvalidRelay,
+                        LeaseExpired, Preempted, RelayError, RelayState)
+from .aio import AsyncRelayClient
+from .sync import RelayClient
+
+__all__ = [
+    'AsyncRelayClient', 'AuthenticationError', 'Busy', 'InterlockRejected',
+    'InvalidRelay', 'LeaseExpired', 'Preempted', 'RelayClient', 'RelayError', 'RelayState',
+]
+__version__ = '1.0.0'
@@ -0,0 +1,106 @@
+"""Response parsing and errors shared by the sync and asyncio clients.
+
+The server answers commands with pseudo-JSON strings such as
+``{msg:"success"}`` or ``{msg:"interlock",reason:"..."}`` and redirects to
+``/login`` when the session has expired.
+"""
+
+import json
+import re
+from dataclasses import dataclass, field
+from typing import FrozenSet, Optional
+
+# reason is a JSON string literal, so it may contain escaped quotes
+_MESSAGE = re.compile(r'msg:"(?P<msg>[^"]*)"(?:,reason:(?P<reason>"(?:[^"\\]|\\.)*"))?')
+
+
+class RelayError(Exception):
+    """A command the server did not carry out.
+
+    Attributes:
+        status (int): HTTP status code.
+        message (str): The ``msg`` field of the response, if any.
+    """
+
+    def __init__(self, text: str, status: int = 0, message: Optional[str] = None):
+        super().__init__(text)
+        self.status = status
+        self.message = message
+
+
+class AuthenticationError(RelayError):
+    """Login was refused."""
+
+
+class InvalidRelay(RelayError):
+    """The relay number (or scene name) is unknown to the server."""
+
+
+class InterlockRejected(RelayError):
+    """An interlock rule refused the write; ``reason`` says which."""
+
+    def __init__(self, reason: str, status: int = 409):
+        super().__init__(reason, status, 'interlock')
+        self.reason = reason
+
+
+class Busy(RelayError):
+    """The server's command queue is full; retry after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after: float, status: int = 429):
+        super().__init__(f"command queue full, retry after {retry_after}s", status, 'busy')
+        self.retry_after = retry_after
+
+
+class Preempted(RelayError):
+    """An emergency stop interrupted or cancelled the command."""
+
+
+class LeaseExpired(RelayError):
+    """A renewal came too late: the relay has no lease (and is switched off)."""
+
+
+@dataclass(frozen=True)
+class RelayState:
+    """A snapshot of every relay, as returned by ``/status``."""
+
+    count: int
+    mask: int
+    version: Optional[int] = None
+    on: FrozenSet[int] = field(default_factory=frozenset)
+
+    def is_on(self, relay: int) -> bool:
+        return bool(self.mask >> (relay - 1) & 1)
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'RelayState':
+        return cls(count=data['count'], mask=int(data['mask'], 16),
+                   version=data.get('version'), on=frozenset(data['on']))
+
+
+def is_login_redirect(status: int, location: str) -> bool:
+    return status in (301, 302, 303, 307) and '/login' in location
+
+
+def check_command(status: int, text: str, headers) -> str:
+    """Return the ``msg`` of a command response or raise the matching RelayError."""
+    match = _MESSAGE.search(text or '')
+    message = match.group('msg') if match else None
+    if status == 200 and message == 'success':
+        return message
+    if message == 'interlock':
+        reason = match.group('reason')
+        raise InterlockRejected(json.loads(reason) if reason else 'interlock', status)
+    if status == 429 or message == 'busy':
+        raise Busy(float(headers.get('Retry-After', 1)), status)
+    if message == 'preempted':
+        raise Preempted("command interrupted by an emergency stop", status, message)
+    if message == 'expired':
+        raise LeaseExpired("no active lease to renew", status, message)
+    if status == 404:
+        raise InvalidRelay("unknown relay or scene", status, message)
+    raise RelayError(f"server answered {status}: {text[:80]!r}", status, message)
+
+
+def relay_list(relays) -> str:
+    return ','.join(str(int(relay)) for relay in relays)
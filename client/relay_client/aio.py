@@ -0,0 +1,183 @@
+"""asyncio client for the relay controller."""
+
+import asyncio
+import time
+from typing import AsyncIterator, Iterable, Optional
+
+import httpx
+
+from ._protocol import (AuthenticationError, RelayError, RelayState, check_command,
+                        is_login_redirect, relay_list)
+
+
+class AsyncRelayClient(object):
+    """The asyncio counterpart of `relay_client.RelayClient`.
+
+    Many coroutines can share one client: requests are multiplexed over the
+    keep-alive pool and an expired session is renewed by a single login.
+
+    Example::
+
+        async with AsyncRelayClient('http://pi:5000') as relays:
+            await asyncio.gather(*(relays.status(n) for n in range(1, 17)))
+            async for state in relays.subscribe():
+                print(state.on)
+    """
+
+    def __init__(self, base_url: str, username: str = 'admin', password: str = 'relay123',
+                 timeout: float = 10.0, max_connections: int = 10, verify=True):
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self._login_lock = asyncio.Lock()
+        self._logins = 0
+        self._http = httpx.AsyncClient(
+            base_url=base_url, timeout=timeout, verify=verify, follow_redirects=False,
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections))
+
+    # -- session ----------------------------------------------------------
+
+    async def login(self) -> None:
+        response = await self._http.post('/login', data={'username': self.username,
+                                                         'password': self.password})
+        if response.status_code not in (301, 302, 303) or \
+                is_login_redirect(response.status_code, response.headers.get('location', '')):
+            raise AuthenticationError("login refused", response.status_code)
+        self._logins += 1
+
+    async def _get(self, path: str, params: Optional[dict] = None,
+                   timeout: Optional[float] = None) -> httpx.Response:
+        logins = self._logins
+        response = await self._http.get(path, params=params, timeout=timeout or self.timeout)
+        if is_login_redirect(response.status_code, response.headers.get('location', '')):
+            async with self._login_lock:
+                if self._logins == logins:
+                    await self.login()
+            response = await self._http.get(path, params=params, timeout=timeout or self.timeout)
+            if is_login_redirect(response.status_code, response.headers.get('location', '')):
+                raise AuthenticationError("session rejected after login", response.status_code)
+        return response
+
+    async def _command(self, path: str, params: Optional[dict] = None) -> str:
+        response = await self._get(path, params)
+        return check_command(response.status_code, response.text, response.headers)
+
+    async def close(self) -> None:
+        await self._http.aclose()
+
+    async def __aenter__(self) -> 'AsyncRelayClient':
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    # -- commands ---------------------------------------------------------
+
+    async def on(self, relay: int, lease: Optional[float] = None) -> None:
+        """Switch a relay on; with ``lease`` it switches off after that many
+        seconds unless renewed."""
+        params = {'lease': lease} if lease is not None else None
+        await self._command(f'/on/{int(relay)}', params)
+
+    async def renew(self, relay: int, lease: Optional[float] = None) -> None:
+        """Extend a relay's lease (by its original length by default).
+
+        Raises LeaseExpired when the lease already ran out.
+        """
+        params = {'lease': lease} if lease is not None else None
+        await self._command(f'/renew/{int(relay)}', params)
+
+    async def off(self, relay: int) -> None:
+        await self._command(f'/off/{int(relay)}')
+
+    async def toggle(self, relay: int) -> None:
+        await self._command(f'/toggle/{int(relay)}')
+
+    async def reboot(self, relay: int) -> None:
+        await self._command(f'/reboot/{int(relay)}')
+
+    async def set_many(self, on: Iterable[int] = (), off: Iterable[int] = ()) -> None:
+        """Switch several relays with one request and one bulk write."""
+        await self._command('/set', {'on': relay_list(on), 'off': relay_list(off)})
+
+    async def switch_at(self, timestamp: float, on: Iterable[int] = (), off: Iterable[int] = (),
+                        tag: Optional[str] = None, wait: bool = True) -> dict:
+        """Switch at ``timestamp`` (epoch seconds on the server's clock).
+
+        The server schedules the switch and answers at once. With ``wait``
+        this returns after the target with the final record: ``status``
+        (``done``, ``missed`` or ``failed``), when the write ``started`` and
+        was ``written`` and how late it was (``late_ms``). Without ``wait``
+        it returns the ``scheduled`` record; look it up later with its ``id``.
+        """
+        params = {'t': repr(float(timestamp)), 'on': relay_list(on), 'off': relay_list(off)}
+        if tag is not None:
+            params['tag'] = tag
+        response = await self._get('/switch_at', params)
+        if response.status_code != 202:
+            check_command(response.status_code, response.text, response.headers)
+        record = response.json()
+        if not wait:
+            return record
+        await asyncio.sleep(max(0.0, timestamp - time.time()))
+        while record['status'] == 'scheduled':
+            response = await self._get(f"/switch_at/{record['id']}")
+            if response.status_code != 200:
+                raise RelayError(f"timed switch {record['id']} is gone", response.status_code)
+            record = response.json()
+            if record['status'] == 'scheduled':
+                await asyncio.sleep(0.05)
+        return record
+
+    async def all_on(self) -> None:
+        await self._command('/all_on/')
+
+    async def all_off(self) -> None:
+        await self._command('/all_off/')
+
+    async def toggle_all(self) -> None:
+        await self._command('/toggle_all/')
+
+    async def scene(self, name: str) -> None:
+        await self._command(f'/scene/{name}')
+
+    async def emergency_stop(self) -> None:
+        await self._command('/emergency_stop/')
+
+    # -- state ------------------------------------------------------------
+
+    async def leases(self) -> dict:
+        """Active leases by relay: ``expires`` (epoch), ``remaining`` and ``lease``."""
+        response = await self._get('/leases')
+        if response.status_code != 200:
+            raise RelayError("leases request failed", response.status_code)
+        return {int(relay): lease for relay, lease in response.json()['leases'].items()}
+
+    async def status(self, relay: int) -> bool:
+        response = await self._get(f'/status/{int(relay)}')
+        if response.status_code != 200:
+            raise RelayError(f"status of relay {relay} failed", response.status_code)
+        return response.text.strip() == '1'
+
+    async def states(self) -> RelayState:
+        return await self._states({})
+
+    async def wait_for_change(self, since: int, timeout: float = 25.0) -> RelayState:
+        return await self._states({'since': since, 'timeout': timeout}, wait=timeout)
+
+    async def _states(self, params: dict, wait: float = 0.0) -> RelayState:
+        response = await self._get('/status', params, timeout=self.timeout + wait)
+        if response.status_code != 200:
+            raise RelayError("status request failed", response.status_code)
+        return RelayState.from_json(response.json())
+
+    async def subscribe(self, poll_timeout: float = 25.0) -> AsyncIterator[RelayState]:
+        """Yield the current state, then a new RelayState on every change."""
+        state = await self.states()
+        yield state
+        while True:
+            new = await self.wait_for_change(state.version, poll_timeout)
+            if new.version != state.version:
+                yield new
+            state = new
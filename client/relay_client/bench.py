@@ -0,0 +1,117 @@
+"""Requests/second of the clients against a naive ``requests.get`` loop.
+
+    python -m relay_client.bench http://pi:5000 --requests 500 --concurrency 8
+
+Every variant reads ``/status/<n>`` (cycling through relays 1..``--relays``)
+so nothing is switched.  The naive loop opens a new connection for every
+call, as most ad-hoc scripts do; it uses ``requests`` when installed and
+``httpx.get`` otherwise.  Run the server with ``RELAY_GPIO_BACKEND=sim`` to
+benchmark without hardware.
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from .aio import AsyncRelayClient
+from .sync import RelayClient
+
+
+def bench_naive(base_url, username, password, count, relays):
+    try:
+        import requests
+        get = requests.get
+    except ImportError:
+        get = httpx.get
+    with RelayClient(base_url, username, password) as client:
+        client.login()
+        cookies = dict(client._http.cookies)
+    started = time.perf_counter()
+    for i in range(count):
+        get(f'{base_url}/status/{i % relays + 1}', cookies=cookies)
+    return count / (time.perf_counter() - started)
+
+
+def bench_sync(base_url, username, password, count, relays):
+    with RelayClient(base_url, username, password) as client:
+        client.login()
+        started = time.perf_counter()
+        for i in range(count):
+            client.status(i % relays + 1)
+        return count / (time.perf_counter() - started)
+
+
+def bench_async(base_url, username, password, count, relays, concurrency):
+    async def run():
+        async with AsyncRelayClient(base_url, username, password,
+                                    max_connections=concurrency) as client:
+            await client.login()
+            pending = iter(range(count))
+
+            async def worker():
+                for i in pending:
+                    await client.status(i % relays + 1)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            return count / (time.perf_counter() - started)
+
+    return asyncio.run(run())
+
+
+def bench_batched(base_url, username, password, count, relays):
+    """Switch ``relays`` relays per call with set_many versus one call per relay."""
+    relay_numbers = list(range(1, relays + 1))
+    with RelayClient(base_url, username, password) as client:
+        client.login()
+        started = time.perf_counter()
+        for i in range(count):
+            if i & 1:
+                client.set_many(off=relay_numbers)
+            else:
+                client.set_many(on=relay_numbers)
+        batched = count * relays / (time.perf_counter() - started)
+        started = time.perf_counter()
+        for i in range(count):
+            for relay in relay_numbers:
+                if i & 1:
+                    client.off(relay)
+                else:
+                    client.on(relay)
+        single = count * relays / (time.perf_counter() - started)
+        client.set_many(off=relay_numbers)
+    return batched, single
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('base_url')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='relay123')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--relays', type=int, default=16)
+    parser.add_argument('--switch', action='store_true',
+                        help="also compare set_many() with one call per relay (switches relays)")
+    args = parser.parse_args()
+    common = (args.base_url.rstrip('/'), args.username, args.password, args.requests, args.relays)
+
+    results = {
+        'naive get loop': bench_naive(*common),
+        'RelayClient': bench_sync(*common),
+        f'AsyncRelayClient x{args.concurrency}': bench_async(*common, args.concurrency),
+    }
+    baseline = results['naive get loop']
+    print(f"{'client':<24}{'req/s':>10}{'speed-up':>10}")
+    for name, rate in results.items():
+        print(f"{name:<24}{rate:>10.0f}{rate / baseline:>9.1f}x")
+    if args.switch:
+        batched, single = bench_batched(args.base_url.rstrip('/'), args.username, args.password,
+                                        max(1, args.requests // args.relays), args.relays)
+        print(f"relay switches/s: set_many {batched:.0f}, one call per relay {single:.0f}")
+
+
+if __name__ == "__main__":
+    main()
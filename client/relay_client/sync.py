@@ -0,0 +1,206 @@
+"""Blocking client for the relay controller."""
+
+import threading
+import time
+from typing import Callable, Iterable, Iterator, Optional
+
+import httpx
+
+from ._protocol import (AuthenticationError, RelayError, RelayState, check_command,
+                        is_login_redirect, relay_list)
+
+
+class RelayClient(object):
+    """Pooled, keep-alive client that logs in (again) on its own.
+
+    Args:
+        base_url (str): e.g. ``http://raspberrypi.local:5000``.
+        username (str): Dashboard user.
+        password (str): Dashboard password.
+        timeout (float): Seconds per request (long polls add their own wait).
+        max_connections (int): Size of the keep-alive connection pool; share
+            one client between threads rather than creating one per call.
+
+    Example::
+
+        with RelayClient('http://pi:5000', password='secret') as relays:
+            relays.on(3)
+            relays.set_many(on=[1, 2], off=[7])
+            print(relays.states().on)
+    """
+
+    def __init__(self, base_url: str, username: str = 'admin', password: str = 'relay123',
+                 timeout: float = 10.0, max_connections: int = 10, verify=True):
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self._login_lock = threading.Lock()
+        self._logins = 0
+        self._http = httpx.Client(
+            base_url=base_url, timeout=timeout, verify=verify, follow_redirects=False,
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections))
+
+    # -- session ----------------------------------------------------------
+
+    def login(self) -> None:
+        """Log in with the form at ``/login``; the session cookie is kept in the pool."""
+        response = self._http.post('/login', data={'username': self.username,
+                                                   'password': self.password})
+        if response.status_code not in (301, 302, 303) or \
+                is_login_redirect(response.status_code, response.headers.get('location', '')):
+            raise AuthenticationError("login refused", response.status_code)
+        self._logins += 1
+
+    def _get(self, path: str, params: Optional[dict] = None,
+             timeout: Optional[float] = None) -> httpx.Response:
+        logins = self._logins
+        response = self._http.get(path, params=params, timeout=timeout or self.timeout)
+        if is_login_redirect(response.status_code, response.headers.get('location', '')):
+            with self._login_lock:
+                # Another thread may have logged in while we waited
+                if self._logins == logins:
+                    self.login()
+            response = self._http.get(path, params=params, timeout=timeout or self.timeout)
+            if is_login_redirect(response.status_code, response.headers.get('location', '')):
+                raise AuthenticationError("session rejected after login", response.status_code)
+        return response
+
+    def _command(self, path: str, params: Optional[dict] = None) -> str:
+        response = self._get(path, params)
+        return check_command(response.status_code, response.text, response.headers)
+
+    def close(self) -> None:
+        self._http.close()
+
+    def __enter__(self) -> 'RelayClient':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # -- commands ---------------------------------------------------------
+
+    def on(self, relay: int, lease: Optional[float] = None) -> None:
+        """Switch a relay on; with ``lease`` it switches off after that many
+        seconds unless renewed."""
+        params = {'lease': lease} if lease is not None else None
+        self._command(f'/on/{int(relay)}', params)
+
+    def renew(self, relay: int, lease: Optional[float] = None) -> None:
+        """Extend a relay's lease (by its original length by default).
+
+        Raises LeaseExpired when the lease already ran out.
+        """
+        params = {'lease': lease} if lease is not None else None
+        self._command(f'/renew/{int(relay)}', params)
+
+    def off(self, relay: int) -> None:
+        self._command(f'/off/{int(relay)}')
+
+    def toggle(self, relay: int) -> None:
+        self._command(f'/toggle/{int(relay)}')
+
+    def reboot(self, relay: int) -> None:
+        """Power-cycle a relay; returns once it is back on."""
+        self._command(f'/reboot/{int(relay)}')
+
+    def set_many(self, on: Iterable[int] = (), off: Iterable[int] = ()) -> None:
+        """Switch several relays with one request and one bulk write."""
+        self._command('/set', {'on': relay_list(on), 'off': relay_list(off)})
+
+    def switch_at(self, timestamp: float, on: Iterable[int] = (), off: Iterable[int] = (),
+                  tag: Optional[str] = None, wait: bool = True) -> dict:
+        """Switch at ``timestamp`` (epoch seconds on the server's clock).
+
+        The server schedules the switch and answers at once. With ``wait``
+        this returns after the target with the final record: ``status``
+        (``done``, ``missed`` or ``failed``), when the write ``started`` and
+        was ``written`` and how late it was (``late_ms``). Without ``wait``
+        it returns the ``scheduled`` record; look it up later with its ``id``.
+        """
+        params = {'t': repr(float(timestamp)), 'on': relay_list(on), 'off': relay_list(off)}
+        if tag is not None:
+            params['tag'] = tag
+        response = self._get('/switch_at', params)
+        if response.status_code != 202:
+            check_command(response.status_code, response.text, response.headers)
+        record = response.json()
+        if not wait:
+            return record
+        time.sleep(max(0.0, timestamp - time.time()))
+        while record['status'] == 'scheduled':
+            response = self._get(f"/switch_at/{record['id']}")
+            if response.status_code != 200:
+                raise RelayError(f"timed switch {record['id']} is gone", response.status_code)
+            record = response.json()
+            if record['status'] == 'scheduled':
+                time.sleep(0.05)
+        return record
+
+    def all_on(self) -> None:
+        self._command('/all_on/')
+
+    def all_off(self) -> None:
+        self._command('/all_off/')
+
+    def toggle_all(self) -> None:
+        self._command('/toggle_all/')
+
+    def scene(self, name: str) -> None:
+        self._command(f'/scene/{name}')
+
+    def emergency_stop(self) -> None:
+        self._command('/emergency_stop/')
+
+    # -- state ------------------------------------------------------------
+
+    def leases(self) -> dict:
+        """Active leases by relay: ``expires`` (epoch), ``remaining`` and ``lease``."""
+        response = self._get('/leases')
+        if response.status_code != 200:
+            raise RelayError("leases request failed", response.status_code)
+        return {int(relay): lease for relay, lease in response.json()['leases'].items()}
+
+    def status(self, relay: int) -> bool:
+        """True when the relay is on (the server's verified state)."""
+        response = self._get(f'/status/{int(relay)}')
+        if response.status_code != 200:
+            raise RelayError(f"status of relay {relay} failed", response.status_code)
+        return response.text.strip() == '1'
+
+    def states(self) -> RelayState:
+        """Every relay in one request."""
+        return self._states({})
+
+    def wait_for_change(self, since: int, timeout: float = 25.0) -> RelayState:
+        """Block until the state version differs from ``since`` (or ``timeout``)."""
+        return self._states({'since': since, 'timeout': timeout}, wait=timeout)
+
+    def _states(self, params: dict, wait: float = 0.0) -> RelayState:
+        response = self._get('/status', params, timeout=self.timeout + wait)
+        if response.status_code != 200:
+            raise RelayError("status request failed", response.status_code)
+        return RelayState.from_json(response.json())
+
+    def subscribe(self, callback: Optional[Callable[[RelayState], None]] = None,
+                  poll_timeout: float = 25.0) -> Optional[Iterator[RelayState]]:
+        """Yield a RelayState every time the relays change, via long polling.
+
+        The first item is the current state.  With ``callback`` the loop runs
+        here and calls it for every state instead (stop it with an exception
+        or KeyboardInterrupt).
+        """
+        def states():
+            state = self.states()
+            yield state
+            while True:
+                new = self.wait_for_change(state.version, poll_timeout)
+                if new.version != state.version:
+                    yield new
+                state = new
+
+        if callback is None:
+            return states()
+        for state in states():
+            callback(state)
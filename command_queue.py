@@ -0,0 +1,256 @@
+"""Priority command queue feeding a single hardware writer thread.
+
+Every relay write in the server is submitted here and executed, one at a
+time, by the writer thread that owns the GPIO hardware.  Commands are
+ordered by priority (emergency before interactive before scheduled) and
+then by arrival.  The queue is bounded: a full queue rejects new
+interactive/scheduled work with `QueueFull` (HTTP 429), while emergency
+commands are always accepted.
+
+Long sequences (all-on with its step delays, dependency power-up with its
+readiness waits, reboot) do not occupy the writer: they run on the calling
+thread through a `Steps` handle (`CommandQueue.steps`), which submits each
+write as its own command and sleeps between them.  When an emergency
+command is submitted, the sleep is cut short and the sequence stops with
+`Preempted`, so it never writes again after the emergency.  Pauses inside a
+command that is already on the writer use `CommandQueue.step_sleep`.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+EMERGENCY = 0
+INTERACTIVE = 1
+SCHEDULED = 2
+PRIORITY_NAMES = {EMERGENCY: 'emergency', INTERACTIVE: 'interactive', SCHEDULED: 'scheduled'}
+
+
+def _interrupts(command):
+    return command.priority == EMERGENCY and command.interrupt
+
+
+class QueueFull(Exception):
+    """Raised when a non-emergency command is submitted to a full queue."""
+
+
+class Preempted(Exception):
+    """Raised inside a running command that an emergency command interrupted."""
+
+
+class Command(object):
+    __slots__ = ('priority', 'seq', 'interrupt', 'func', 'args', 'kwargs', 'enqueued',
+                 'started', 'done', 'result', 'error')
+
+    def __init__(self, priority, seq, func, args, kwargs, interrupt=True):
+        self.priority = priority
+        self.seq = seq
+        self.interrupt = interrupt
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.enqueued = time.monotonic()
+        self.started = None
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def wait(self, timeout=None):
+        """Wait for the command and return its result (or raise its error)."""
+        if not self.done.wait(timeout):
+            raise TimeoutError("command did not finish in time")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class CommandQueue(object):
+    """Bounded priority queue with one worker thread."""
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._preempt = threading.Event()
+        self._emergencies = 0     # bumped by every emergency submit (see Steps)
+        self._current = None
+        self._thread = None
+        self.stats = {
+            'processed': 0,
+            'rejected': 0,
+            'preempted': 0,
+            'max_depth': 0,
+            'wait': {name: {'count': 0, 'total': 0.0, 'max': 0.0}
+                     for name in PRIORITY_NAMES.values()},
+        }
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, name='relay-writer', daemon=True)
+            self._thread.start()
+        return self
+
+    # -- producers -------------------------------------------------------
+
+    def submit(self, func, *args, priority=INTERACTIVE, interrupt=True, **kwargs):
+        """Queue ``func(*args, **kwargs)`` for the writer thread.
+
+        Args:
+            interrupt (bool): Whether an EMERGENCY command also interrupts the
+                running command and sequences (an emergency stop does; a
+                safety switch-off that only needs to go first does not).
+                Non-interrupting emergency commands can themselves be
+                interrupted by one that interrupts.
+
+        Returns:
+            Command: Call ``wait()`` on it to get the result.
+
+        Raises:
+            QueueFull: If the queue is full and the command is not an emergency.
+        """
+        with self._cond:
+            if priority != EMERGENCY and len(self._heap) >= self.maxsize:
+                self.stats['rejected'] += 1
+                raise QueueFull(f"command queue is full ({self.maxsize} pending)")
+            command = Command(priority, next(self._seq), func, args, kwargs, interrupt)
+            heapq.heappush(self._heap, command)
+            self.stats['max_depth'] = max(self.stats['max_depth'], len(self._heap))
+            if priority == EMERGENCY and interrupt:
+                self._emergencies += 1
+                if self._current is not None and not _interrupts(self._current):
+                    self._preempt.set()
+            self._cond.notify_all()
+        return command
+
+    def run(self, func, *args, priority=INTERACTIVE, interrupt=True, **kwargs):
+        """Submit a command and block until the writer has executed it."""
+        if threading.current_thread() is self._thread:
+            # Already on the writer (e.g. a command submitting a sub-step)
+            return func(*args, **kwargs)
+        return self.submit(func, *args, priority=priority, interrupt=interrupt, **kwargs).wait()
+
+    def cancel_pending(self, below=EMERGENCY):
+        """Drop every queued command with a lower priority than ``below``."""
+        with self._cond:
+            keep = [c for c in self._heap if c.priority <= below]
+            dropped = [c for c in self._heap if c.priority > below]
+            self._heap = keep
+            heapq.heapify(self._heap)
+        for command in dropped:
+            command.error = Preempted("cancelled by emergency command")
+            command.done.set()
+        return len(dropped)
+
+    def steps(self):
+        """A `Steps` handle for a multi-step sequence run off the writer thread"""
+        return Steps(self)
+
+    # -- used by running commands -----------------------------------------
+
+    def step_sleep(self, seconds):
+        """Sleep between the steps of a long command, unless preempted."""
+        if self._preempt.wait(seconds):
+            raise Preempted("interrupted by an emergency command")
+
+    def check_preempted(self):
+        if self._preempt.is_set():
+            raise Preempted("interrupted by an emergency command")
+
+    # -- worker -----------------------------------------------------------
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                command = heapq.heappop(self._heap)
+                self._current = command
+                if _interrupts(command) or not any(_interrupts(c) for c in self._heap):
+                    self._preempt.clear()
+
+            command.started = time.monotonic()
+            waited = command.started - command.enqueued
+            wait_stats = self.stats['wait'][PRIORITY_NAMES.get(command.priority, 'scheduled')]
+            wait_stats['count'] += 1
+            wait_stats['total'] += waited
+            wait_stats['max'] = max(wait_stats['max'], waited)
+
+            try:
+                command.result = command.func(*command.args, **command.kwargs)
+            except Preempted as e:
+                self.stats['preempted'] += 1
+                command.error = e
+            except Exception as e:
+                print(f"Relay command failed: {e}")
+                command.error = e
+            finally:
+                with self._cond:
+                    self._current = None
+                self.stats['processed'] += 1
+                command.done.set()
+
+    # -- metrics -----------------------------------------------------------
+
+    def depth(self):
+        return len(self._heap)
+
+    def metrics(self):
+        with self._cond:
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for command in self._heap:
+                depth[PRIORITY_NAMES.get(command.priority, 'scheduled')] += 1
+            current = self._current
+        wait = {}
+        for name, values in self.stats['wait'].items():
+            wait[name] = {
+                'count': values['count'],
+                'avg': round(values['total'] / values['count'], 6) if values['count'] else 0.0,
+                'max': round(values['max'], 6),
+            }
+        return {
+            'depth': sum(depth.values()),
+            'depth_by_priority': depth,
+            'maxsize': self.maxsize,
+            'running': PRIORITY_NAMES.get(current.priority) if current else None,
+            'processed': self.stats['processed'],
+            'rejected': self.stats['rejected'],
+            'preempted': self.stats['preempted'],
+            'max_depth': self.stats['max_depth'],
+            'wait_seconds': wait,
+        }
+
+
+class Steps(object):
+    """Runs the steps of a sequence as separate writer commands.
+
+    Waits between the steps happen on the caller's thread, so other writes
+    (lease expiries, read-back sweeps, timed switches) go ahead in between.
+    Once an emergency command has been submitted, `sleep` and `run` raise
+    `Preempted` for the rest of the sequence.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self._epoch = queue._emergencies
+
+    def _interrupted(self):
+        return self.queue._emergencies != self._epoch
+
+    def check(self):
+        if self._interrupted():
+            raise Preempted("interrupted by an emergency command")
+
+    def sleep(self, seconds):
+        with self.queue._cond:
+            if self.queue._cond.wait_for(self._interrupted, seconds):
+                raise Preempted("interrupted by an emergency command")
+
+    def run(self, func, *args, priority=INTERACTIVE, **kwargs):
+        """Submit one step and wait for it, unless an emergency came first"""
+        self.check()
+        return self.queue.run(func, *args, priority=priority, **kwargs)
@@ -0,0 +1,253 @@
+"""Fast recovery of stuck relay GPIO lines.
+
+Used by `relay_lib.init_relay()` when requesting the lines fails and by the
+``reset_gpio.py`` command line tool.  Recovery runs in four timed phases:
+
+1. inspect - read the chip's line info to find which lines are busy and
+   which consumer holds them;
+2. reclaim - find the processes whose line requests hold the busy lines
+   and, only when asked to (``reclaim=True``, ``reset_gpio.py --kill``),
+   terminate those that are stale instances of this controller;
+3. request - claim every line with a single multi-line request, driving
+   them HIGH (relay OFF for active-low boards);
+4. verify  - read every line back with one bulk read.
+
+When the gpiod Python bindings are missing, a single ``gpioset`` call with
+all lines replaces the per-pin subprocess loop used previously.
+"""
+
+import os
+import signal
+import subprocess
+import time
+
+try:
+    if os.environ.get('RELAY_GPIO_BACKEND') == 'sim':
+        import gpio_sim as gpiod
+    else:
+        import gpiod
+except ImportError:
+    gpiod = None
+
+CHIP_PATH = '/dev/gpiochip0'
+# Consumers that belong to this project and may be reclaimed safely
+OWN_CONSUMERS = ('relay_controller', 'gpio_reset')
+# Command lines of this project's processes; only these are ever terminated
+OWN_SCRIPTS = ('server.py', 'reset_gpio.py')
+# The systemd unit of the live controller, which is never terminated
+SERVICE_NAME = 'relay-controller.service'
+# How long to wait for a terminated holder to release its lines
+RECLAIM_TIMEOUT = 1.0
+
+
+def inspect_lines(offsets, chip_path=CHIP_PATH):
+    """Return ``{offset: consumer}`` for every offset that is currently in use."""
+    busy = {}
+    chip = gpiod.Chip(chip_path)
+    try:
+        for offset in offsets:
+            info = chip.get_line_info(offset)
+            if info.used:
+                busy[offset] = info.consumer or '?'
+    finally:
+        chip.close()
+    return busy
+
+
+def find_holders(chip_path=CHIP_PATH, offsets=None):
+    """Return ``{pid: [offsets]}`` for the processes holding lines of the chip.
+
+    A holder is a process with a line request file descriptor on exactly
+    ``chip_path`` whose lines include one of ``offsets`` (any line when None).
+    The lines of a request are read from its fdinfo (Linux 6.7 and later);
+    on older kernels no holder can be attributed and the result is empty.
+    """
+    chip_name = os.path.basename(os.path.realpath(chip_path))
+    wanted = None if offsets is None else set(offsets)
+    holders = {}
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        fd_dir = os.path.join('/proc', pid, 'fd')
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            continue
+        for fd in fds:
+            try:
+                if os.readlink(os.path.join(fd_dir, fd)) != 'anon_inode:gpio-line':
+                    continue
+                chip, lines = _request_lines(os.path.join('/proc', pid, 'fdinfo', fd))
+            except OSError:
+                continue
+            if chip != chip_name:
+                continue
+            held = [line for line in lines if wanted is None or line in wanted]
+            if held:
+                holders.setdefault(int(pid), []).extend(held)
+    return holders
+
+
+def _request_lines(fdinfo_path):
+    """Return ``(chip name, [offsets])`` of a line request fd from its fdinfo"""
+    chip, lines = None, []
+    with open(fdinfo_path) as f:
+        for row in f:
+            key, _, value = row.partition(':')
+            if key == 'gpio-chip':
+                chip = value.strip()
+            elif key == 'gpio-line':
+                lines.append(int(value))
+    return chip, lines
+
+
+def _service_pid():
+    """The main pid of the running controller service, or None"""
+    try:
+        output = subprocess.run(['systemctl', 'show', '-p', 'MainPID', '--value', SERVICE_NAME],
+                                capture_output=True, text=True, timeout=2).stdout.strip()
+        return int(output) or None
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+def _is_stale(pid, command, consumers, protected):
+    """A holder may be terminated only if it is a leftover instance of this
+    project: not us, not our parent, not the live service, running one of
+    `OWN_SCRIPTS` and holding its lines under one of `OWN_CONSUMERS`."""
+    if pid in protected:
+        return False
+    if not consumers or not all(name in OWN_CONSUMERS for name in consumers):
+        return False
+    return any(os.path.basename(arg) in OWN_SCRIPTS for arg in command.split())
+
+
+def _process_name(pid):
+    try:
+        with open(f'/proc/{pid}/cmdline', 'rb') as f:
+            return f.read().replace(b'\0', b' ').decode(errors='replace').strip()
+    except OSError:
+        return '?'
+
+
+def recover_lines(offsets, chip_path=CHIP_PATH, consumer='relay_controller',
+                  keep=False, reclaim=False):
+    """Bring ``offsets`` back to a known state (all HIGH, relays OFF).
+
+    Args:
+        offsets (list): GPIO line offsets to recover.
+        chip_path (str): The GPIO chip device.
+        consumer (str): Consumer name for the new line request.
+        keep (bool): Return the line request instead of releasing it, so the
+            caller can keep driving the lines without requesting them again.
+        reclaim (bool): Terminate holders of the busy lines that are stale
+            instances of this project (see `_is_stale`).  Off by default.
+
+    Returns:
+        dict: ``ok``, ``busy`` (offset -> consumer), ``holders``,
+        ``mismatched`` offsets, per-phase ``timings`` in seconds and, when
+        ``keep`` is set, the live ``request``.
+    """
+    offsets = list(offsets)
+    result = {'ok': False, 'busy': {}, 'holders': [], 'mismatched': [],
+              'timings': {}, 'request': None, 'method': 'gpiod' if gpiod else 'gpioset'}
+    started = time.perf_counter()
+
+    def phase(name, since):
+        now = time.perf_counter()
+        result['timings'][name] = round(now - since, 6)
+        return now
+
+    if gpiod is None:
+        result['ok'] = _reset_with_gpioset(offsets, chip_path)
+        phase('total', started)
+        return result
+
+    mark = started
+    try:
+        result['busy'] = inspect_lines(offsets, chip_path)
+    except Exception as e:
+        print(f"Could not read line info from {chip_path}: {e}")
+    mark = phase('inspect', mark)
+
+    if result['busy']:
+        protected = {os.getpid(), os.getppid(), _service_pid()}
+        for pid, held in sorted(find_holders(chip_path, result['busy']).items()):
+            command = _process_name(pid)
+            consumers = {result['busy'][offset] for offset in held}
+            result['holders'].append({'pid': pid, 'command': command, 'offsets': sorted(held),
+                                      'stale': _is_stale(pid, command, consumers, protected)})
+        stale = [holder for holder in result['holders'] if holder['stale']]
+        if reclaim and stale:
+            for holder in stale:
+                print(f"Terminating stale GPIO holder {holder['pid']} ({holder['command']})")
+                try:
+                    os.kill(holder['pid'], signal.SIGTERM)
+                except OSError as e:
+                    print(f"Could not terminate {holder['pid']}: {e}")
+            deadline = time.monotonic() + RECLAIM_TIMEOUT
+            while time.monotonic() < deadline:
+                try:
+                    if not inspect_lines(offsets, chip_path):
+                        break
+                except Exception:
+                    break
+                time.sleep(0.02)
+    mark = phase('reclaim', mark)
+
+    config = {offset: gpiod.LineSettings(direction=gpiod.line.Direction.OUTPUT,
+                                         output_value=gpiod.line.Value.ACTIVE)
+              for offset in offsets}
+    try:
+        request = gpiod.request_lines(chip_path, consumer=consumer, config=config)
+    except Exception as e:
+        print(f"Multi-line request failed: {e}")
+        phase('request', mark)
+        phase('total', started)
+        return result
+    mark = phase('request', mark)
+
+    try:
+        values = request.get_values(offsets)
+        result['mismatched'] = [offset for offset, value in zip(offsets, values)
+                                if value != gpiod.line.Value.ACTIVE]
+        result['ok'] = not result['mismatched']
+    except Exception as e:
+        print(f"Read-back after recovery failed: {e}")
+    phase('verify', mark)
+
+    if keep:
+        result['request'] = request
+    else:
+        request.release()
+    phase('total', started)
+    return result
+
+
+def _reset_with_gpioset(offsets, chip_path):
+    # libgpiod v2's gpioset keeps the lines until it exits, so the timeout
+    # doubles as "hold for a moment, then release"
+    chip = os.path.basename(chip_path)
+    try:
+        subprocess.run(['gpioset', chip] + [f'{offset}=1' for offset in offsets],
+                       timeout=1, capture_output=True)
+        return True
+    except subprocess.TimeoutExpired:
+        return True
+    except Exception as e:
+        print(f"gpioset reset failed: {e}")
+        return False
+
+
+def print_report(result):
+    """Print a human readable summary of a `recover_lines` result."""
+    print(f"GPIO recovery via {result['method']}: {'OK' if result['ok'] else 'FAILED'}")
+    for offset, consumer in sorted(result['busy'].items()):
+        print(f"  GPIO {offset} was held by '{consumer}'")
+    for holder in result['holders']:
+        print(f"  holder pid {holder['pid']} (lines {holder['offsets']}"
+              f"{', stale' if holder['stale'] else ''}): {holder['command']}")
+    if result['mismatched']:
+        print(f"  lines not HIGH after reset: {result['mismatched']}")
+    for name, seconds in result['timings'].items():
+        print(f"  {name:<8} {seconds * 1000:8.2f} ms")
@@ -0,0 +1,274 @@
+"""Simulated gpiochip with the same interface as the gpiod 2.x bindings.
+
+Select it with ``RELAY_GPIO_BACKEND=sim``: relay_lib then imports this module
+in place of ``gpiod`` and every gpiod code path (bulk writes, read-back,
+line recovery) runs unchanged against virtual lines, so the server and the
+benchmarks can run at scale on any Linux box.
+
+Behaviour is configured from the environment (or `configure()`):
+
+``RELAY_SIM_LINES``
+    Number of lines per chip (default 4096).
+``RELAY_SIM_RELAYS``
+    Number of relays the server drives (see relay_lib, default 16).
+``RELAY_SIM_LATENCY``
+    Per-call latency distribution: ``fixed:S``, ``uniform:LOW:HIGH``,
+    ``normal:MEAN:STDDEV``, ``lognormal:MU:SIGMA`` or ``exp:MEAN``
+    (seconds, default ``fixed:0``).
+``RELAY_SIM_EBUSY_RATE``
+    Probability that ``request_lines()`` fails with EBUSY.
+``RELAY_SIM_IO_ERROR_RATE``
+    Probability that a get/set call fails with EIO.
+``RELAY_SIM_MISMATCH_RATE``
+    Probability that a read-back reports the wrong value for a line.
+``RELAY_SIM_BUSY_LINES``
+    Comma separated lines already held by another consumer at start.
+``RELAY_SIM_SEED``
+    Seed for reproducible fault injection.
+
+Line ownership is tracked per chip: requesting a line that is already
+requested fails with EBUSY until the owner releases it.
+"""
+
+import errno
+import os
+import random
+import threading
+import time
+from enum import Enum
+
+__version__ = 'sim'
+
+
+class _Line(object):
+    class Value(Enum):
+        INACTIVE = 0
+        ACTIVE = 1
+
+    class Direction(Enum):
+        AS_IS = 1
+        INPUT = 2
+        OUTPUT = 3
+
+
+line = _Line
+
+
+class LineSettings(object):
+    def __init__(self, direction=line.Direction.AS_IS, output_value=line.Value.INACTIVE, **kwargs):
+        self.direction = direction
+        self.output_value = output_value
+
+
+class LineInfo(object):
+    def __init__(self, offset, used, consumer, direction):
+        self.offset = offset
+        self.used = used
+        self.consumer = consumer
+        self.direction = direction
+
+
+class SimConfig(object):
+    """Latency and fault injection settings shared by every simulated chip."""
+
+    def __init__(self, env=os.environ):
+        self.num_lines = int(env.get('RELAY_SIM_LINES', 4096))
+        self.latency = parse_latency(env.get('RELAY_SIM_LATENCY', 'fixed:0'))
+        self.ebusy_rate = float(env.get('RELAY_SIM_EBUSY_RATE', 0))
+        self.io_error_rate = float(env.get('RELAY_SIM_IO_ERROR_RATE', 0))
+        self.mismatch_rate = float(env.get('RELAY_SIM_MISMATCH_RATE', 0))
+        self.busy_lines = [int(n) for n in env.get('RELAY_SIM_BUSY_LINES', '').split(',') if n.strip()]
+        seed = env.get('RELAY_SIM_SEED')
+        self.random = random.Random(int(seed) if seed else None)
+
+
+def parse_latency(spec):
+    """Turn a ``kind:arg[:arg]`` spec into a callable returning seconds."""
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(':') if v]
+    rng = random.Random()
+    if kind == 'fixed':
+        return lambda: values[0] if values else 0.0
+    if kind == 'uniform':
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == 'normal':
+        return lambda: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == 'lognormal':
+        return lambda: rng.lognormvariate(values[0], values[1])
+    if kind == 'exp':
+        return lambda: rng.expovariate(1.0 / values[0]) if values[0] else 0.0
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+CONFIG = SimConfig()
+_CHIPS = {}
+_CHIPS_LOCK = threading.Lock()
+
+
+def configure(**overrides):
+    """Replace the simulation settings, e.g. ``configure(RELAY_SIM_IO_ERROR_RATE='0.01')``.
+
+    Existing chips (and their line state) are discarded.
+    """
+    global CONFIG
+    env = dict(os.environ)
+    env.update({key: str(value) for key, value in overrides.items()})
+    CONFIG = SimConfig(env)
+    with _CHIPS_LOCK:
+        _CHIPS.clear()
+
+
+def _delay():
+    seconds = CONFIG.latency()
+    if seconds <= 0:
+        return
+    if seconds >= 0.001:
+        time.sleep(seconds)
+    else:
+        # time.sleep() overshoots sub-millisecond delays; spin instead
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            pass
+
+
+def _maybe_io_error():
+    if CONFIG.io_error_rate and CONFIG.random.random() < CONFIG.io_error_rate:
+        raise OSError(errno.EIO, "Input/output error (simulated)")
+
+
+class _SimChipState(object):
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.values = bytearray(CONFIG.num_lines)   # 0 = INACTIVE, 1 = ACTIVE
+        self.owners = {offset: 'sim-holder' for offset in CONFIG.busy_lines}
+        self.directions = {}
+
+
+def _chip_state(path):
+    with _CHIPS_LOCK:
+        state = _CHIPS.get(path)
+        if state is None:
+            state = _CHIPS[path] = _SimChipState(path)
+        return state
+
+
+def _flatten_config(config):
+    for key, settings in config.items():
+        offsets = key if isinstance(key, (tuple, list)) else (key,)
+        for offset in offsets:
+            yield offset, settings
+
+
+class LineRequest(object):
+    def __init__(self, chip, offsets, consumer):
+        self._chip = chip
+        self.offsets = list(offsets)
+        self.consumer = consumer
+        self._released = False
+
+    def _check(self, offset):
+        if self._released:
+            raise RuntimeError("line request has been released")
+        if offset not in self._chip.owners or self._chip.owners[offset] is not self:
+            raise ValueError(f"line {offset} is not part of this request")
+
+    def set_value(self, offset, value):
+        _delay()
+        _maybe_io_error()
+        with self._chip.lock:
+            self._check(offset)
+            self._chip.values[offset] = value.value
+
+    def set_values(self, values):
+        _delay()
+        _maybe_io_error()
+        with self._chip.lock:
+            for offset, value in values.items():
+                self._check(offset)
+                self._chip.values[offset] = value.value
+
+    def get_value(self, offset):
+        return self.get_values([offset])[0]
+
+    def get_values(self, offsets=None):
+        _delay()
+        _maybe_io_error()
+        offsets = self.offsets if offsets is None else offsets
+        with self._chip.lock:
+            for offset in offsets:
+                self._check(offset)
+            raw = [self._chip.values[offset] for offset in offsets]
+        if CONFIG.mismatch_rate:
+            raw = [1 - value if CONFIG.random.random() < CONFIG.mismatch_rate else value
+                   for value in raw]
+        return [line.Value(value) for value in raw]
+
+    def release(self):
+        with self._chip.lock:
+            if self._released:
+                return
+            for offset in self.offsets:
+                if self._chip.owners.get(offset) is self:
+                    del self._chip.owners[offset]
+            self._released = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class Chip(object):
+    def __init__(self, path):
+        self.path = path
+        self._state = _chip_state(path)
+
+    def get_line_info(self, offset):
+        state = self._state
+        if not 0 <= offset < len(state.values):
+            raise ValueError(f"invalid line offset {offset}")
+        with state.lock:
+            owner = state.owners.get(offset)
+        consumer = owner if isinstance(owner, str) else (owner.consumer if owner else None)
+        return LineInfo(offset, owner is not None, consumer,
+                        state.directions.get(offset, line.Direction.INPUT))
+
+    def request_lines(self, config, consumer=None, output_values=None):
+        _delay()
+        state = self._state
+        settings = dict(_flatten_config(config))
+        if CONFIG.ebusy_rate and CONFIG.random.random() < CONFIG.ebusy_rate:
+            raise OSError(errno.EBUSY, "Device or resource busy (simulated)")
+        with state.lock:
+            for offset in settings:
+                if not 0 <= offset < len(state.values):
+                    raise ValueError(f"invalid line offset {offset}")
+                if offset in state.owners:
+                    raise OSError(errno.EBUSY, "Device or resource busy")
+            request = LineRequest(state, settings, consumer or '?')
+            for offset, line_settings in settings.items():
+                state.owners[offset] = request
+                state.directions[offset] = line_settings.direction
+                if line_settings.direction == line.Direction.OUTPUT:
+                    state.values[offset] = line_settings.output_value.value
+        return request
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def request_lines(path, consumer=None, config=None, **kwargs):
+    """Module-level helper matching ``gpiod.request_lines``."""
+    return Chip(path).request_lines(config or {}, consumer=consumer)
+
+
+def is_gpiochip_device(path):
+    return True
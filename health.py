@@ -0,0 +1,75 @@
+"""Liveness and readiness probes backed by a background heartbeat.
+
+The heartbeat thread wakes up every `INTERVAL` seconds, gathers the
+readiness facts from values other parts of the server already keep in
+memory and pre-renders the ``/readyz`` response body.  The probe handlers
+only return the cached bytes, so a probe never touches the GPIO hardware,
+the file system or the log.
+"""
+
+import json
+import threading
+import time
+
+INTERVAL = 1.0
+# Liveness fails when the heartbeat has not ticked for this long
+STALL_AFTER = 10.0
+# Readiness fails when more state changes than this are waiting to be saved
+MAX_PERSISTENCE_DEPTH = 100
+# Readiness fails when the heartbeat wakes up this much later than scheduled
+MAX_SCHEDULER_LAG = 2.0
+
+
+class Heartbeat(object):
+    """Keeps precomputed probe responses fresh from a daemon thread.
+
+    Args:
+        sources (dict): Maps a readiness field name to a zero-argument
+            callable returning its current value.  The special keys
+            ``gpio_ready`` (bool) and ``persistence_queue_depth`` (int) take
+            part in the ready decision; everything else is informational.
+    """
+
+    def __init__(self, sources, interval=INTERVAL):
+        self.sources = sources
+        self.interval = interval
+        self.started = time.monotonic()
+        self.last_beat = self.started
+        self.lag = 0.0
+        self.readiness = (False, b'{}')  # (ready, body), swapped atomically
+        self._beat()
+
+    def _beat(self):
+        status = {}
+        for name, source in self.sources.items():
+            try:
+                status[name] = source()
+            except Exception as e:
+                status[name] = f"error: {e}"
+        status['scheduler_lag'] = round(self.lag, 4)
+        status['uptime'] = round(time.monotonic() - self.started, 1)
+        depth = status.get('persistence_queue_depth', 0)
+        ready = (status.get('gpio_ready') is True
+                 and isinstance(depth, int) and depth <= MAX_PERSISTENCE_DEPTH
+                 and self.lag <= MAX_SCHEDULER_LAG)
+        status['ready'] = ready
+        self.readiness = (ready, json.dumps(status, sort_keys=True).encode())
+        self.last_beat = time.monotonic()
+
+    def start(self):
+        def run():
+            next_beat = time.monotonic() + self.interval
+            while True:
+                time.sleep(max(0.0, next_beat - time.monotonic()))
+                now = time.monotonic()
+                # How late this wake-up was: a busy or starved process shows here
+                self.lag = max(0.0, now - next_beat)
+                self._beat()
+                next_beat = now + self.interval
+
+        thread = threading.Thread(target=run, name='health-heartbeat', daemon=True)
+        thread.start()
+        return thread
+
+    def alive(self):
+        return time.monotonic() - self.last_beat < STALL_AFTER
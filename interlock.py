@@ -0,0 +1,175 @@
+"""Relay interlocks compiled into bitmasks and checked before every write.
+
+Rules are declared next to the channels in ``channels.json``:
+
+    "interlocks": [
+        {"name": "Heater / cooler", "exclusive": [3, 4]},
+        {"name": "CCD supply", "relay": 2, "requires": [7]}
+    ]
+
+``exclusive`` lists relays of which at most one may be on at a time
+(heater vs cooler, forward vs reverse motor).  ``requires`` lists relays
+that must already be on, or be switched on in the same write, before
+``relay`` (a number or a list of numbers) may be switched on.
+
+At load time every rule becomes a pair of integer bitmasks in the same
+layout as `relay_mask`, and every relay gets the masks of the relays that
+must be off (``conflicts``) and on (``needs``) while it is on.  Checking a
+write is then two AND operations per guarded relay it switches on, however
+many rules there are.  Only switching relays on can violate a rule:
+switching off is the fail-safe direction and is never blocked, so all-off
+and the emergency stop always go through.
+"""
+
+import relay_mask
+
+
+class InterlockError(ValueError):
+    """Raised for invalid interlock rules and for writes that would break one.
+
+    Attributes:
+        rule (str): Name of the rule involved, if any.
+    """
+
+    def __init__(self, message, rule=None):
+        super().__init__(message)
+        self.rule = rule
+
+
+class Interlocks(object):
+    """The compiled interlock rules for a board of ``num_relays`` relays.
+
+    Args:
+        rules (list): The ``interlocks`` list from ``channels.json``.
+        num_relays (int): Number of relays on the board.
+
+    Raises:
+        InterlockError: If a rule is malformed or names an unknown relay.
+    """
+
+    def __init__(self, rules, num_relays):
+        self.num_relays = num_relays
+        self.rules = list(rules)
+        self.exclusive = []   # (group mask, name): popcount(state & mask) <= 1
+        self.requires = []    # (relays mask, required mask, name)
+        for index, rule in enumerate(self.rules):
+            name = rule.get('name', f"interlock {index + 1}")
+            if 'exclusive' in rule:
+                group = self._mask(rule['exclusive'], name)
+                if relay_mask.popcount(group) < 2:
+                    raise InterlockError(f"Interlock '{name}' needs at least two exclusive relays", name)
+                self.exclusive.append((group, name))
+            elif 'requires' in rule:
+                relays = rule.get('relay')
+                relays = self._mask(relays if isinstance(relays, list) else [relays], name)
+                required = self._mask(rule['requires'], name)
+                if relays & required:
+                    raise InterlockError(f"Interlock '{name}': a relay cannot require itself", name)
+                self.requires.append((relays, required, name))
+            else:
+                raise InterlockError(f"Interlock '{name}' needs 'exclusive' or 'requires'", name)
+        # Per relay: what must be off / on while it is on.  A write only
+        # looks at the guarded relays it switches on, so a single-relay write
+        # costs the same however many rules there are.
+        self.conflicts = {}
+        self.needs = {}
+        for group, _ in self.exclusive:
+            for relay in relay_mask.to_relays(group):
+                self.conflicts[relay] = self.conflicts.get(relay, 0) | (group & ~relay_mask.bit(relay))
+        for relays, required, _ in self.requires:
+            for relay in relay_mask.to_relays(relays):
+                self.needs[relay] = self.needs.get(relay, 0) | required
+        self.guarded = relay_mask.from_relays(set(self.conflicts) | set(self.needs))
+
+    def _mask(self, relays, name):
+        for relay in relays:
+            if not isinstance(relay, int) or not 0 < relay <= self.num_relays:
+                raise InterlockError(f"Interlock '{name}' names unknown relay {relay}", name)
+        return relay_mask.from_relays(relays)
+
+    def violation(self, current, on_mask=0, off_mask=0):
+        """Return why switching ``on_mask``/``off_mask`` from ``current`` is refused, or None."""
+        pending = on_mask & ~off_mask & self.guarded
+        if not pending:
+            return None
+        state = relay_mask.apply(current, on_mask, off_mask)
+        while pending:
+            low = pending & -pending
+            pending ^= low
+            relay = low.bit_length()
+            if state & self.conflicts.get(relay, 0) or \
+                    state & self.needs.get(relay, 0) != self.needs.get(relay, 0):
+                return self._explain(relay, state)
+        return None
+
+    def _explain(self, relay, state):
+        bit = relay_mask.bit(relay)
+        for group, name in self.exclusive:
+            if group & bit and state & group & ~bit:
+                return (f"interlock '{name}': relays {relay_mask.to_relays(state & group)} "
+                        f"must not be on together")
+        for relays, required, name in self.requires:
+            if relays & bit and state & required != required:
+                return (f"interlock '{name}': relay {relay} requires relays "
+                        f"{relay_mask.to_relays(required & ~state)} to be on")
+        return f"interlock on relay {relay}"
+
+    def check(self, current, on_mask=0, off_mask=0):
+        """Raise InterlockError if the write would break a rule."""
+        reason = self.violation(current, on_mask, off_mask)
+        if reason:
+            raise InterlockError(reason)
+
+    def describe(self):
+        """The compiled rules, for the API"""
+        return {
+            'exclusive': [{'name': name, 'relays': relay_mask.to_relays(group)}
+                          for group, name in self.exclusive],
+            'requires': [{'name': name, 'relays': relay_mask.to_relays(relays),
+                          'requires': relay_mask.to_relays(required)}
+                         for relays, required, name in self.requires],
+        }
+
+
+def benchmark(num_relays=16, rules=None, iterations=100000):
+    """Time `Interlocks.violation` for single-relay and bulk writes.
+
+    Returns:
+        dict: Mean seconds per check for a relay no rule guards
+        (``unguarded``), one guarded relay (``single``) and a write
+        switching on three quarters of the board (``bulk``).
+    """
+    import time
+
+    if rules is None:
+        # An exclusive pair and a requirement in every group of four relays
+        rules = []
+        for first in range(1, num_relays - 2, 4):
+            rules.append({'exclusive': [first, first + 1]})
+            rules.append({'relay': first + 3, 'requires': [first + 2]})
+    interlocks = Interlocks(rules, num_relays)
+    # Switching on the first of each pair and every requirement with its
+    # dependent touches every rule and passes them all
+    bulk = relay_mask.from_relays(relay for first in range(1, num_relays - 2, 4)
+                                  for relay in (first, first + 2, first + 3))
+    cases = {
+        'unguarded': (0, relay_mask.bit(3)),
+        'single': (relay_mask.bit(3), relay_mask.bit(4)),
+        'bulk': (0, bulk),
+    }
+    results = {}
+    for name, (current, on_mask) in cases.items():
+        # Bulk checks walk every guarded relay, so take fewer samples
+        rounds = max(100, iterations // max(1, relay_mask.popcount(on_mask & interlocks.guarded)))
+        started = time.perf_counter()
+        for _ in range(rounds):
+            interlocks.violation(current, on_mask)
+        results[name] = (time.perf_counter() - started) / rounds
+    return results
+
+
+if __name__ == "__main__":
+    for relays in (16, 256, 4096):
+        timings = benchmark(relays)
+        print(f"{relays:>5} relays: " + "  ".join(
+            f"{name} {seconds * 1e6:.2f} µs" for name, seconds in timings.items()))
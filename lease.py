@@ -0,0 +1,258 @@
+"""Auto-off leases: relays that switch off when their lease runs out.
+
+``/on/<n>?lease=SECONDS`` turns a relay on for a limited time; the client
+keeps it on by renewing the lease.  All leases live in one binary heap
+ordered by deadline and served by a single timer thread, so granting or
+renewing costs O(log n) and nothing polls per relay.  A renewal pushes a
+new heap entry and leaves the old one behind; stale entries are skipped
+when they surface and the heap is compacted when they pile up.
+
+Leases whose deadlines fall within `SAME_INSTANT` of each other expire
+together through one call of ``expire(mask)`` (one bulk off-write).  A lease
+granted again after its relay fell due but before the write ran must not be
+cut short, so ``expire`` should drop the relays `unleased` no longer
+reports, on the same thread that grants leases.
+Deadlines are kept on the monotonic clock, so stepping the wall clock (NTP,
+an RTC sync at boot) neither cuts leases short nor stretches them.  They
+are converted to wall-clock times only for the API and for a small JSON
+file, so leases survive a restart; any that ran out while the server was
+down expire right after it comes back.
+"""
+
+import heapq
+import itertools
+import json
+import math
+import os
+import threading
+import time
+
+import relay_mask
+
+# Deadlines closer together than this are expired by the same write
+SAME_INSTANT = 0.005
+# Minimum seconds between two writes of the lease file
+SAVE_INTERVAL = 0.5
+# Delay before retrying an expiry whose write failed
+RETRY_DELAY = 0.5
+# Longest lease accepted (a week); a relay meant to stay on needs no lease
+MAX_LEASE = 7 * 24 * 3600.0
+
+
+def valid_lease(seconds):
+    """True if ``seconds`` is a usable lease length: finite, positive, at most `MAX_LEASE`"""
+    return seconds is not None and math.isfinite(seconds) and 0 < seconds <= MAX_LEASE
+
+
+class LeaseTable(object):
+    """Active leases and the timer thread that expires them.
+
+    Args:
+        expire (callable): ``expire(mask)`` switches off the relays in the
+            bitmask; an exception makes the table retry them shortly.
+        path (str): JSON file the leases are persisted to (optional).
+        clock (callable): Monotonic time source for the deadlines.
+        wall_clock (callable): Epoch time source for the API and the file.
+    """
+
+    def __init__(self, expire, path=None, clock=time.monotonic, wall_clock=time.time):
+        self.expire = expire
+        self.path = path
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.leases = {}          # relay -> (deadline, duration, seq)
+        self.leased_mask = 0
+        self._heap = []           # (deadline, seq, relay)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._dirty = False
+        self._last_save = 0.0
+        self.stats = {'granted': 0, 'renewed': 0, 'expired': 0, 'expiry_writes': 0}
+
+    # -- leases ------------------------------------------------------------
+
+    def grant(self, relay, seconds):
+        """Start (or replace) the lease of ``relay``; returns its deadline
+
+        Raises:
+            ValueError: If ``seconds`` is not a `valid_lease`.
+        """
+        if not valid_lease(seconds):
+            raise ValueError(f"invalid lease length: {seconds}")
+        with self._cond:
+            self.stats['granted'] += 1
+            return self._push(relay, self.clock() + seconds, seconds)
+
+    def renew(self, relay, seconds=None):
+        """Extend a lease by ``seconds`` from now (default: its original length)
+
+        Raises:
+            KeyError: If the relay has no active lease.
+            ValueError: If ``seconds`` is not a `valid_lease`.
+        """
+        if seconds is not None and not valid_lease(seconds):
+            raise ValueError(f"invalid lease length: {seconds}")
+        with self._cond:
+            _, duration, _ = self.leases[relay]
+            seconds = duration if seconds is None else seconds
+            self.stats['renewed'] += 1
+            return self._push(relay, self.clock() + seconds, seconds)
+
+    def release(self, relays):
+        """Drop the leases of the relays in a bitmask without switching them"""
+        with self._cond:
+            relays &= self.leased_mask
+            for relay in relay_mask.to_relays(relays):
+                # Its heap entry goes stale and is skipped later
+                del self.leases[relay]
+            if relays:
+                self.leased_mask &= ~relays
+                self._dirty = True
+                self._cond.notify()
+
+    def _push(self, relay, deadline, duration):
+        seq = next(self._seq)
+        self.leases[relay] = (deadline, duration, seq)
+        self.leased_mask |= relay_mask.bit(relay)
+        heapq.heappush(self._heap, (deadline, seq, relay))
+        if len(self._heap) > 2 * len(self.leases) + 64:
+            self._compact()
+        self._dirty = True
+        self._cond.notify()
+        return deadline
+
+    def _compact(self):
+        self._heap = [(deadline, seq, relay) for relay, (deadline, _, seq) in self.leases.items()]
+        heapq.heapify(self._heap)
+
+    def unleased(self, relays):
+        """The relays of a bitmask that have no active lease"""
+        with self._cond:
+            return relays & ~self.leased_mask
+
+    def on_state_change(self, mask):
+        """State listener: a leased relay switched off some other way loses its lease"""
+        if self.leased_mask & ~mask:
+            self.release(self.leased_mask & ~mask)
+
+    def active(self):
+        now = self.clock()
+        to_epoch = self.wall_clock() - now
+        with self._cond:
+            return {relay: {'expires': deadline + to_epoch,
+                            'remaining': round(max(0.0, deadline - now), 3),
+                            'lease': duration}
+                    for relay, (deadline, duration, _) in sorted(self.leases.items())}
+
+    # -- timer thread --------------------------------------------------------
+
+    def start(self):
+        thread = threading.Thread(target=self._run, name='lease-timer', daemon=True)
+        thread.start()
+        return thread
+
+    def _run(self):
+        while True:
+            with self._cond:
+                due = self._pop_due()
+                if not due:
+                    timeout = self._heap[0][0] - self.clock() if self._heap else None
+                    if self._dirty:
+                        save_in = self._last_save + SAVE_INTERVAL - time.monotonic()
+                        if save_in <= 0:
+                            self._save()
+                            continue
+                        timeout = save_in if timeout is None else min(timeout, save_in)
+                    if timeout is not None:
+                        timeout = min(timeout, threading.TIMEOUT_MAX)
+                    self._cond.wait(timeout)
+                    continue
+            mask = relay_mask.from_relays(due)
+            try:
+                self.expire(mask)
+                with self._cond:
+                    self.stats['expired'] += len(due)
+                    self.stats['expiry_writes'] += 1
+            except Exception as e:
+                print(f"Lease expiry of relays {due} failed, retrying: {e}")
+                with self._cond:
+                    for relay in due:
+                        if relay not in self.leases:
+                            self._push(relay, self.clock() + RETRY_DELAY, RETRY_DELAY)
+
+    def _pop_due(self):
+        """Pop every live lease due now (or within SAME_INSTANT of the first)"""
+        due = []
+        now = self.clock()
+        if not self._heap or self._heap[0][0] > now:
+            return due
+        horizon = max(now, self._heap[0][0] + SAME_INSTANT)
+        while self._heap and self._heap[0][0] <= horizon:
+            deadline, seq, relay = heapq.heappop(self._heap)
+            lease = self.leases.get(relay)
+            if lease is None or lease[2] != seq:
+                continue  # renewed or released since
+            del self.leases[relay]
+            self.leased_mask &= ~relay_mask.bit(relay)
+            due.append(relay)
+        if due:
+            self._dirty = True
+        return due
+
+    # -- persistence ---------------------------------------------------------
+
+    def _save(self):
+        self._dirty = False
+        self._last_save = time.monotonic()
+        if not self.path:
+            return
+        to_epoch = self.wall_clock() - self.clock()
+        data = {str(relay): {'expires': deadline + to_epoch, 'lease': duration}
+                for relay, (deadline, duration, _) in self.leases.items()}
+        try:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Error saving relay leases: {e}")
+
+    def flush(self):
+        """Write pending lease changes now (e.g. at exit)"""
+        with self._cond:
+            if self._dirty:
+                self._save()
+
+    def load(self, on_mask=None):
+        """Restore persisted leases; ones that already ran out expire on start()
+
+        Args:
+            on_mask (int): Relays that are on now; leases of the others are
+                dropped, as they would otherwise switch off a relay that some
+                later command turned on.
+        """
+        try:
+            if not self.path or not os.path.exists(self.path):
+                return 0
+            with open(self.path) as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Error loading relay leases: {e}")
+            return 0
+        restored = 0
+        from_epoch = self.clock() - self.wall_clock()
+        with self._cond:
+            for relay, lease in data.items():
+                expires, duration = float(lease['expires']), float(lease['lease'])
+                if not (math.isfinite(expires) and valid_lease(duration)):
+                    print(f"Dropping lease of relay {relay}: invalid lease {lease}")
+                    self._dirty = True
+                    continue
+                if on_mask is not None and not relay_mask.is_set(on_mask, int(relay)):
+                    print(f"Dropping lease of relay {relay}: it is off")
+                    self._dirty = True
+                    continue
+                self._push(int(relay), expires + from_epoch, duration)
+                restored += 1
+        print(f"Restored {restored} relay leases")
+        return restored
@@ -0,0 +1,406 @@
+"""Optional MQTT bridge for the relay controller.
+
+Enable it by setting ``MQTT_HOST`` (``MQTT_HOST=loopback`` uses the
+in-process `LoopbackBroker`, handy for testing without mosquitto).
+
+Command topics (payloads are case-insensitive):
+
+    <prefix>/relay/<n>/set    ON | OFF | TOGGLE
+    <prefix>/all/set          ON | OFF
+    <prefix>/scene/set        <scene name from channels.json>
+
+State topics (all retained):
+
+    <prefix>/relay/<n>        ON | OFF
+    <prefix>/state            {"mask": "0x0005", "on": [1, 3], "version": 7}
+    <prefix>/availability     online | offline
+
+Bursts of state changes are batched: changes arriving within
+``MQTT_BATCH_WINDOW`` seconds result in one bank message plus one message
+per relay that actually changed.  Outgoing messages go through a bounded
+queue; when it overflows (for example while the broker is unreachable) the
+individual messages are dropped and a full resync of every retained topic is
+sent once the queue drains, since only the latest state matters.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+
+import relay_mask
+
+try:
+    import paho.mqtt.client as paho_mqtt
+    MQTT_AVAILABLE = True
+except ImportError:
+    paho_mqtt = None
+    MQTT_AVAILABLE = False
+
+DEFAULT_PREFIX = 'relay_controller'
+BATCH_WINDOW = 0.05
+QUEUE_SIZE = 256
+
+
+# ---------------------------------------------------------
+# In-process stand-in broker
+# ---------------------------------------------------------
+
+LoopbackMessage = namedtuple('LoopbackMessage', 'topic payload retain')
+
+
+def topic_matches(pattern, topic):
+    """MQTT wildcard matching for ``+`` and ``#``."""
+    pattern_parts = pattern.split('/')
+    topic_parts = topic.split('/')
+    for index, part in enumerate(pattern_parts):
+        if part == '#':
+            return True
+        if index >= len(topic_parts):
+            return False
+        if part != '+' and part != topic_parts[index]:
+            return False
+    return len(pattern_parts) == len(topic_parts)
+
+
+class LoopbackBroker(object):
+    """A tiny in-process broker with retained messages and wildcards."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.retained = {}
+        self.subscriptions = []  # (pattern, client)
+
+    def client(self, client_id=''):
+        return LoopbackClient(self, client_id)
+
+    def publish(self, topic, payload, retain):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        with self.lock:
+            if retain:
+                if payload:
+                    self.retained[topic] = payload
+                else:
+                    self.retained.pop(topic, None)
+            targets = [client for pattern, client in self.subscriptions if topic_matches(pattern, topic)]
+        for client in targets:
+            client._deliver(LoopbackMessage(topic, payload, False))
+
+    def subscribe(self, client, pattern):
+        with self.lock:
+            self.subscriptions.append((pattern, client))
+            retained = [(topic, payload) for topic, payload in self.retained.items()
+                        if topic_matches(pattern, topic)]
+        for topic, payload in retained:
+            client._deliver(LoopbackMessage(topic, payload, True))
+
+    def drop(self, client):
+        with self.lock:
+            self.subscriptions = [(p, c) for p, c in self.subscriptions if c is not client]
+
+
+class LoopbackClient(object):
+    """Implements the subset of the paho client API used by `MQTTBridge`."""
+
+    def __init__(self, broker, client_id=''):
+        self.broker = broker
+        self.client_id = client_id
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self.connected = False
+        self._will = None
+
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def will_set(self, topic, payload=None, qos=0, retain=False):
+        self._will = (topic, payload, retain)
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        pass
+
+    def connect_async(self, host, port=1883, keepalive=60):
+        pass
+
+    def loop_start(self):
+        self.connected = True
+        if self.on_connect:
+            self.on_connect(self, None, {}, 0)
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        self.connected = False
+        self.broker.drop(self)
+        if self.on_disconnect:
+            self.on_disconnect(self, None, 0)
+
+    def crash(self):
+        """Simulate an unclean disconnect (the broker publishes the will)."""
+        self.connected = False
+        self.broker.drop(self)
+        if self._will:
+            self.broker.publish(*self._will)
+
+    def is_connected(self):
+        return self.connected
+
+    def subscribe(self, topic, qos=0):
+        self.broker.subscribe(self, topic)
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        if not self.connected:
+            raise ConnectionError("not connected")
+        self.broker.publish(topic, payload or b'', retain)
+
+    def _deliver(self, message):
+        if self.on_message:
+            self.on_message(self, None, message)
+
+
+# ---------------------------------------------------------
+# Bridge
+# ---------------------------------------------------------
+
+def create_client(client_id):
+    """Create a paho client for either the 1.x or the 2.x callback API."""
+    try:
+        return paho_mqtt.Client(paho_mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+    except AttributeError:
+        return paho_mqtt.Client(client_id=client_id)
+
+
+class MQTTBridge(object):
+    """Maps MQTT command topics onto relay actions and publishes state.
+
+    Args:
+        client: A paho ``Client`` or a `LoopbackClient`.
+        num_relays (int): Number of relays on the board.
+        handlers (dict): Callables for ``on``, ``off`` and ``toggle`` (taking
+            a relay number), ``all`` (taking True/False) and ``scene``
+            (taking a scene name, returning False if it is unknown).
+    """
+
+    def __init__(self, client, num_relays, handlers, prefix=DEFAULT_PREFIX,
+                 batch_window=BATCH_WINDOW, queue_size=QUEUE_SIZE):
+        self.client = client
+        self.num_relays = num_relays
+        self.handlers = handlers
+        self.prefix = prefix.rstrip('/')
+        self.batch_window = batch_window
+
+        self.outbound = queue.Queue(maxsize=queue_size)
+        self.commands = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.published = 0
+        self.version = 0
+
+        self._state_lock = threading.Lock()
+        self._state_event = threading.Event()
+        self._pending_mask = None
+        self._published_mask = None   # None forces a full resync
+        self._resync = threading.Event()
+        self._connected = threading.Event()
+
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_message = self._on_message
+        client.will_set(self.topic('availability'), 'offline', qos=1, retain=True)
+
+    def topic(self, *parts):
+        return '/'.join((self.prefix,) + tuple(str(part) for part in parts))
+
+    # -- lifecycle -----------------------------------------------------
+
+    def start(self, host=None, port=1883, keepalive=30):
+        for target, name in ((self._publisher, 'mqtt-batcher'),
+                             (self._sender, 'mqtt-sender'),
+                             (self._executor, 'mqtt-commands')):
+            threading.Thread(target=target, name=name, daemon=True).start()
+        if host:
+            self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+            self.client.connect_async(host, port, keepalive)
+        self.client.loop_start()
+
+    def stop(self):
+        try:
+            self.client.publish(self.topic('availability'), 'offline', qos=1, retain=True)
+            self.client.disconnect()
+        finally:
+            self.client.loop_stop()
+
+    # -- paho callbacks --------------------------------------------------
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        failed = rc.is_failure if hasattr(rc, 'is_failure') else rc != 0
+        if failed:
+            print(f"MQTT connection refused: {rc}")
+            return
+        print("MQTT connected")
+        client.subscribe(self.topic('relay', '+', 'set'), qos=1)
+        client.subscribe(self.topic('all', 'set'), qos=1)
+        client.subscribe(self.topic('scene', 'set'), qos=1)
+        self._connected.set()
+        self._enqueue(self.topic('availability'), 'online')
+        # Retained topics may be stale after an outage: republish everything
+        self._resync.set()
+        self._state_event.set()
+
+    def _on_disconnect(self, client, userdata, *args):
+        self._connected.clear()
+        print("MQTT disconnected, will reconnect automatically")
+
+    def _on_message(self, client, userdata, message):
+        # Never block the network loop: relay actions run on the command thread
+        try:
+            self.commands.put_nowait((message.topic, bytes(message.payload)))
+        except queue.Full:
+            print(f"MQTT command queue full, dropping command on {message.topic}")
+
+    # -- commands -------------------------------------------------------
+
+    def _executor(self):
+        while True:
+            topic, payload = self.commands.get()
+            try:
+                self.handle_command(topic, payload.decode(errors='replace').strip())
+            except Exception as e:
+                print(f"MQTT command on {topic} failed: {e}")
+
+    def handle_command(self, topic, payload):
+        """Dispatch one command message; returns False if it was rejected."""
+        parts = topic[len(self.prefix) + 1:].split('/')
+        command = payload.upper()
+        if len(parts) == 3 and parts[0] == 'relay' and parts[2] == 'set':
+            try:
+                relay_num = int(parts[1])
+            except ValueError:
+                return False
+            if not 0 < relay_num <= self.num_relays:
+                return False
+            if command in ('ON', '1', 'TRUE'):
+                self.handlers['on'](relay_num)
+            elif command in ('OFF', '0', 'FALSE'):
+                self.handlers['off'](relay_num)
+            elif command == 'TOGGLE':
+                self.handlers['toggle'](relay_num)
+            else:
+                return False
+            return True
+        if parts == ['all', 'set'] and command in ('ON', 'OFF'):
+            self.handlers['all'](command == 'ON')
+            return True
+        if parts == ['scene', 'set']:
+            return self.handlers['scene'](payload) is not False
+        return False
+
+    # -- state publishing ------------------------------------------------
+
+    def on_state_change(self, mask):
+        """relay_lib state listener: remember the latest mask and wake the batcher."""
+        with self._state_lock:
+            self._pending_mask = mask
+        self._state_event.set()
+
+    def _publisher(self):
+        while True:
+            self._state_event.wait()
+            time.sleep(self.batch_window)  # collect the rest of the burst
+            self._state_event.clear()
+            with self._state_lock:
+                mask = self._pending_mask
+            if mask is None or not self._connected.is_set():
+                continue
+            if self._resync.is_set():
+                self._resync.clear()
+                self._published_mask = None
+            self._publish_state(mask)
+
+    def _publish_state(self, mask):
+        if self._published_mask is None:
+            changed = relay_mask.full(self.num_relays)
+        else:
+            changed = relay_mask.diff(self._published_mask, mask)
+        if not changed:
+            return
+        self.version += 1
+        ok = self._enqueue(self.topic('state'), json.dumps({
+            'mask': relay_mask.to_hex(mask, self.num_relays),
+            'on': relay_mask.to_relays(mask),
+            'version': self.version,
+        }))
+        for relay_num in relay_mask.to_relays(changed):
+            ok = self._enqueue(self.topic('relay', relay_num),
+                               'ON' if relay_mask.is_set(mask, relay_num) else 'OFF') and ok
+        self._published_mask = mask if ok else None
+
+    def _enqueue(self, topic, payload):
+        try:
+            self.outbound.put_nowait((topic, payload))
+            return True
+        except queue.Full:
+            # Backpressure: drop and resend the complete state later
+            self.dropped += 1
+            self._resync.set()
+            return False
+
+    def _sender(self):
+        while True:
+            topic, payload = self.outbound.get()
+            while True:
+                self._connected.wait()
+                try:
+                    info = self.client.publish(topic, payload, qos=1, retain=True)
+                    if getattr(info, 'rc', 0):
+                        raise ConnectionError(f"rc={info.rc}")
+                    self.published += 1
+                    break
+                except Exception as e:
+                    print(f"MQTT publish to {topic} failed: {e}")
+                    time.sleep(1)
+            if self.outbound.empty() and self._resync.is_set():
+                self._state_event.set()
+
+    def metrics(self):
+        return {
+            'connected': self._connected.is_set(),
+            'outbound_queue': self.outbound.qsize(),
+            'command_queue': self.commands.qsize(),
+            'published': self.published,
+            'dropped': self.dropped,
+        }
+
+
+def bridge_from_env(num_relays, handlers):
+    """Create and start a bridge from the ``MQTT_*`` environment variables.
+
+    Returns None when ``MQTT_HOST`` is not set or paho-mqtt is missing.
+    """
+    host = os.environ.get('MQTT_HOST')
+    if not host:
+        return None
+    prefix = os.environ.get('MQTT_PREFIX', DEFAULT_PREFIX)
+    batch_window = float(os.environ.get('MQTT_BATCH_WINDOW', BATCH_WINDOW))
+    queue_size = int(os.environ.get('MQTT_QUEUE_SIZE', QUEUE_SIZE))
+
+    if host == 'loopback':
+        client = LoopbackBroker().client('relay_controller')
+        bridge = MQTTBridge(client, num_relays, handlers, prefix, batch_window, queue_size)
+        bridge.start()
+        return bridge
+
+    if not MQTT_AVAILABLE:
+        print("MQTT_HOST is set but paho-mqtt is not installed; MQTT bridge disabled")
+        return None
+    client = create_client(os.environ.get('MQTT_CLIENT_ID', 'relay_controller'))
+    if os.environ.get('MQTT_USERNAME'):
+        client.username_pw_set(os.environ['MQTT_USERNAME'], os.environ.get('MQTT_PASSWORD'))
+    bridge = MQTTBridge(client, num_relays, handlers, prefix, batch_window, queue_size)
+    bridge.start(host, int(os.environ.get('MQTT_PORT', 1883)))
+    print(f"MQTT bridge connecting to {host}")
+    return bridge
@@ -0,0 +1,253 @@
+"""Dependency-aware power sequencing for the relay board.
+
+Each channel in ``channels.json`` may declare which other channels must be
+powered (and ready) before it is switched on:
+
+    {
+        "channel": 1,
+        "name": "Focus Controller",
+        "depends_on": [6],
+        "delay": 2.0,
+        "ready": {"type": "tcp", "host": "127.0.0.1", "port": 7624, "timeout": 30}
+    }
+
+``depends_on`` lists channel numbers, ``delay`` is the minimum number of
+seconds to wait after the last dependency became ready, and the optional
+``ready`` check decides when a channel counts as ready once it is powered
+(supported types: ``tcp``, ``path`` and ``command``; a command is an argv
+list such as ``["ping", "-c", "1", "ccd.local"]`` and runs without a shell).
+Channels without a ``ready`` check are ready as soon as they are switched.
+
+The sequencer orders the graph topologically and switches every channel
+whose dependencies are satisfied at the same moment with one bulk write, so
+a full power-up takes the critical path time rather than one `DELAY_TIME`
+step per relay.
+"""
+
+import os
+import shlex
+import socket
+import subprocess
+import time
+
+# How often pending readiness checks are polled while a sequence runs
+POLL_INTERVAL = 0.1
+# Default number of seconds a readiness check may take before giving up
+READY_TIMEOUT = 30.0
+
+
+class SequenceError(ValueError):
+    """Raised when the dependency graph is invalid or a sequence cannot finish.
+
+    Attributes:
+        history (list): The bulk writes done before the sequence stopped,
+            as returned by `run_sequence` (empty if nothing was switched).
+    """
+
+    def __init__(self, message, history=None):
+        super().__init__(message)
+        self.history = history or []
+
+
+def build_graph(channels):
+    """Build the dependency graph for the active channels.
+
+    Args:
+        channels (list): The ``channels`` list from ``channels.json``.
+
+    Returns:
+        dict: Maps channel number to a dict with ``depends_on``, ``delay``
+        and ``ready`` keys.
+    """
+    known = {channel['channel'] for channel in channels}
+    active = {channel['channel'] for channel in channels if channel.get('active') == 'true'}
+
+    graph = {}
+    for channel in channels:
+        number = channel['channel']
+        if number not in active:
+            continue
+        depends_on = []
+        for dependency in channel.get('depends_on', []):
+            if dependency not in known:
+                raise SequenceError(f"Channel {number} depends on unknown channel {dependency}")
+            if dependency == number:
+                raise SequenceError(f"Channel {number} depends on itself")
+            if dependency not in active:
+                print(f"Channel {number}: ignoring dependency on inactive channel {dependency}")
+                continue
+            depends_on.append(dependency)
+        delay = float(channel.get('delay', 0))
+        if delay < 0:
+            raise SequenceError(f"Channel {number} has a negative delay")
+        graph[number] = {
+            'depends_on': depends_on,
+            'delay': delay,
+            'ready': channel.get('ready'),
+        }
+    return graph
+
+
+def topological_order(graph):
+    """Return the channels in dependency order.
+
+    Raises:
+        SequenceError: If the graph contains a cycle.
+    """
+    remaining = {number: len(node['depends_on']) for number, node in graph.items()}
+    dependents = {number: [] for number in graph}
+    for number, node in graph.items():
+        for dependency in node['depends_on']:
+            dependents[dependency].append(number)
+
+    frontier = sorted(number for number, count in remaining.items() if count == 0)
+    order = []
+    while frontier:
+        number = frontier.pop(0)
+        order.append(number)
+        for dependent in dependents[number]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                frontier.append(dependent)
+        frontier.sort()
+
+    if len(order) != len(graph):
+        cycle = sorted(number for number in graph if number not in order)
+        raise SequenceError(f"Dependency cycle between channels {cycle}")
+    return order
+
+
+def build_plan(channels):
+    """Compute the power-up plan without touching any hardware.
+
+    Readiness checks are assumed to pass instantly, so the times in the plan
+    are the earliest possible ones.
+
+    Returns:
+        dict: ``steps`` (a list of ``{"at": seconds, "relays": [...]}``
+        bulk writes), ``order`` and ``total_time`` (the critical path).
+    """
+    graph = build_graph(channels)
+    order = topological_order(graph)
+
+    start = {}
+    for number in order:
+        node = graph[number]
+        earliest = max((start[dependency] for dependency in node['depends_on']), default=0.0)
+        start[number] = earliest + node['delay']
+
+    steps = {}
+    for number in order:
+        steps.setdefault(round(start[number], 6), []).append(number)
+
+    return {
+        'order': order,
+        'steps': [{'at': at, 'relays': sorted(relays),
+                   'ready_checks': sorted(r for r in relays if graph[r]['ready'])}
+                  for at, relays in sorted(steps.items())],
+        'total_time': max(start.values(), default=0.0),
+    }
+
+
+def check_ready(check):
+    """Run a single readiness check once and return True if it passed."""
+    check_type = check.get('type')
+    try:
+        if check_type == 'tcp':
+            with socket.create_connection((check['host'], int(check['port'])),
+                                          timeout=check.get('connect_timeout', 0.5)):
+                return True
+        elif check_type == 'path':
+            return os.path.exists(check['path'])
+        elif check_type == 'command':
+            argv = check['command']
+            if isinstance(argv, str):
+                argv = shlex.split(argv)
+            result = subprocess.run(argv, capture_output=True,
+                                    timeout=check.get('command_timeout', 5))
+            return result.returncode == 0
+        else:
+            raise SequenceError(f"Unknown readiness check type: {check_type}")
+    except SequenceError:
+        raise
+    except Exception:
+        return False
+    return False
+
+
+def run_sequence(channels, write, clock=time.monotonic, sleep=time.sleep):
+    """Power up the active channels in dependency order.
+
+    Every channel that becomes due at the same moment is switched by a
+    single call to ``write``.
+
+    Args:
+        channels (list): The ``channels`` list from ``channels.json``.
+        write (callable): Called with a list of relay numbers to switch on.
+
+    Returns:
+        list: ``(elapsed_seconds, [relays])`` for every bulk write performed.
+
+    Raises:
+        SequenceError: If the graph is invalid, a readiness check times out
+            or ``write`` refuses a step with a ValueError (e.g. an interlock).
+            Its ``history`` lists the channels already switched on.
+    """
+    graph = build_graph(channels)
+    topological_order(graph)  # validate before switching anything
+
+    started = clock()
+    waiting = set(graph)
+    pending_ready = {}   # channel -> time it was switched on
+    ready_at = {}        # channel -> time it became ready
+    history = []
+
+    while waiting or pending_ready:
+        now = clock() - started
+
+        for number, switched_at in list(pending_ready.items()):
+            check = graph[number]['ready']
+            if check_ready(check):
+                print(f"Channel {number} is ready")
+                ready_at[number] = now
+                del pending_ready[number]
+            elif now - switched_at > float(check.get('timeout', READY_TIMEOUT)):
+                raise SequenceError(f"Channel {number} did not become ready within "
+                                    f"{check.get('timeout', READY_TIMEOUT)}s", history)
+
+        due = []
+        next_due = None
+        for number in sorted(waiting):
+            node = graph[number]
+            if not all(dependency in ready_at for dependency in node['depends_on']):
+                continue
+            earliest = max((ready_at[d] for d in node['depends_on']), default=0.0) + node['delay']
+            if earliest <= now:
+                due.append(number)
+            elif next_due is None or earliest < next_due:
+                next_due = earliest
+
+        if due:
+            print(f"Sequencer: switching {due} at +{now:.3f}s")
+            try:
+                write(due)
+            except ValueError as e:
+                raise SequenceError(f"Switching {due} was refused: {e}", history) from e
+            history.append((now, due))
+            for number in due:
+                waiting.discard(number)
+                if graph[number]['ready']:
+                    pending_ready[number] = now
+                else:
+                    ready_at[number] = now
+            continue
+
+        if not pending_ready and next_due is None:
+            # Nothing can make progress any more
+            break
+        wait = POLL_INTERVAL if next_due is None else max(0.0, min(next_due - now, POLL_INTERVAL))
+        if pending_ready:
+            wait = min(wait, POLL_INTERVAL)
+        sleep(wait)
+
+    return history
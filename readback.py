@@ -0,0 +1,225 @@
+"""Read-back verification of commanded relay states.
+
+Every relay write marks the relays it changed.  After a short settle time
+the verifier reads all marked lines back with one bulk read (one
+``get_values()`` ioctl with gpiod), however many writes happened in the
+meantime, and compares them with the commanded state:
+
+* a match marks the line ``ok``;
+* a mismatch re-issues the write for the mismatched relays and checks them
+  again after `BACKOFF` seconds, up to ``len(BACKOFF)`` times;
+* when the retries run out the line is marked ``failed`` and the relay
+  state is corrected to what the hardware reports, so the dashboard stops
+  showing a relay ON that never switched.
+
+Sweeps run through the command queue (``submit``) so they never interleave
+with a write.
+"""
+
+import threading
+import time
+
+import relay_mask
+
+# Wait this long after a write before reading back; writes inside the
+# window are verified by the same sweep
+SETTLE = 0.05
+# Delay before each re-check of a mismatched line; bounded by its length
+BACKOFF = (0.1, 0.3, 1.0)
+
+
+class LineHealth(object):
+    __slots__ = ('state', 'checks', 'mismatches', 'retries', 'last_checked', 'last_mismatch')
+
+    def __init__(self):
+        self.state = 'unverified'   # unverified, pending, ok, retrying, failed
+        self.checks = 0
+        self.mismatches = 0
+        self.retries = 0
+        self.last_checked = None
+        self.last_mismatch = None
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class ReadbackVerifier(object):
+    """Coalesces read-back checks of recently written relays into sweeps.
+
+    Args:
+        num_relays (int): Number of relays.
+        read_mask (callable): ``read_mask(relays)`` returns the ON bitmask of
+            the relays in ``relays`` from one hardware read, or None when the
+            hardware cannot be read back.
+        expected_mask (callable): Returns the commanded state bitmask.
+        rewrite (callable): ``rewrite(on_mask, off_mask)`` re-issues a write.
+        adopt (callable): ``adopt(relays, actual)`` records the read-back
+            state of relays that could not be switched.
+        submit (callable): Runs ``func`` on the hardware writer; defaults to
+            calling it directly.
+        initial_mask (int): The state when the verifier starts listening.
+    """
+
+    def __init__(self, num_relays, read_mask, expected_mask, rewrite, adopt,
+                 submit=None, initial_mask=0, settle=SETTLE, backoff=BACKOFF,
+                 clock=time.monotonic):
+        self.num_relays = num_relays
+        self.read_mask = read_mask
+        self.expected_mask = expected_mask
+        self.rewrite = rewrite
+        self.adopt = adopt
+        self.submit = submit or (lambda func: func())
+        self.settle = settle
+        self.backoff = tuple(backoff)
+        self.clock = clock
+        self.health = {}
+        self._last_mask = initial_mask
+        self._due = {}            # relay -> monotonic time of its next check
+        self._adopting = False
+        self._cond = threading.Condition()
+        self.stats = {'writes': 0, 'sweeps': 0, 'lines_checked': 0, 'mismatches': 0,
+                      'rewrites': 0, 'read_errors': 0, 'failed': 0}
+
+    # -- producers ---------------------------------------------------------
+
+    def on_state_change(self, mask):
+        """State listener: verify every relay whose commanded state changed"""
+        changed = mask ^ self._last_mask
+        self._last_mask = mask
+        if changed and not self._adopting:
+            self.touch(changed)
+
+    def touch(self, relays):
+        """Schedule a check of ``relays`` (a bitmask) after the settle time"""
+        due = self.clock() + self.settle
+        with self._cond:
+            self.stats['writes'] += 1
+            for relay in relay_mask.to_relays(relays):
+                health = self.health.get(relay)
+                if health is None:
+                    health = self.health[relay] = LineHealth()
+                # A new command starts a new round of retries
+                health.state = 'pending'
+                health.retries = 0
+                # Keep an earlier deadline so a burst of writes shares one sweep
+                self._due[relay] = min(self._due.get(relay, due), due)
+            self._cond.notify()
+
+    # -- sweeps ------------------------------------------------------------
+
+    def start(self):
+        thread = threading.Thread(target=self._run, name='readback-verifier', daemon=True)
+        thread.start()
+        return thread
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._due:
+                    self._cond.wait()
+                wait = min(self._due.values()) - self.clock()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                # Everything due within the next settle window joins this sweep
+                horizon = self.clock() + self.settle
+                relays = [relay for relay, due in self._due.items() if due <= horizon]
+                for relay in relays:
+                    del self._due[relay]
+            mask = relay_mask.from_relays(relays)
+            try:
+                self.submit(lambda: self.sweep(mask))
+            except Exception as e:
+                # e.g. the command queue is full: try again shortly
+                print(f"Read-back sweep postponed: {e}")
+                self._reschedule(mask, self.backoff[0] if self.backoff else self.settle)
+
+    def _reschedule(self, relays, delay):
+        due = self.clock() + delay
+        with self._cond:
+            for relay in relay_mask.to_relays(relays):
+                self._due[relay] = min(self._due.get(relay, due), due)
+            self._cond.notify()
+
+    def sweep(self, relays):
+        """Read ``relays`` back once and act on mismatches (runs on the writer)"""
+        now = self.clock()
+        expected = self.expected_mask() & relays
+        try:
+            actual = self.read_mask(relays)
+        except Exception as e:
+            print(f"Read-back of relays {relay_mask.to_relays(relays)} failed: {e}")
+            actual = e
+        if actual is None:
+            # Nothing to read back (mock mode)
+            return
+
+        retry = 0
+        rewrite = 0
+        give_up = 0
+        with self._cond:
+            self.stats['sweeps'] += 1
+            self.stats['lines_checked'] += relay_mask.popcount(relays)
+            read_failed = isinstance(actual, Exception)
+            if read_failed:
+                self.stats['read_errors'] += 1
+                bad = relays
+            else:
+                bad = (expected ^ actual) & relays
+            for relay in relay_mask.to_relays(relays):
+                health = self.health.setdefault(relay, LineHealth())
+                health.checks += 1
+                health.last_checked = now
+                if not relay_mask.is_set(bad, relay):
+                    health.state = 'ok'
+                    health.retries = 0
+                    continue
+                if not read_failed:
+                    health.mismatches += 1
+                    health.last_mismatch = now
+                    self.stats['mismatches'] += 1
+                if health.retries < len(self.backoff):
+                    delay = self.backoff[health.retries]
+                    health.retries += 1
+                    health.state = 'retrying'
+                    self._due[relay] = now + delay
+                    retry |= relay_mask.bit(relay)
+                else:
+                    health.state = 'failed'
+                    self.stats['failed'] += 1
+                    give_up |= relay_mask.bit(relay)
+            if not read_failed:
+                rewrite = bad & retry
+                if rewrite:
+                    self.stats['rewrites'] += 1
+            self._cond.notify()
+
+        if rewrite:
+            print(f"Relays {relay_mask.to_relays(rewrite)} did not read back as commanded, rewriting")
+            self.rewrite(expected & rewrite, ~expected & rewrite)
+        if give_up and not isinstance(actual, Exception):
+            self._adopting = True
+            try:
+                self.adopt(give_up, actual)
+            finally:
+                self._adopting = False
+
+    # -- reporting ---------------------------------------------------------
+
+    def failed(self):
+        with self._cond:
+            return sorted(relay for relay, health in self.health.items() if health.state == 'failed')
+
+    def snapshot(self):
+        with self._cond:
+            lines = {relay: health.as_dict() for relay, health in sorted(self.health.items())}
+            stats = dict(self.stats)
+        counts = {}
+        for line in lines.values():
+            counts[line['state']] = counts.get(line['state'], 0) + 1
+        return {
+            'counts': counts,
+            'failed': [relay for relay, line in lines.items() if line['state'] == 'failed'],
+            'stats': stats,
+            'lines': lines,
+        }
@@ -10,14 +10,26 @@
 
 from __future__ import print_function
 
+import os
+import threading
 import time
 
+import relay_mask
+
+# RELAY_GPIO_BACKEND=sim swaps in the simulated gpiochip (see gpio_sim), which
+# has the same interface as gpiod, so the gpiod code paths run off-hardware
+GPIO_BACKEND = os.environ.get('RELAY_GPIO_BACKEND', '')
+
 # Try to import gpiod for Raspberry Pi 5 compatibility
 try:
-    import gpiod
+    if GPIO_BACKEND == "sim":
+        import gpio_sim as gpiod
+        print("Using simulated gpiochip (gpio_sim) for GPIO control")
+    else:
+        import gpiod
+        print("Using gpiod library for GPIO control")
     GPIO_AVAILABLE = True
     GPIO_LIBRARY = "gpiod"
-    print("Using gpiod library for GPIO control")
 except ImportError:
     try:
         from gpiozero import OutputDevice
@@ -43,11 +55,38 @@ except ImportError:
 # The number of relay ports on the relay board.
 # Updated to support 16 relays for Raspberry Pi 5
 NUM_RELAY_PORTS = 16
+if GPIO_BACKEND == "sim":
+    NUM_RELAY_PORTS = int(os.environ.get('RELAY_SIM_RELAYS', NUM_RELAY_PORTS))
 RELAY_PORTS = ()
-RELAY_STATUS = NUM_RELAY_PORTS * [0]
+RELAY_MASK = 0      # Relay state bitmask, bit n set = relay n+1 ON (see relay_mask)
+MASK_LOCK = threading.RLock()  # Held for every read-modify-write of RELAY_MASK
 RELAY_DEVICES = []  # For gpiozero OutputDevice objects
 GPIO_CHIP = None    # For gpiod chip object
 GPIO_LINES = []     # For gpiod line objects
+STATE_LISTENERS = []  # Callables notified with RELAY_MASK after every change
+LAST_HW_READ = None   # time.monotonic() of the last successful GPIO read-back
+INTERLOCKS = None     # interlock.Interlocks checked before relays are switched on
+
+def add_state_listener(listener):
+    """Register a callable that receives RELAY_MASK whenever it changes"""
+    STATE_LISTENERS.append(listener)
+
+def _notify_state_change():
+    for listener in list(STATE_LISTENERS):
+        try:
+            listener(RELAY_MASK)
+        except Exception as e:
+            print(f"Error in relay state listener: {e}")
+
+def set_interlocks(interlocks):
+    """Install the compiled interlock rules checked before every write"""
+    global INTERLOCKS
+    INTERLOCKS = interlocks
+
+def _check_interlocks(on_mask, off_mask=0):
+    """Raise interlock.InterlockError before a write that would break a rule"""
+    if INTERLOCKS is not None:
+        INTERLOCKS.check(RELAY_MASK, on_mask, off_mask)
 
 def cleanup_gpio():
     """Clean up GPIO resources"""
@@ -80,11 +119,12 @@ def cleanup_gpio():
 import atexit
 import signal
 import json
-import os
 atexit.register(cleanup_gpio)
 
+# Installation directory, overridable so the server can run off the Pi (e.g. on CI)
+RELAY_CONTROLLER_DIR = os.environ.get('RELAY_CONTROLLER_DIR', '/home/pi/pi-relay-controller-modmypi2025')
 # File to store relay states
-RELAY_STATE_FILE = '/home/pi/pi-relay-controller-modmypi2025/relay_states.json'
+RELAY_STATE_FILE = os.path.join(RELAY_CONTROLLER_DIR, 'relay_states.json')
 
 # Also handle signals for proper cleanup
 def signal_handler(signum, frame):
@@ -96,29 +136,23 @@ signal.signal(signal.SIGINT, signal_handler)
 signal.signal(signal.SIGTERM, signal_handler)
 
 def sync_relay_status_with_gpio():
-    """Sync the RELAY_STATUS array with actual GPIO pin states"""
-    global RELAY_STATUS
+    """Sync RELAY_MASK with actual GPIO pin states"""
+    global RELAY_MASK
     try:
         if GPIO_LIBRARY == "gpiod" and len(GPIO_LINES) > 0:
             line_request = GPIO_LINES[0]
             if line_request:
                 print("Syncing relay status with actual GPIO states...")
-                for i, gpio_pin in enumerate(RELAY_PORTS):
-                    try:
-                        # Read current GPIO value
-                        current_value = line_request.get_value(gpio_pin)
-                        # Convert GPIO value to relay status (remember: active low)
-                        # INACTIVE (0) = Relay ON, ACTIVE (1) = Relay OFF
-                        if current_value == gpiod.line.Value.INACTIVE:
-                            RELAY_STATUS[i] = ON_STATE  # Relay is ON
-                        else:
-                            RELAY_STATUS[i] = OFF_STATE  # Relay is OFF
-                        print(f"GPIO {gpio_pin} (Relay {i+1}): {current_value} -> Status: {RELAY_STATUS[i]}")
-                    except Exception as e:
-                        print(f"Could not read GPIO {gpio_pin}: {e}")
-                        # Keep default status if can't read
-                        pass
+                # Read every line with a single request
+                values = line_request.get_values(list(RELAY_PORTS))
+                # Convert GPIO values to relay status (remember: active low)
+                # INACTIVE (0) = Relay ON, ACTIVE (1) = Relay OFF
+                with MASK_LOCK:
+                    RELAY_MASK = relay_mask.from_list(value == gpiod.line.Value.INACTIVE for value in values)
+                _mark_hw_read()
+                print(f"Relays ON: {relay_mask.to_relays(RELAY_MASK)}")
                 print("Relay status sync completed")
+                _notify_state_change()
         else:
             print("GPIO not available for status sync")
     except Exception as e:
@@ -132,6 +166,7 @@ def get_relay_actual_status(relay_num):
             if line_request and 0 < relay_num <= len(RELAY_PORTS):
                 gpio_pin = RELAY_PORTS[relay_num - 1]
                 current_value = line_request.get_value(gpio_pin)
+                _mark_hw_read()
                 # Convert GPIO value to relay status (active low)
                 if current_value == gpiod.line.Value.INACTIVE:
                     return ON_STATE  # Relay is ON
@@ -141,73 +176,187 @@ def get_relay_actual_status(relay_num):
         print(f"Error reading actual status for relay {relay_num}: {e}")
 
     # Fallback to stored status
-    return RELAY_STATUS[relay_num - 1] if 0 < relay_num <= len(RELAY_STATUS) else OFF_STATE
+    if 0 < relay_num <= NUM_RELAY_PORTS and relay_mask.is_set(RELAY_MASK, relay_num):
+        return ON_STATE
+    return OFF_STATE
+
+def relay_read_mask(relays=None):
+    """Read relays back from the hardware, with one call for gpiod
+
+    Args:
+        relays (int): Bitmask of the relays to read (default: all of them).
+
+    Returns:
+        int: Bitmask of the read relays that are actually ON, or None when
+        the library cannot read its lines back (mock mode).
+    """
+    if relays is None:
+        relays = relay_mask.full(len(RELAY_PORTS))
+    numbers = [n for n in relay_mask.to_relays(relays) if n <= len(RELAY_PORTS)]
+    if GPIO_LIBRARY == "gpiod" and GPIO_LINES and GPIO_LINES[0]:
+        values = GPIO_LINES[0].get_values([RELAY_PORTS[n - 1] for n in numbers])
+        on = [n for n, value in zip(numbers, values) if value == gpiod.line.Value.INACTIVE]
+    elif GPIO_LIBRARY == "gpiozero" and RELAY_DEVICES:
+        on = [n for n in numbers
+              if len(RELAY_DEVICES) >= n and RELAY_DEVICES[n - 1] and RELAY_DEVICES[n - 1].value]
+    elif GPIO_LIBRARY == "RPi.GPIO" and RELAY_PORTS:
+        on = [n for n in numbers if GPIO.input(RELAY_PORTS[n - 1]) == ON_STATE]
+    else:
+        return None
+    _mark_hw_read()
+    return relay_mask.from_relays(on)
+
+def relay_adopt_hardware_state(relays, actual):
+    """Record the read-back state of ``relays`` once retrying a write gave up
+
+    Args:
+        relays (int): Bitmask of the relays to update.
+        actual (int): Read-back bitmask; only the bits in ``relays`` are used.
+    """
+    global RELAY_MASK
+    with MASK_LOCK:
+        new_mask = (RELAY_MASK & ~relays) | (actual & relays)
+        changed = new_mask != RELAY_MASK
+        RELAY_MASK = new_mask
+    if changed:
+        print(f"Relays {relay_mask.to_relays(relays)} did not switch, recording actual state")
+        save_relay_states()
+        _notify_state_change()
+
+def _mark_hw_read():
+    global LAST_HW_READ
+    LAST_HW_READ = time.monotonic()
+
+def gpio_backend_ready():
+    """Return True once the selected GPIO library has claimed its lines"""
+    if GPIO_LIBRARY == "gpiod":
+        return bool(GPIO_LINES and GPIO_LINES[0])
+    if GPIO_LIBRARY == "gpiozero":
+        return any(RELAY_DEVICES)
+    if GPIO_LIBRARY == "RPi.GPIO":
+        return bool(RELAY_PORTS)
+    return True  # simulation mode has nothing to initialize
+
+# Write-behind persistence: once start_state_saver() has been called,
+# save_relay_states() only marks the state dirty and a background thread
+# writes the latest mask, so bursts of changes cost one file write
+_SAVE_PENDING = 0
+_SAVE_CONDITION = threading.Condition()
+_SAVER_THREAD = None
+
+def start_state_saver(interval=0.5):
+    """Start the background thread that persists relay states"""
+    global _SAVER_THREAD
+    if _SAVER_THREAD is not None:
+        return
+
+    def run():
+        global _SAVE_PENDING
+        while True:
+            with _SAVE_CONDITION:
+                while not _SAVE_PENDING:
+                    _SAVE_CONDITION.wait()
+            time.sleep(interval)  # let a burst of changes settle
+            with _SAVE_CONDITION:
+                _SAVE_PENDING = 0
+            _write_relay_states()
+
+    _SAVER_THREAD = threading.Thread(target=run, name='relay-state-saver', daemon=True)
+    _SAVER_THREAD.start()
+    atexit.register(flush_relay_states)
+
+def flush_relay_states():
+    """Write any pending relay state change immediately"""
+    global _SAVE_PENDING
+    with _SAVE_CONDITION:
+        pending = _SAVE_PENDING
+        _SAVE_PENDING = 0
+    if pending:
+        _write_relay_states()
+
+def persistence_queue_depth():
+    """Number of state changes not yet written to RELAY_STATE_FILE"""
+    return _SAVE_PENDING
 
 def save_relay_states():
-    """Save current relay states to file"""
+    """Save current relay states to file as a hex bitmask"""
+    global _SAVE_PENDING
+    if _SAVER_THREAD is not None:
+        with _SAVE_CONDITION:
+            _SAVE_PENDING += 1
+            _SAVE_CONDITION.notify()
+        return
+    _write_relay_states()
+
+def _write_relay_states():
     try:
-        states = {}
-        for i in range(NUM_RELAY_PORTS):
-            states[f"relay_{i+1}"] = RELAY_STATUS[i]
-
+        states = {
+            "count": NUM_RELAY_PORTS,
+            "mask": relay_mask.to_hex(RELAY_MASK, NUM_RELAY_PORTS),
+        }
         with open(RELAY_STATE_FILE, 'w') as f:
-            json.dump(states, f, indent=2)
+            json.dump(states, f)
         print(f"Relay states saved to {RELAY_STATE_FILE}")
     except Exception as e:
         print(f"Error saving relay states: {e}")
 
 def load_relay_states():
-    """Load relay states from file"""
+    """Load relay states from file
+
+    Returns:
+        int: The saved relay bitmask, or None if nothing was saved.
+    """
     try:
         if os.path.exists(RELAY_STATE_FILE):
             with open(RELAY_STATE_FILE, 'r') as f:
                 states = json.load(f)
             print(f"Relay states loaded from {RELAY_STATE_FILE}")
-            return states
+            if "mask" in states:
+                return relay_mask.from_hex(states["mask"]) & relay_mask.full(NUM_RELAY_PORTS)
+            # Older files store one "relay_N" key per relay
+            return relay_mask.from_relays(
+                i + 1 for i in range(NUM_RELAY_PORTS) if states.get(f"relay_{i+1}") == ON_STATE)
         else:
             print("No saved relay states found")
-            return {}
+            return None
     except Exception as e:
         print(f"Error loading relay states: {e}")
-        return {}
+        return None
 
 def restore_relay_states():
     """Restore relay states from saved file"""
     try:
-        saved_states = load_relay_states()
-        if saved_states:
-            print("Restoring previous relay states...")
-            for i in range(NUM_RELAY_PORTS):
-                relay_key = f"relay_{i+1}"
-                if relay_key in saved_states:
-                    saved_state = saved_states[relay_key]
-                    if saved_state == ON_STATE:
-                        print(f"Restoring relay {i+1} to ON state")
-                        relay_on(i+1)
-                    else:
-                        print(f"Restoring relay {i+1} to OFF state")
-                        relay_off(i+1)
+        saved_mask = load_relay_states()
+        if saved_mask is not None:
+            print(f"Restoring previous relay states, ON: {relay_mask.to_relays(saved_mask)}")
+            relay_apply_mask(on_mask=saved_mask,
+                             off_mask=relay_mask.invert(saved_mask, NUM_RELAY_PORTS))
             print("Relay states restoration completed")
         else:
             print("No states to restore")
     except Exception as e:
         print(f"Error restoring relay states: {e}")
 
-def reset_gpio_pins():
-    """Reset GPIO pins if they are stuck"""
+def reset_gpio_pins(keep=False):
+    """Reset GPIO pins if they are stuck
+
+    Args:
+        keep (bool): Keep the recovered line request and return it.
+
+    Returns:
+        The live gpiod line request when ``keep`` is set and recovery
+        succeeded, otherwise None.
+    """
     try:
-        import subprocess
-        # Try to reset GPIO pins using gpioset
-        for pin in [10, 12, 13, 14, 15, 6, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26]:
-            try:
-                # Set pin to high (relay off for active-low relays)
-                subprocess.run(['gpioset', 'gpiochip0', f'{pin}=1'],
-                             timeout=1, capture_output=True)
-            except:
-                pass
+        from gpio_recovery import recover_lines, print_report
+        result = recover_lines(RELAY_PORTS or [10, 12, 13, 14, 15, 6, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26],
+                               keep=keep)
+        print_report(result)
         print("GPIO pins reset completed")
+        return result['request']
     except Exception as e:
         print(f"Could not reset GPIO pins: {e}")
+        return None
 
 # Some relay boards have a default on state with a low pin
 ON_STATE = 0
@@ -215,6 +364,9 @@ OFF_STATE = 1 - ON_STATE
 
 # Delay time between turning on next channels for `all_on` and `all_off` - for stability
 DELAY_TIME = 0.2
+# Called for the pauses inside multi-step operations; the server swaps in its
+# command queue's step_sleep so an emergency command can interrupt them
+STEP_SLEEP = time.sleep
 
 def board_to_bcm_pin(board_pin):
     """Convert board pin number to BCM pin number for gpiozero
@@ -241,6 +393,152 @@ def board_to_bcm_pin(board_pin):
 
     return None
 
+# ---------------------------------------------------------
+# Standalone backends
+#
+# Each backend drives its own set of lines independently of the library
+# selected at import time, so tooling such as `check_system.py --bench` can
+# compare them on the same box. All of them are active low and share one
+# small interface: write(index, on), write_mask(mask), read_mask(), close().
+# ---------------------------------------------------------
+
+class GpiodBackend(object):
+    name = "gpiod"
+
+    def __init__(self, ports, chip_path='/dev/gpiochip0'):
+        gpiod_lib = self._library()
+        self.ports = list(ports)
+        self._on = gpiod_lib.line.Value.INACTIVE
+        self._off = gpiod_lib.line.Value.ACTIVE
+        config = {port: gpiod_lib.LineSettings(direction=gpiod_lib.line.Direction.OUTPUT,
+                                               output_value=self._off)
+                  for port in self.ports}
+        self.request = gpiod_lib.request_lines(chip_path, consumer="relay_backend", config=config)
+
+    def write(self, index, on):
+        self.request.set_value(self.ports[index], self._on if on else self._off)
+
+    def write_mask(self, mask):
+        self.request.set_values({port: (self._on if mask >> i & 1 else self._off)
+                                 for i, port in enumerate(self.ports)})
+
+    def read_mask(self):
+        values = self.request.get_values(self.ports)
+        return relay_mask.from_list(value == self._on for value in values)
+
+    def close(self):
+        self.request.release()
+
+    @staticmethod
+    def _library():
+        import gpiod as gpiod_lib
+        return gpiod_lib
+
+
+class SimBackend(GpiodBackend):
+    """The gpiod backend on gpio_sim's virtual lines (latency/faults from RELAY_SIM_*)"""
+    name = "sim"
+
+    @staticmethod
+    def _library():
+        import gpio_sim
+        return gpio_sim
+
+
+class GpiozeroBackend(object):
+    name = "gpiozero"
+
+    def __init__(self, ports):
+        from gpiozero import OutputDevice as GpiozeroOutputDevice
+        self.devices = [GpiozeroOutputDevice(port, active_high=False) for port in ports]
+
+    def write(self, index, on):
+        if on:
+            self.devices[index].on()
+        else:
+            self.devices[index].off()
+
+    def write_mask(self, mask):
+        for i, device in enumerate(self.devices):
+            if mask >> i & 1:
+                device.on()
+            else:
+                device.off()
+
+    def read_mask(self):
+        return relay_mask.from_list(device.value for device in self.devices)
+
+    def close(self):
+        for device in self.devices:
+            device.close()
+
+
+class RPiGPIOBackend(object):
+    name = "RPi.GPIO"
+
+    def __init__(self, ports):
+        import RPi.GPIO as rpi_gpio
+        self.gpio = rpi_gpio
+        self.ports = list(ports)
+        if rpi_gpio.getmode() is None:
+            rpi_gpio.setmode(rpi_gpio.BCM)
+        for port in self.ports:
+            rpi_gpio.setup(port, rpi_gpio.OUT, initial=OFF_STATE)
+
+    def write(self, index, on):
+        self.gpio.output(self.ports[index], ON_STATE if on else OFF_STATE)
+
+    def write_mask(self, mask):
+        self.gpio.output(self.ports, [ON_STATE if mask >> i & 1 else OFF_STATE
+                                      for i in range(len(self.ports))])
+
+    def read_mask(self):
+        return relay_mask.from_list(self.gpio.input(port) == ON_STATE for port in self.ports)
+
+    def close(self):
+        self.gpio.cleanup(self.ports)
+
+
+class MockBackend(object):
+    """In-memory backend that never touches hardware"""
+    name = "mock"
+
+    def __init__(self, ports):
+        self.ports = list(ports)
+        self.mask = 0
+
+    def write(self, index, on):
+        if on:
+            self.mask |= 1 << index
+        else:
+            self.mask &= ~(1 << index)
+
+    def write_mask(self, mask):
+        self.mask = mask
+
+    def read_mask(self):
+        return self.mask
+
+    def close(self):
+        pass
+
+
+BACKENDS = {
+    "gpiod": GpiodBackend,
+    "gpiozero": GpiozeroBackend,
+    "RPi.GPIO": RPiGPIOBackend,
+    "mock": MockBackend,
+    "sim": SimBackend,
+}
+
+def open_backend(name, ports):
+    """Open one of the standalone BACKENDS on the given lines
+
+    Raises:
+        ImportError: If the library for that backend is not installed.
+    """
+    return BACKENDS[name](ports)
+
 def init_relay(port_list):
     """Initialize the module
 
@@ -290,29 +588,13 @@ def init_relay(port_list):
             except Exception as e:
                 print(f"Failed to initialize gpiod: {e}")
                 print("Attempting to reset GPIO pins...")
-                reset_gpio_pins()
-
-                # Try again after reset
-                try:
-                    time.sleep(1)  # Wait a bit
-                    config = {}
-                    for port in RELAY_PORTS:
-                        config[port] = gpiod.LineSettings(
-                            direction=gpiod.line.Direction.OUTPUT,
-                            output_value=gpiod.line.Value.ACTIVE
-                        )
-
-                    GPIO_LINES = [gpiod.request_lines(
-                        chip_path,
-                        consumer="relay_controller",
-                        config=config
-                    )]
-
-                    print(f"Successfully initialized {len(RELAY_PORTS)} GPIO lines after reset")
-
-                except Exception as e2:
-                    print(f"Failed to initialize gpiod even after reset: {e2}")
+                # Recovery claims all lines in one request and hands it back
+                line_request = reset_gpio_pins(keep=True)
+                if line_request is None:
+                    print("Failed to initialize gpiod even after reset")
                     raise
+                GPIO_LINES = [line_request]
+                print(f"Successfully initialized {len(RELAY_PORTS)} GPIO lines after reset")
         elif GPIO_LIBRARY == "gpiozero":
             # Use gpiozero fallback
             RELAY_DEVICES = []
@@ -351,6 +633,7 @@ def relay_on(relay_num):
     if isinstance(relay_num, int):
         # do we have a valid relay number?
         if 0 < relay_num <= NUM_RELAY_PORTS:
+            _check_interlocks(relay_mask.bit(relay_num))
             print('Turning relay', relay_num, 'ON')
             try:
                 if GPIO_LIBRARY == "gpiod" and len(GPIO_LINES) > 0:
@@ -368,14 +651,16 @@ def relay_on(relay_num):
                     print(f"MOCK: Relay {relay_num} turned ON")
 
                 # set the status for this relay to 'on'
-                RELAY_STATUS[relay_num - 1] = ON_STATE
+                _set_relay_state(relay_num, ON_STATE)
                 # Save state to file
                 save_relay_states()
             except Exception as e:
                 print(f"GPIO error for relay {relay_num}: {e}")
-                # In simulation mode, just update the status
-                RELAY_STATUS[relay_num - 1] = ON_STATE
+                # Record the commanded state; the server's read-back
+                # verification rewrites it or records what the line reports
+                _set_relay_state(relay_num, ON_STATE)
                 save_relay_states()
+            _notify_state_change()
         else:
             print('Invalid relay #:', relay_num)
     else:
@@ -410,14 +695,16 @@ def relay_off(relay_num):
                     print(f"MOCK: Relay {relay_num} turned OFF")
 
                 # set the status for this relay to 'off'
-                RELAY_STATUS[relay_num - 1] = OFF_STATE
+                _set_relay_state(relay_num, OFF_STATE)
                 # Save state to file
                 save_relay_states()
             except Exception as e:
                 print(f"GPIO error for relay {relay_num}: {e}")
-                # In simulation mode, just update the status
-                RELAY_STATUS[relay_num - 1] = OFF_STATE
+                # Record the commanded state; the server's read-back
+                # verification rewrites it or records what the line reports
+                _set_relay_state(relay_num, OFF_STATE)
                 save_relay_states()
+            _notify_state_change()
         else:
             print('Invalid relay #:', relay_num)
     else:
@@ -429,28 +716,32 @@ def relay_all_on(relay_ports=RELAY_PORTS):
 
      Call this function to turn all of the relays on.
      """
+    # Relay numbers follow RELAY_PORTS, whatever subset or order is passed
+    relay_nums = [RELAY_PORTS.index(relay) + 1 for relay in relay_ports]
+    _check_interlocks(relay_mask.from_relays(relay_nums))
     print('Turning all relays ON')
-    for i_relay, relay in enumerate(relay_ports):
+    for relay_num, relay in zip(relay_nums, relay_ports):
         try:
             if GPIO_LIBRARY == "gpiod" and len(GPIO_LINES) > 0:
                 line_request = GPIO_LINES[0]  # We have one request object for all lines
                 if line_request:
                     line_request.set_value(relay, gpiod.line.Value.INACTIVE)  # Turn on the relay (active low)
-            elif GPIO_LIBRARY == "gpiozero" and len(RELAY_DEVICES) > i_relay:
-                device = RELAY_DEVICES[i_relay]
+            elif GPIO_LIBRARY == "gpiozero" and len(RELAY_DEVICES) >= relay_num:
+                device = RELAY_DEVICES[relay_num - 1]
                 if device:
                     device.on()  # Turn on the relay
             elif GPIO_LIBRARY == "RPi.GPIO":
                 GPIO.output(relay, ON_STATE)
             else:
-                print(f"MOCK: Relay {i_relay + 1} turned ON")
+                print(f"MOCK: Relay {relay_num} turned ON")
 
-            RELAY_STATUS[i_relay] = ON_STATE
+            _set_relay_state(relay_num, ON_STATE)
         except Exception as e:
-            print(f"GPIO error for relay {i_relay + 1}: {e}")
+            print(f"GPIO error for relay {relay_num}: {e}")
             # In simulation mode, just update the status
-            RELAY_STATUS[i_relay] = ON_STATE
-        time.sleep(DELAY_TIME)
+            _set_relay_state(relay_num, ON_STATE)
+        _notify_state_change()
+        STEP_SLEEP(DELAY_TIME)
 
 
 def relay_all_off(relay_ports=RELAY_PORTS):
@@ -458,29 +749,171 @@ def relay_all_off(relay_ports=RELAY_PORTS):
 
     Call this function to turn all of the relays off.
     """
+    # Relay numbers follow RELAY_PORTS, whatever subset or order is passed
+    relay_nums = [RELAY_PORTS.index(relay) + 1 for relay in relay_ports]
     print('Turning all relays OFF')
-    for i_relay, relay in enumerate(relay_ports):
+    for relay_num, relay in zip(relay_nums, relay_ports):
         try:
             if GPIO_LIBRARY == "gpiod" and len(GPIO_LINES) > 0:
                 line_request = GPIO_LINES[0]  # We have one request object for all lines
                 if line_request:
                     line_request.set_value(relay, gpiod.line.Value.ACTIVE)  # Turn off the relay (active low)
-            elif GPIO_LIBRARY == "gpiozero" and len(RELAY_DEVICES) > i_relay:
-                device = RELAY_DEVICES[i_relay]
+            elif GPIO_LIBRARY == "gpiozero" and len(RELAY_DEVICES) >= relay_num:
+                device = RELAY_DEVICES[relay_num - 1]
                 if device:
                     device.off()  # Turn off the relay
             elif GPIO_LIBRARY == "RPi.GPIO":
                 GPIO.output(relay, OFF_STATE)
             else:
-                print(f"MOCK: Relay {i_relay + 1} turned OFF")
+                print(f"MOCK: Relay {relay_num} turned OFF")
 
             # set the status for this relay to 'off'
-            RELAY_STATUS[i_relay] = OFF_STATE
+            _set_relay_state(relay_num, OFF_STATE)
         except Exception as e:
-            print(f"GPIO error for relay {i_relay + 1}: {e}")
+            print(f"GPIO error for relay {relay_num}: {e}")
             # In simulation mode, just update the status
-            RELAY_STATUS[i_relay] = OFF_STATE
-        time.sleep(DELAY_TIME)
+            _set_relay_state(relay_num, OFF_STATE)
+        _notify_state_change()
+        STEP_SLEEP(DELAY_TIME)
+
+
+def _set_relay_state(relay_num, state):
+    """Record the state of a single relay in RELAY_MASK"""
+    global RELAY_MASK
+    with MASK_LOCK:
+        if state == ON_STATE:
+            RELAY_MASK |= relay_mask.bit(relay_num)
+        else:
+            RELAY_MASK &= ~relay_mask.bit(relay_num)
+
+
+def relay_get_status_mask():
+    """Return the stored relay states as a bitmask (bit n set = relay n+1 ON)"""
+    return RELAY_MASK
+
+
+def relay_set_many(relay_states):
+    """Switch several relays with a single bulk write.
+
+    Args:
+        relay_states (dict): Maps relay number to ON_STATE or OFF_STATE.
+    """
+    on_mask = 0
+    off_mask = 0
+    for relay_num, state in relay_states.items():
+        if isinstance(relay_num, int) and 0 < relay_num <= NUM_RELAY_PORTS:
+            if state == ON_STATE:
+                on_mask |= relay_mask.bit(relay_num)
+            else:
+                off_mask |= relay_mask.bit(relay_num)
+        else:
+            print('Invalid relay #:', relay_num)
+    relay_apply_mask(on_mask, off_mask)
+
+
+def relay_apply_mask(on_mask=0, off_mask=0):
+    """Switch the relays in ``on_mask`` on and those in ``off_mask`` off at once.
+
+    With gpiod all lines are written by one ``set_values()`` call so the
+    relays switch together; the other libraries fall back to a tight loop
+    without the `DELAY_TIME` pause used by `relay_all_on`/`relay_all_off`.
+
+    Args:
+        on_mask (int): Bitmask of relays to turn on.
+        off_mask (int): Bitmask of relays to turn off (wins over ``on_mask``).
+
+    Raises:
+        interlock.InterlockError: If the write would break an interlock; no
+            relay is switched.
+    """
+    staged = relay_stage_mask(on_mask, off_mask)
+    if staged:
+        write, commit = staged
+        write()
+        commit()
+
+
+def relay_stage_mask(on_mask=0, off_mask=0):
+    """Prepare a bulk write now so it can be fired later with minimal work.
+
+    Everything except the hardware call (masking, the interlock check and
+    building the per-line values) happens here, so ``write()`` is a single
+    ``set_values()`` call with gpiod.  ``commit()`` then records the new
+    state, saves it and notifies the listeners.  Call both on the writer
+    thread, ``commit()`` right after ``write()``.
+
+    Args:
+        on_mask (int): Bitmask of relays to turn on.
+        off_mask (int): Bitmask of relays to turn off (wins over ``on_mask``).
+
+    Returns:
+        tuple: ``(write, commit)`` callables, or None if no relay is touched.
+
+    Raises:
+        interlock.InterlockError: If the write would break an interlock.
+    """
+    valid = relay_mask.full(NUM_RELAY_PORTS)
+    off_mask &= valid
+    on_mask &= valid & ~off_mask
+    touched = on_mask | off_mask
+    if not touched:
+        return None
+    _check_interlocks(on_mask, off_mask)
+
+    states = {relay_num: (ON_STATE if relay_mask.is_set(on_mask, relay_num) else OFF_STATE)
+              for relay_num in relay_mask.to_relays(touched)}
+    print('Bulk switching relays ON:', relay_mask.to_relays(on_mask),
+          'OFF:', relay_mask.to_relays(off_mask))
+
+    if GPIO_LIBRARY == "gpiod" and len(GPIO_LINES) > 0 and GPIO_LINES[0]:
+        line_request = GPIO_LINES[0]  # We have one request object for all lines
+        # Active low: INACTIVE turns the relay on, ACTIVE turns it off
+        values = {
+            RELAY_PORTS[relay_num - 1]: (gpiod.line.Value.INACTIVE if state == ON_STATE
+                                         else gpiod.line.Value.ACTIVE)
+            for relay_num, state in states.items()
+        }
+
+        def hardware_write():
+            line_request.set_values(values)
+    elif GPIO_LIBRARY == "gpiozero" and RELAY_DEVICES:
+        devices = [(RELAY_DEVICES[relay_num - 1], state) for relay_num, state in states.items()
+                   if len(RELAY_DEVICES) >= relay_num and RELAY_DEVICES[relay_num - 1]]
+
+        def hardware_write():
+            for device, state in devices:
+                if state == ON_STATE:
+                    device.on()
+                else:
+                    device.off()
+    elif GPIO_LIBRARY == "RPi.GPIO":
+        pins = [(RELAY_PORTS[relay_num - 1], state) for relay_num, state in states.items()]
+
+        def hardware_write():
+            for pin, state in pins:
+                GPIO.output(pin, state)
+    elif GPIO_LIBRARY == "gpiod":
+        def hardware_write():
+            pass
+    else:
+        def hardware_write():
+            for relay_num, state in states.items():
+                print(f"MOCK: Relay {relay_num} turned {'ON' if state == ON_STATE else 'OFF'}")
+
+    def write():
+        try:
+            hardware_write()
+        except Exception as e:
+            print(f"GPIO error during bulk write: {e}")
+
+    def commit():
+        global RELAY_MASK
+        with MASK_LOCK:
+            RELAY_MASK = relay_mask.apply(RELAY_MASK, on_mask, off_mask)
+        save_relay_states()
+        _notify_state_change()
+
+    return write, commit
 
 
 def relay_toggle_port(relay_num):
@@ -516,6 +949,13 @@ def relay_toggle_all_port(relay_num):
             relay_on(relay_num)
 
 
+def relay_toggle_all():
+    """Invert the state of every relay with a single bulk write."""
+    print('Toggling all relays')
+    mask = RELAY_MASK
+    relay_apply_mask(on_mask=relay_mask.invert(mask, NUM_RELAY_PORTS), off_mask=mask)
+
+
 def relay_get_port_status(relay_num):
     """Returns the status of the specified relay (True for on, False for off)
 
@@ -529,7 +969,13 @@ def relay_get_port_status(relay_num):
 
     # Get actual GPIO status and update stored status
     actual_status = get_relay_actual_status(relay_num)
-    if 0 < relay_num <= len(RELAY_STATUS):
-        RELAY_STATUS[relay_num - 1] = actual_status
+    changed = False
+    with MASK_LOCK:
+        if 0 < relay_num <= NUM_RELAY_PORTS and \
+                relay_mask.is_set(RELAY_MASK, relay_num) != (actual_status == ON_STATE):
+            _set_relay_state(relay_num, actual_status)
+            changed = True
+    if changed:
+        _notify_state_change()
 
     return actual_status == ON_STATE
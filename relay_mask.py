@@ -0,0 +1,98 @@
+"""Compact relay state as an integer bitmask.
+
+Bit ``n`` of a mask is set when relay ``n + 1`` is ON.  Python integers are
+arbitrary precision, so the same representation serves a 16 relay board and
+a bank of thousands of lines, and every bulk operation below is a handful of
+big-integer instructions instead of a Python loop over a list.
+"""
+
+
+def bit(relay_num):
+    """Return the mask with only ``relay_num`` (1-based) set."""
+    return 1 << (relay_num - 1)
+
+
+def full(count):
+    """Return the mask with the first ``count`` relays set."""
+    return (1 << count) - 1
+
+
+def from_relays(relay_nums):
+    """Build a mask from an iterable of 1-based relay numbers."""
+    mask = 0
+    for relay_num in relay_nums:
+        mask |= 1 << (relay_num - 1)
+    return mask
+
+
+def to_relays(mask):
+    """Return the 1-based relay numbers set in ``mask``, in ascending order."""
+    relays = []
+    while mask:
+        low = mask & -mask
+        relays.append(low.bit_length())
+        mask ^= low
+    return relays
+
+
+def from_list(states):
+    """Build a mask from a sequence of booleans (True meaning ON)."""
+    mask = 0
+    for index, state in enumerate(states):
+        if state:
+            mask |= 1 << index
+    return mask
+
+
+def to_list(mask, count):
+    """Expand ``mask`` into a list of ``count`` booleans."""
+    return [bool(mask >> index & 1) for index in range(count)]
+
+
+def is_set(mask, relay_num):
+    return bool(mask >> (relay_num - 1) & 1)
+
+
+def popcount(mask):
+    """Return the number of relays that are ON in ``mask``."""
+    try:
+        return mask.bit_count()
+    except AttributeError:  # Python < 3.10
+        return bin(mask).count('1')
+
+
+def diff(old, new):
+    """Return the mask of relays whose state differs between two masks."""
+    return old ^ new
+
+
+def apply(mask, on_mask=0, off_mask=0):
+    """Return ``mask`` with the ``on_mask`` bits set and ``off_mask`` bits cleared.
+
+    A relay present in both masks ends up OFF.
+    """
+    return (mask | on_mask) & ~off_mask
+
+
+def invert(mask, count):
+    """Flip the state of the first ``count`` relays."""
+    return ~mask & full(count)
+
+
+def to_hex(mask, count):
+    """Format ``mask`` as fixed-width hex (one digit per four relays)."""
+    return '0x{:0{width}x}'.format(mask, width=max(1, (count + 3) // 4))
+
+
+def from_hex(text):
+    """Parse a mask written by `to_hex` (the ``0x`` prefix is optional)."""
+    return int(text, 16)
+
+
+def to_bytes(mask, count):
+    """Serialize ``mask`` as little-endian bytes, one byte per eight relays."""
+    return mask.to_bytes((count + 7) // 8, 'little')
+
+
+def from_bytes(data):
+    return int.from_bytes(data, 'little')
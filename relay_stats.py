@@ -0,0 +1,206 @@
+"""Per-relay duty cycle, on-time and switch-count accounting.
+
+`RelayStats` is fed the relay bitmask after every state change (it is
+registered as a relay_lib state listener) and keeps, for every relay:
+
+- the total time spent ON and the total number of switching operations,
+  which is what relay endurance ratings are quoted in;
+- rolling hour/day/week windows held in fixed-size ring buffers of time
+  buckets, so updates are O(1) and a query never rescans any history.
+
+Totals are checkpointed to a small JSON file periodically so they survive
+restarts; the rolling windows start empty after a restart.
+
+Durations are measured on the monotonic clock, so stepping the wall clock
+(NTP, a Pi without an RTC setting its time after boot) neither adds nor
+loses on-time; the wall clock only provides the reported timestamps.
+"""
+
+import json
+import os
+import threading
+import time
+
+import relay_mask
+
+# name: (bucket length in seconds, number of buckets)
+WINDOWS = {
+    'hour': (60, 60),
+    'day': (3600, 24),
+    'week': (6 * 3600, 28),
+}
+# Seconds between checkpoints written by the background thread
+CHECKPOINT_INTERVAL = 300
+
+
+class RingWindow(object):
+    """On-time and switch counts for one relay over a rolling window."""
+
+    __slots__ = ('bucket_seconds', 'size', 'on_time', 'switches', 'epochs')
+
+    def __init__(self, bucket_seconds, size):
+        self.bucket_seconds = bucket_seconds
+        self.size = size
+        self.on_time = [0.0] * size
+        self.switches = [0] * size
+        self.epochs = [-1] * size  # bucket number currently held in each slot
+
+    def _slot(self, epoch):
+        slot = epoch % self.size
+        if self.epochs[slot] != epoch:
+            self.epochs[slot] = epoch
+            self.on_time[slot] = 0.0
+            self.switches[slot] = 0
+        return slot
+
+    def add_switch(self, now):
+        self.switches[self._slot(int(now // self.bucket_seconds))] += 1
+
+    def add_on_time(self, start, end):
+        # Split the interval at bucket boundaries; at most `size` buckets are
+        # touched because anything older has already left the window
+        start = max(start, end - self.bucket_seconds * self.size)
+        while start < end:
+            epoch = int(start // self.bucket_seconds)
+            boundary = min(end, (epoch + 1) * self.bucket_seconds)
+            self.on_time[self._slot(epoch)] += boundary - start
+            start = boundary
+
+    def totals(self, now):
+        oldest = int(now // self.bucket_seconds) - self.size + 1
+        on_time = 0.0
+        switches = 0
+        for slot in range(self.size):
+            if self.epochs[slot] >= oldest:
+                on_time += self.on_time[slot]
+                switches += self.switches[slot]
+        return on_time, switches
+
+
+class RelayStats(object):
+    """Incremental statistics for a bank of relays."""
+
+    def __init__(self, num_relays, path=None, initial_mask=0, clock=time.monotonic,
+                 wall_clock=time.time):
+        self.num_relays = num_relays
+        self.path = path
+        self.clock = clock              # intervals
+        self.wall_clock = wall_clock    # timestamps in snapshots and checkpoints
+        self.lock = threading.Lock()
+        self.mask = initial_mask
+        self.started = wall_clock()
+        self.windows_started = clock()  # windows are not checkpointed
+        self.on_time = [0.0] * num_relays
+        self.switches = [0] * num_relays
+        self.on_since = [None] * num_relays
+        self.windows = [{name: RingWindow(*spec) for name, spec in WINDOWS.items()}
+                        for _ in range(num_relays)]
+        for relay_num in relay_mask.to_relays(initial_mask & relay_mask.full(num_relays)):
+            self.on_since[relay_num - 1] = self.windows_started
+        self._dirty = False
+        if path:
+            self.load()
+
+    def update(self, mask):
+        """Account for a new relay bitmask; only changed relays are touched."""
+        now = self.clock()
+        with self.lock:
+            changed = relay_mask.diff(self.mask, mask) & relay_mask.full(self.num_relays)
+            for relay_num in relay_mask.to_relays(changed):
+                index = relay_num - 1
+                windows = self.windows[index].values()
+                if relay_mask.is_set(mask, relay_num):
+                    self.on_since[index] = now
+                else:
+                    self._close_interval(index, now)
+                    self.on_since[index] = None
+                self.switches[index] += 1
+                for window in windows:
+                    window.add_switch(now)
+            self.mask = mask
+            if changed:
+                self._dirty = True
+
+    def _close_interval(self, index, now):
+        start = self.on_since[index]
+        if start is None:
+            return
+        self.on_time[index] += now - start
+        for window in self.windows[index].values():
+            window.add_on_time(start, now)
+
+    def snapshot(self):
+        """Return the current statistics for every relay as a dict."""
+        now = self.clock()
+        relays = []
+        with self.lock:
+            for index in range(self.num_relays):
+                start = self.on_since[index]
+                running = now - start if start is not None else 0.0
+                entry = {
+                    'relay': index + 1,
+                    'on': start is not None,
+                    'on_time': round(self.on_time[index] + running, 3),
+                    'switches': self.switches[index],
+                    'windows': {},
+                }
+                for name, window in self.windows[index].items():
+                    on_time, switches = window.totals(now)
+                    length = window.bucket_seconds * window.size
+                    if start is not None:
+                        on_time += now - max(start, now - length)
+                    span = min(length, now - self.windows_started) or 1.0
+                    entry['windows'][name] = {
+                        'on_time': round(on_time, 3),
+                        'switches': switches,
+                        'duty_cycle': round(min(1.0, on_time / span), 4),
+                    }
+                relays.append(entry)
+        return {'since': self.started, 'now': self.wall_clock(), 'relays': relays}
+
+    def checkpoint(self):
+        """Write the cumulative counters to disk if they changed."""
+        if not self.path:
+            return
+        now = self.clock()
+        with self.lock:
+            if not self._dirty and not any(s is not None for s in self.on_since):
+                return
+            on_time = [self.on_time[i] + (now - s if s is not None else 0.0)
+                       for i, s in enumerate(self.on_since)]
+            data = {'since': self.started, 'saved': self.wall_clock(),
+                    'on_time': [round(t, 3) for t in on_time], 'switches': self.switches}
+            self._dirty = False
+        try:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Error saving relay statistics: {e}")
+
+    def load(self):
+        """Load the cumulative counters from the last checkpoint."""
+        try:
+            if not os.path.exists(self.path):
+                return
+            with open(self.path) as f:
+                data = json.load(f)
+            count = min(self.num_relays, len(data['on_time']), len(data['switches']))
+            self.on_time[:count] = [float(t) for t in data['on_time'][:count]]
+            self.switches[:count] = [int(n) for n in data['switches'][:count]]
+            self.started = data.get('since', self.started)
+            print(f"Relay statistics loaded from {self.path}")
+        except Exception as e:
+            print(f"Error loading relay statistics: {e}")
+
+    def start_checkpointing(self, interval=CHECKPOINT_INTERVAL):
+        """Checkpoint periodically from a daemon thread."""
+        def run():
+            while True:
+                time.sleep(interval)
+                self.checkpoint()
+
+        thread = threading.Thread(target=run, name='relay-stats-checkpoint', daemon=True)
+        thread.start()
+        return thread
@@ -4,70 +4,32 @@ GPIO Reset Script for Raspberry Pi 5
 This script resets all GPIO pins used by the relay controller
 """
 
-import subprocess
-import time
+import argparse
 import sys
 
+from gpio_recovery import recover_lines, print_report
+
 # GPIO pins used by the relay controller
 GPIO_PINS = [10, 12, 13, 14, 15, 6, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26]
 
-def reset_gpio_with_gpioset():
-    """Reset GPIO pins using gpioset command"""
-    print("Resetting GPIO pins using gpioset...")
-    for pin in GPIO_PINS:
-        try:
-            # Set pin to high (relay off for active-low relays)
-            result = subprocess.run(['gpioset', 'gpiochip0', f'{pin}=1'], 
-                                  timeout=2, capture_output=True, text=True)
-            if result.returncode == 0:
-                print(f"Reset GPIO {pin}")
-            else:
-                print(f"Failed to reset GPIO {pin}: {result.stderr}")
-        except subprocess.TimeoutExpired:
-            print(f"Timeout resetting GPIO {pin}")
-        except Exception as e:
-            print(f"Error resetting GPIO {pin}: {e}")
-
-def reset_gpio_with_gpiod():
-    """Reset GPIO pins using gpiod library"""
-    try:
-        import gpiod
-        print("Resetting GPIO pins using gpiod...")
-        
-        chip_path = '/dev/gpiochip0'
-        config = {}
-        for pin in GPIO_PINS:
-            config[pin] = gpiod.LineSettings(
-                direction=gpiod.line.Direction.OUTPUT,
-                output_value=gpiod.line.Value.ACTIVE  # High = relay off
-            )
-        
-        try:
-            line_request = gpiod.request_lines(
-                chip_path,
-                consumer="gpio_reset",
-                config=config
-            )
-            print("Successfully reset all GPIO pins with gpiod")
-            time.sleep(0.1)
-            line_request.release()
-            print("Released GPIO lines")
-        except Exception as e:
-            print(f"Failed to reset with gpiod: {e}")
-            
-    except ImportError:
-        print("gpiod library not available")
-
 def main():
+    parser = argparse.ArgumentParser(description="Reset the relay controller's GPIO lines")
+    parser.add_argument('--kill', action='store_true',
+                        help="terminate stale instances of this controller that hold the lines "
+                             "(never the running relay-controller service)")
+    args = parser.parse_args()
+
     print("GPIO Reset Tool for Relay Controller")
     print("====================================")
-    
-    # Try both methods
-    reset_gpio_with_gpioset()
-    time.sleep(1)
-    reset_gpio_with_gpiod()
-    
+
+    # Reset and verify every line in one pass; reclaim only when asked
+    result = recover_lines(GPIO_PINS, consumer="gpio_reset", reclaim=args.kill)
+    print_report(result)
+    if not args.kill and any(holder['stale'] for holder in result['holders']):
+        print("Stale holders found; run again with --kill to terminate them")
+
     print("GPIO reset completed")
+    return result['ok']
 
 if __name__ == "__main__":
-    main()
+    sys.exit(0 if main() else 1)
@@ -2,7 +2,10 @@
 
 from __future__ import print_function
 
+import atexit
+import os
 import sys
+import threading
 import time
 import json
 
@@ -11,14 +14,34 @@ from flask_bootstrap import Bootstrap
 from functools import wraps
 import hashlib
 
+import relay_lib
 from relay_lib import *
+from power_sequencer import SequenceError, build_plan, run_sequence
+from state_shm import StatePage
+from relay_stats import RelayStats
+from health import Heartbeat
+from mqtt_bridge import bridge_from_env
+from command_queue import CommandQueue, QueueFull, Preempted, EMERGENCY, SCHEDULED
+from interlock import InterlockError, Interlocks
+from readback import ReadbackVerifier
+from lease import LeaseTable, valid_lease
+from timed_switch import TimedSwitcher
+import relay_mask
 
 error_msg = '{msg:"error"}'
 success_msg = '{msg:"success"}'
+busy_msg = '{msg:"busy"}'
+preempted_msg = '{msg:"preempted"}'
+expired_msg = '{msg:"expired"}'
+# reason is a JSON string literal (quotes and backslashes escaped)
+interlock_msg = '{{msg:"interlock",reason:{reason}}}'
 
 # Update the following list/tuple with the port numbers assigned to your relay board
 # Extended to support 16 relays for Raspberry Pi 5 - Updated GPIO pins
 PORTS = [10, 12, 13, 14, 15, 6, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26]
+if GPIO_BACKEND == "sim" and NUM_RELAY_PORTS != len(PORTS):
+    # Simulated chip sized by RELAY_SIM_RELAYS: drive virtual lines 0..N-1
+    PORTS = list(range(NUM_RELAY_PORTS))
 NUM_RELAY_PORTS = len(PORTS)
 
 RELAY_NAME = 'Pi-5 Relay Controller'
@@ -28,6 +51,28 @@ USERNAME = 'admin'
 PASSWORD_HASH = hashlib.sha256('relay123'.encode()).hexdigest()  # Default password: relay123
 SECRET_KEY = 'your-secret-key-change-this-in-production'
 
+# Publish relay state to shared memory so local tools can read it lock-free
+try:
+    state_page = StatePage(NUM_RELAY_PORTS)
+    add_state_listener(state_page.publish_bits)
+    atexit.register(state_page.close)
+except (OSError, ValueError) as e:
+    print(f"Shared-memory state page unavailable: {e}")
+    state_page = None
+
+# Long-poll support for /status?since=<version>: bumped on every state change
+STATUS_MAX_WAIT = 30.0
+state_version = 0
+state_changed = threading.Condition()
+
+def bump_state_version(mask):
+    global state_version
+    with state_changed:
+        state_version += 1
+        state_changed.notify_all()
+
+add_state_listener(bump_state_version)
+
 # initialize the relay library with the system's port configuration
 try:
     if init_relay(PORTS):
@@ -55,20 +100,239 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-root_dir = '/home/pi/pi-relay-controller-modmypi2025'
+root_dir = RELAY_CONTROLLER_DIR
 with open('{}/channels.json'.format(root_dir)) as json_file:
     channel_config = json.load(json_file)
 
 supported_channels = []
+supported_relays = []
 for channel in channel_config['channels']:
     if channel['active'] == 'true':
         print('channel: ', channel['channel'])
         supported_channels.append(PORTS[channel['channel'] - 1])
+        supported_relays.append(channel['channel'])
     else:
         relay_off(channel['channel'])
 
 print(supported_channels)
 
+# Rendered pages only change with the channel configuration, so they are
+# cached per config version and revalidated with a strong ETag
+config_version = hashlib.sha256(
+    json.dumps([RELAY_NAME, channel_config], sort_keys=True).encode()).hexdigest()[:16]
+page_cache = {}
+
+if state_page:
+    state_page.publish_bits(relay_get_status_mask())
+
+# Duty cycle / switch count accounting, checkpointed next to the state file
+relay_stats = RelayStats(NUM_RELAY_PORTS,
+                         path=os.path.join(os.path.dirname(RELAY_STATE_FILE), 'relay_stats.json'),
+                         initial_mask=relay_get_status_mask())
+add_state_listener(relay_stats.update)
+relay_stats.start_checkpointing()
+atexit.register(relay_stats.checkpoint)
+
+# Dashboard layout: every visible relay with its name, grouped into banks
+# (``"bank"`` in channels.json, otherwise one bank per BANK_SIZE relays)
+BANK_SIZE = 16
+configured_channels = {channel['channel']: channel for channel in channel_config['channels']}
+relay_banks = {}
+for relay_num in range(1, NUM_RELAY_PORTS + 1):
+    channel = configured_channels.get(relay_num, {})
+    if channel.get('visible', True):
+        bank = channel.get('bank') or f"Bank {(relay_num - 1) // BANK_SIZE + 1}"
+        relay_banks.setdefault(bank, []).append(
+            {'channel': relay_num, 'name': channel.get('name', f"Relay {relay_num}")})
+relay_layout = [{'name': name, 'relays': relays} for name, relays in relay_banks.items()]
+
+# Scenes: named sets of relays to switch on/off together
+scene_masks = {}
+for scene_name, scene in channel_config.get('scenes', {}).items():
+    scene_masks[scene_name] = (relay_mask.from_relays(scene.get('on', [])),
+                               relay_mask.from_relays(scene.get('off', [])))
+
+# Interlocks: compiled once and checked before every write switches a relay
+# on.  A broken rule set must not silently disable them, so it stops startup.
+interlocks = Interlocks(channel_config.get('interlocks', []), NUM_RELAY_PORTS)
+set_interlocks(interlocks)
+for scene_name, (on_mask, off_mask) in scene_masks.items():
+    reason = interlocks.violation(0, on_mask, off_mask)
+    if reason:
+        print(f"Scene '{scene_name}' can never be applied: {reason}")
+
+# Persist relay states from a background thread from here on
+start_state_saver()
+
+# From here on a single writer thread owns the hardware: every relay write
+# is submitted to this bounded priority queue
+writer = CommandQueue(maxsize=64).start()
+relay_lib.STEP_SLEEP = writer.step_sleep
+
+# Read back every written relay in coalesced sweeps on the writer thread,
+# rewrite mismatches with bounded backoff and record lines that never switch
+verifier = ReadbackVerifier(NUM_RELAY_PORTS,
+                            read_mask=relay_read_mask,
+                            expected_mask=relay_get_status_mask,
+                            rewrite=relay_apply_mask,
+                            adopt=relay_adopt_hardware_state,
+                            submit=lambda func: writer.submit(func, priority=SCHEDULED),
+                            initial_mask=relay_get_status_mask())
+add_state_listener(verifier.on_state_change)
+verifier.start()
+verifier.touch(relay_mask.full(NUM_RELAY_PORTS))
+
+# Auto-off leases (/on/<n>?lease=SECONDS): one timer heap for all relays,
+# persisted next to the state file; due leases are switched off together,
+# ahead of other queued work but without interrupting it
+def expire_leases(mask):
+    # Runs on the writer, where leases are also granted: skip relays whose
+    # lease was granted again after they fell due
+    mask = leases.unleased(mask)
+    if mask:
+        relay_apply_mask(off_mask=mask)
+
+
+leases = LeaseTable(expire=lambda mask: writer.run(expire_leases, mask,
+                                                   priority=EMERGENCY, interrupt=False),
+                    path=os.path.join(RELAY_CONTROLLER_DIR, 'relay_leases.json'))
+leases.load(on_mask=relay_get_status_mask())
+add_state_listener(leases.on_state_change)
+leases.start()
+atexit.register(leases.flush)
+
+# Coordinated switching across controllers: pre-staged bulk writes fired at
+# an agreed CLOCK_REALTIME timestamp (/switch_at). Requests return at once;
+# the job goes to the writer shortly before the target and holds it until
+# then, unless an emergency stop interrupts it
+switcher = TimedSwitcher(stage=relay_stage_mask,
+                         submit=lambda func: writer.submit(func, priority=EMERGENCY,
+                                                           interrupt=False),
+                         sleep=writer.step_sleep)
+switcher.start()
+
+
+def hardware_verification_age():
+    if relay_lib.LAST_HW_READ is None:
+        return None
+    return round(time.monotonic() - relay_lib.LAST_HW_READ, 1)
+
+
+# Probe answers are precomputed by the heartbeat so /healthz and /readyz
+# never touch the hardware
+heartbeat = Heartbeat({
+    'gpio_library': lambda: GPIO_LIBRARY,
+    'gpio_ready': gpio_backend_ready,
+    'hardware_verification_age': hardware_verification_age,
+    'persistence_queue_depth': persistence_queue_depth,
+    'command_queue_depth': writer.depth,
+    'failed_lines': verifier.failed,
+    'active_leases': lambda: len(leases.leases),
+})
+heartbeat.start()
+
+# Validate the power-up dependency graph once at startup; fall back to the
+# plain port-order sequence if channels.json describes an impossible graph
+try:
+    power_plan = build_plan(channel_config['channels'])
+    print("Power-up plan:", power_plan['steps'])
+except SequenceError as e:
+    print(f"Invalid power sequence in channels.json: {e}")
+    power_plan = None
+
+@app.route('/healthz')
+def healthz():
+    # Unauthenticated liveness probe
+    if heartbeat.alive():
+        return make_response('ok', 200)
+    return make_response('heartbeat stalled', 503)
+
+
+@app.route('/readyz')
+def readyz():
+    # Unauthenticated readiness probe, answered from the heartbeat's cache
+    ready, body = heartbeat.readiness
+    response = make_response(body, 200 if ready else 503)
+    response.mimetype = 'application/json'
+    return response
+
+
+def render_cached(template_name, **context):
+    """Render a template once per config version and answer 304 when unchanged"""
+    if session.get('_flashes'):
+        # Flashed messages are one-off content that must not be cached
+        return render_template(template_name, **context)
+    key = (template_name, config_version)
+    entry = page_cache.get(key)
+    if entry is None:
+        body = render_template(template_name, **context).encode()
+        entry = page_cache[key] = (body, hashlib.sha256(body).hexdigest())
+    body, etag = entry
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(body, 200)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# Multi-step jobs below run on the calling thread and submit each write to
+# the writer separately, so their pauses and readiness waits never block the
+# other writes; an emergency stop ends them between two steps.
+
+def switch_each(relays, switch):
+    """Switch relays one at a time with DELAY_TIME between them"""
+    steps = writer.steps()
+    for index, relay in enumerate(relays):
+        if index:
+            steps.sleep(DELAY_TIME)
+        steps.run(switch, relay)
+
+
+def switch_all_on():
+    """Power up every active channel, honouring the dependency graph"""
+    # Refuse up front rather than stopping half way through the sequence
+    order = power_plan['order'] if power_plan is not None else supported_relays
+    interlocks.check(relay_get_status_mask(), relay_mask.from_relays(order))
+    if power_plan is None:
+        switch_each(supported_relays, relay_on)
+        return True
+    steps = writer.steps()
+    try:
+        run_sequence(channel_config['channels'],
+                     lambda relays: steps.run(relay_apply_mask, on_mask=relay_mask.from_relays(relays)),
+                     sleep=steps.sleep)
+    except SequenceError as e:
+        # Also covers an interlock refusing a step half way through
+        switched = sorted(relay for _, relays in e.history for relay in relays)
+        print(f"Power sequence failed: {e}; relays left on: {switched}")
+        return False
+    return True
+
+
+def switch_all_off():
+    switch_each(supported_relays, relay_off)
+
+
+def reboot_relay(relay, sleep_time):
+    """Power-cycle one relay; the pause can be cut short by an emergency stop"""
+    steps = writer.steps()
+    steps.run(relay_off, relay)
+    steps.sleep(sleep_time)
+    steps.run(relay_on, relay)
+
+
+def apply_scene(name):
+    """Switch to a scene from channels.json with one bulk write"""
+    if name not in scene_masks:
+        print("Unknown scene:", name)
+        return False
+    on_mask, off_mask = scene_masks[name]
+    relay_apply_mask(on_mask, off_mask)
+    return True
+
+
 @app.route("/login", methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -83,7 +347,7 @@ def login():
         else:
             flash('اسم المستخدم أو كلمة المرور غير صحيحة!', 'error')
 
-    return render_template('login.html')
+    return render_cached('login.html')
 
 @app.route("/logout")
 def logout():
@@ -94,15 +358,70 @@ def logout():
 @app.route('/')
 @login_required
 def index():
-    print("Loading app Main page")
-    return render_template('index.html', relay_name=RELAY_NAME, channel_info=channel_config['channels'])
+    # The cards are built client-side from one /relays request
+    return render_cached('index.html', relay_name=RELAY_NAME, num_relays=NUM_RELAY_PORTS)
+
+
+@app.route('/status')
+@login_required
+def api_get_status_all():
+    # All relay states in one response; ?format=mask returns just the hex bitmask.
+    # With ?since=<version> the request waits (up to ?timeout= seconds) until
+    # the state has changed from that version.
+    since = request.args.get('since', type=int)
+    if since is not None:
+        timeout = min(max(request.args.get('timeout', 25.0, type=float), 0.0), STATUS_MAX_WAIT)
+        with state_changed:
+            state_changed.wait_for(lambda: state_version != since, timeout)
+    version = state_version
+    mask = relay_get_status_mask()
+    if request.args.get('format') == 'mask':
+        response = make_response(relay_mask.to_hex(mask, NUM_RELAY_PORTS), 200)
+        response.mimetype = 'text/plain'
+        return response
+    return jsonify({
+        'count': NUM_RELAY_PORTS,
+        'mask': relay_mask.to_hex(mask, NUM_RELAY_PORTS),
+        'on': relay_mask.to_relays(mask),
+        'version': version,
+    })
+
+
+@app.route('/relays')
+@login_required
+def api_get_relays():
+    # Dashboard payload: the bank layout plus the state in one response;
+    # changes then arrive through /status?since=<version>
+    version = state_version
+    mask = relay_get_status_mask()
+    return jsonify({
+        'count': NUM_RELAY_PORTS,
+        'mask': relay_mask.to_hex(mask, NUM_RELAY_PORTS),
+        'version': version,
+        'banks': relay_layout,
+    })
+
+
+@app.route('/stats')
+@login_required
+def api_get_stats():
+    return jsonify(relay_stats.snapshot())
+
+
+@app.route('/interlocks')
+@login_required
+def api_get_interlocks():
+    return jsonify(interlocks.describe())
 
 
 @app.route('/status/<int:relay>')
 @login_required
 def api_get_status(relay):
-    res = relay_get_port_status(relay)
-    if res:
+    # Answered from the cached state, which the writer keeps and the
+    # read-back verifier reconciles with the hardware
+    if not validate_relay(relay):
+        return make_response(error_msg, 404)
+    if relay_mask.is_set(relay_get_status_mask(), relay):
         print("Relay is ON")
         return make_response("1", 200)
     else:
@@ -114,60 +433,232 @@ def api_get_status(relay):
 @login_required
 def api_toggle_relay(relay):
     print("Executing api_relay_toggle:", relay)
-    relay_toggle_port(relay)
+    writer.run(relay_toggle_port, relay)
     return make_response(success_msg, 200)
 
 
+@app.route('/toggle_all/')
+@login_required
+def api_toggle_all():
+    print("Executing api_toggle_all")
+    writer.run(relay_toggle_all)
+    return make_response(success_msg, 200)
+
+
+def switch_on_leased(relay, lease):
+    """Switch a relay on and set (or cancel) its lease in one writer job"""
+    relay_on(relay)
+    if lease:
+        leases.grant(relay, lease)
+    else:
+        leases.release(relay_mask.bit(relay))
+
+
 @app.route('/on/<int:relay>')
 @login_required
 def api_relay_on(relay):
     print("Executing api_relay_on:", relay)
     if validate_relay(relay):
         print("valid relay")
-        relay_on(relay)
+        # Optional auto-off lease in seconds; a plain /on/ cancels any lease
+        lease = request.args.get('lease', type=float)
+        if 'lease' in request.args and not valid_lease(lease):
+            return make_response(error_msg, 400)
+        writer.run(switch_on_leased, relay, lease)
         return make_response(success_msg, 200)
     else:
         print("invalid relay")
         return make_response(error_msg, 404)
 
 
+@app.route('/renew/<int:relay>')
+@login_required
+def api_relay_renew(relay):
+    # Keep a leased relay on: /renew/<n>?lease=SECONDS (default: same length)
+    print("Executing api_relay_renew:", relay)
+    lease = request.args.get('lease', type=float)
+    if 'lease' in request.args and not valid_lease(lease):
+        return make_response(error_msg, 400)
+    try:
+        leases.renew(relay, lease)
+    except KeyError:
+        print("no active lease")
+        return make_response(expired_msg, 404)
+    return make_response(success_msg, 200)
+
+
+@app.route('/leases')
+@login_required
+def api_leases():
+    return jsonify({'leases': leases.active(), 'stats': dict(leases.stats)})
+
+
 @app.route('/off/<int:relay>')
 @login_required
 def api_relay_off(relay):
     print("Executing api_relay_off:", relay)
     if validate_relay(relay):
         print("valid relay")
-        relay_off(relay)
+        writer.run(relay_off, relay)
         return make_response(success_msg, 200)
     else:
         print("invalid relay")
         return make_response(error_msg, 404)
 
 
+def relay_args():
+    """Parse ``?on=1,2&off=3`` into two bitmasks.
+
+    Raises:
+        ValueError: If a relay number is not an integer or is in both lists.
+        LookupError: If a relay number is out of range.
+    """
+    on = [int(n) for n in request.args.get('on', '').split(',') if n]
+    off = [int(n) for n in request.args.get('off', '').split(',') if n]
+    if not all(validate_relay(relay) for relay in on + off):
+        raise LookupError("invalid relay")
+    on_mask, off_mask = relay_mask.from_relays(on), relay_mask.from_relays(off)
+    if on_mask & off_mask:
+        raise ValueError(f"relays {relay_mask.to_relays(on_mask & off_mask)} are both on and off")
+    return on_mask, off_mask
+
+
+@app.route('/set')
+@login_required
+def api_relay_set():
+    # Several relays in one request and one bulk write: /set?on=1,2&off=3
+    print("Executing api_relay_set:", request.args.get('on'), request.args.get('off'))
+    try:
+        on_mask, off_mask = relay_args()
+    except ValueError as e:
+        print(f"Bulk switch refused: {e}")
+        return make_response(error_msg, 400)
+    except LookupError:
+        print("invalid relay")
+        return make_response(error_msg, 404)
+    writer.run(relay_apply_mask, on_mask, off_mask)
+    return make_response(success_msg, 200)
+
+
+@app.route('/switch_at')
+@login_required
+def api_switch_at():
+    # Schedule a switch at an epoch timestamp: /switch_at?t=1767225600.5&on=1,2&off=3
+    # Answers 202 right away; /switch_at/<id> has the outcome after the target
+    print("Executing api_switch_at:", request.args.get('t'),
+          request.args.get('on'), request.args.get('off'))
+    target = request.args.get('t', type=float)
+    try:
+        on_mask, off_mask = relay_args()
+    except ValueError:
+        return make_response(error_msg, 400)
+    except LookupError:
+        print("invalid relay")
+        return make_response(error_msg, 404)
+    # Refuse now what the current state would refuse; checked again when fired
+    interlocks.check(relay_get_status_mask(), on_mask, off_mask)
+    try:
+        if target is None:
+            raise ValueError("missing t")
+        record = switcher.switch_at(target, on_mask, off_mask, tag=request.args.get('tag'))
+    except ValueError as e:
+        print(f"Timed switch refused: {e}")
+        return make_response(error_msg, 400)
+    return jsonify(record), 202
+
+
+@app.route('/switch_at/<int:switch_id>')
+@login_required
+def api_switch_record(switch_id):
+    # One timed switch: status scheduled, done, missed or failed
+    record = switcher.get(switch_id)
+    if record is None:
+        return make_response(error_msg, 404)
+    return jsonify(record)
+
+
+@app.route('/switch_at/log')
+@login_required
+def api_switch_log():
+    # Recent timed switches for auditing the skew between controllers
+    return jsonify(switcher.recent())
+
+
 @app.route('/all_on/')
 @login_required
 def api_relay_all_on():
     print("Executing api_relay_all_on")
-    relay_all_on(supported_channels)
-    return make_response(success_msg, 200)
+    if switch_all_on():
+        return make_response(success_msg, 200)
+    return make_response(error_msg, 500)
+
+
+@app.route('/sequence/plan')
+@login_required
+def api_sequence_plan():
+    # Dry run: show what /all_on/ would do without touching the hardware
+    print("Executing api_sequence_plan")
+    try:
+        plan = build_plan(channel_config['channels'])
+    except SequenceError as e:
+        return jsonify({'error': str(e)}), 400
+    plan['serial_time'] = len(plan['order']) * DELAY_TIME
+    return jsonify(plan)
+
+
+@app.route('/scene/<name>')
+@login_required
+def api_scene(name):
+    print("Executing api_scene:", name)
+    if writer.run(apply_scene, name):
+        return make_response(success_msg, 200)
+    return make_response(error_msg, 404)
 
 
 @app.route('/all_off/')
 @login_required
 def api_all_relay_off():
     print("Executing api_relay_all_off")
-    relay_all_off(supported_channels)
+    switch_all_off()
+    return make_response(success_msg, 200)
+
+
+@app.route('/emergency_stop/')
+@login_required
+def api_emergency_stop():
+    # Jumps the queue, interrupts any running sequence between steps and
+    # drops pending work, then switches everything off in one write
+    print("Executing api_emergency_stop")
+    # Timed switches first, so none is handed to the writer after the stop
+    cancelled = switcher.cancel_pending()
+    cancelled += writer.cancel_pending()
+    writer.run(relay_apply_mask, off_mask=relay_mask.full(NUM_RELAY_PORTS), priority=EMERGENCY)
+    # The cancelled work included queued read-back sweeps: check every line
+    # again, which also confirms that the emergency-off write took effect
+    verifier.touch(relay_mask.full(NUM_RELAY_PORTS))
+    print(f"Emergency stop done, {cancelled} pending commands cancelled")
     return make_response(success_msg, 200)
 
+
+@app.route('/verify')
+@login_required
+def api_verify():
+    # Per-line read-back health and sweep counters
+    return jsonify(verifier.snapshot())
+
+
+@app.route('/queue')
+@login_required
+def api_queue_metrics():
+    return jsonify(writer.metrics())
+
 @app.route('/reboot/<int:relay>')
 @login_required
 def api_relay_reboot(relay, sleep_time=3):
     print("Executing api_relay_reboot:", relay)
     if validate_relay(relay):
         print("valid relay")
-        relay_off(relay)
-        time.sleep(sleep_time)
-        relay_on(relay)
+        reboot_relay(relay, sleep_time)
         return make_response(success_msg, 200)
     else:
         print("invalid relay")
@@ -204,8 +695,39 @@ def internal_error(error):
 def forbidden_error(error):
     return render_template('500.html'), 403
 
+@app.errorhandler(QueueFull)
+def queue_full_error(error):
+    print(f"Rejecting command: {error}")
+    response = make_response(busy_msg, 429)
+    response.headers['Retry-After'] = '1'
+    return response
+
+@app.errorhandler(Preempted)
+def preempted_error(error):
+    print(f"Command preempted: {error}")
+    return make_response(preempted_msg, 409)
+
+@app.errorhandler(InterlockError)
+def interlock_error(error):
+    print(f"Command rejected: {error}")
+    return make_response(interlock_msg.format(reason=json.dumps(str(error))), 409)
+
+# Optional MQTT bridge, enabled by setting MQTT_HOST
+mqtt_bridge = bridge_from_env(NUM_RELAY_PORTS, {
+    'on': lambda relay: writer.run(relay_on, relay),
+    'off': lambda relay: writer.run(relay_off, relay),
+    'toggle': lambda relay: writer.run(relay_toggle_port, relay),
+    'all': lambda on: switch_all_on() if on else switch_all_off(),
+    'scene': lambda name: writer.run(apply_scene, name),
+})
+if mqtt_bridge:
+    add_state_listener(mqtt_bridge.on_state_change)
+    mqtt_bridge.on_state_change(relay_get_status_mask())
+    atexit.register(mqtt_bridge.stop)
+
 if __name__ == "__main__":
     # On the Pi, you need to run the app using this command to make sure it
     # listens for requests outside of the device.
-    print("Starting Relay Controller server on all interfaces (0.0.0.0:5000)")
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    port = int(os.environ.get('RELAY_HTTP_PORT', 5000))
+    print(f"Starting Relay Controller server on all interfaces (0.0.0.0:{port})")
+    app.run(host='0.0.0.0', port=port, debug=False)
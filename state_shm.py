@@ -0,0 +1,207 @@
+"""Shared-memory relay state page.
+
+The process that owns the relays publishes the current state into a small
+memory-mapped file (``/dev/shm/relay_controller_state`` by default) so that
+monitoring sidecars, ``check_system.py`` or extra web workers can read it
+without an HTTP round trip or parsing ``relay_states.json``.
+
+Updates are protected by a seqlock: the writer makes the sequence counter odd
+before touching the page and even again afterwards, and readers retry until
+they see the same even counter before and after copying the page, yielding
+the CPU between attempts.  Readers never take a lock and, unless they catch
+the writer mid-update, never make a system call once the file is mapped.
+Writers in the owning process are serialized by a lock, because two
+interleaved updates would leave the counter even over a half-written page.
+
+Page layout (little endian)::
+
+    0   4s   magic b"RLYS"
+    4   u32  layout version
+    8   u64  seqlock counter
+    16  u64  state version (incremented on every publish)
+    24  u64  last update, ns since the epoch
+    32  u64  writer start time, ns since the epoch
+    40  u32  writer pid
+    44  u32  number of relays
+    48  ...  relay bits, bit n set = relay n+1 ON
+"""
+
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+MAGIC = b'RLYS'
+LAYOUT_VERSION = 1
+HEADER = struct.Struct('<4sIQQQQII')
+SEQ = struct.Struct('<Q')
+SEQ_OFFSET = 8
+# Room for 4096 relays; the page never grows so readers can map it once
+MAX_RELAYS = 4096
+PAGE_SIZE = HEADER.size + MAX_RELAYS // 8
+# Seconds a reader keeps retrying before it assumes the writer died mid-update
+READ_TIMEOUT = 0.5
+
+
+def default_path():
+    """Return the shared-memory file path, honouring ``RELAY_STATE_SHM``."""
+    path = os.environ.get('RELAY_STATE_SHM')
+    if path:
+        return path
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'relay_controller_state')
+
+
+class StatePage(object):
+    """Writer side of the shared state page (used by the owning process)."""
+
+    def __init__(self, num_relays, path=None):
+        if not 0 < num_relays <= MAX_RELAYS:
+            raise ValueError(f"num_relays must be between 1 and {MAX_RELAYS}")
+        self.path = path or default_path()
+        self.num_relays = num_relays
+        self.version = 0
+        self.started_ns = time.time_ns()
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, PAGE_SIZE)
+            self._map = mmap.mmap(fd, PAGE_SIZE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._write(b'\x00' * (MAX_RELAYS // 8), 0)
+        print(f"Publishing relay state to {self.path}")
+
+    def publish(self, states):
+        """Publish a new state vector.
+
+        Args:
+            states (iterable): One truthy value per relay, True meaning ON.
+        """
+        bits = 0
+        for index, state in enumerate(states):
+            if state:
+                bits |= 1 << index
+        self.publish_bits(bits)
+
+    def publish_bits(self, bits):
+        """Publish a state vector given as an integer bitmask (any thread)."""
+        payload = bits.to_bytes(MAX_RELAYS // 8, 'little')
+        with self._lock:
+            self.version += 1
+            self._write(payload, time.time_ns())
+
+    def _write(self, payload, updated_ns):
+        # Callers hold self._lock (or run before the page is shared)
+        self._seq += 1  # odd: update in progress
+        SEQ.pack_into(self._map, SEQ_OFFSET, self._seq)
+        HEADER.pack_into(self._map, 0, MAGIC, LAYOUT_VERSION, self._seq, self.version,
+                         updated_ns, self.started_ns, os.getpid(), self.num_relays)
+        self._map[HEADER.size:PAGE_SIZE] = payload
+        self._seq += 1  # even: page is consistent again
+        SEQ.pack_into(self._map, SEQ_OFFSET, self._seq)
+
+    def close(self, unlink=True):
+        """Unmap the page and, by default, remove the file."""
+        self._map.close()
+        if unlink:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+class StateReader(object):
+    """Lock-free reader for the shared state page.
+
+    Keep one reader around and call `read()` as often as needed; only the
+    constructor touches the file system.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_path()
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            self._map = mmap.mmap(fd, PAGE_SIZE, mmap.MAP_SHARED, mmap.PROT_READ)
+        finally:
+            os.close(fd)
+        if self._map[:4] != MAGIC:
+            self._map.close()
+            raise ValueError(f"{self.path} is not a relay state page")
+
+    def read(self, timeout=READ_TIMEOUT):
+        """Return a consistent snapshot of the page as a dict.
+
+        Retries yield the CPU, so a writer that was descheduled in the middle
+        of an update gets to finish it.
+
+        Raises:
+            RuntimeError: If no consistent copy could be taken within
+                ``timeout`` seconds, which only happens when the writer died
+                in the middle of an update.
+        """
+        page = self._map
+        deadline = None
+        while True:
+            before = SEQ.unpack_from(page, SEQ_OFFSET)[0]
+            if not before & 1:
+                data = page[:PAGE_SIZE]
+                if SEQ.unpack_from(page, SEQ_OFFSET)[0] == before:
+                    break
+            # Only a contended read ever gets here and looks at the clock
+            if deadline is None:
+                deadline = time.monotonic() + timeout
+            elif time.monotonic() > deadline:
+                raise RuntimeError("Could not read a consistent relay state snapshot")
+            time.sleep(0)
+
+        magic, layout, _, version, updated_ns, started_ns, pid, count = HEADER.unpack_from(data)
+        bits = int.from_bytes(data[HEADER.size:], 'little')
+        return {
+            'version': version,
+            'updated_ns': updated_ns,
+            'started_ns': started_ns,
+            'pid': pid,
+            'num_relays': count,
+            'bits': bits,
+            'states': [bool(bits >> index & 1) for index in range(count)],
+        }
+
+    def close(self):
+        self._map.close()
+
+
+def read_state(path=None):
+    """Convenience helper: open the page, take one snapshot and close it."""
+    reader = StateReader(path)
+    try:
+        return reader.read()
+    finally:
+        reader.close()
+
+
+def writer_alive(snapshot):
+    """Return True if the process that published ``snapshot`` still exists."""
+    try:
+        os.kill(snapshot['pid'], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+if __name__ == "__main__":
+    snapshot = read_state()
+    age = (time.time_ns() - snapshot['updated_ns']) / 1e9 if snapshot['updated_ns'] else None
+    print(f"version {snapshot['version']}, pid {snapshot['pid']} "
+          f"({'running' if writer_alive(snapshot) else 'not running'})")
+    if age is not None:
+        print(f"last update {age:.3f}s ago")
+    for index, state in enumerate(snapshot['states']):
+        print(f"Relay {index + 1}: {'ON' if state else 'OFF'}")
@@ -1,35 +1,218 @@
-NUM_RELAY_PORTS = 16;
+NUM_RELAY_PORTS = 0;
 
-// Update relay visual status
-function updateRelayStatus(relay, isOn) {
-    const indicator = document.getElementById(`status-indicator-${relay}`);
-    const text = document.getElementById(`status-text-${relay}`);
-
-    if (indicator && text) {
-        if (isOn) {
-            indicator.className = 'status-indicator on';
-            text.className = 'status-text on';
-            text.textContent = 'مُشغل';
-        } else {
-            indicator.className = 'status-indicator off';
-            text.className = 'status-text off';
-            text.textContent = 'مُطفأ';
+// Dashboard model: built from one /relays request, then kept current from
+// /status?since=<version> long polls.  Relays are numbered from 1.
+var relayBanks = [];          // [{name, relays: [{channel, name}]}]
+var relayOn = [];             // relayOn[n] = true when relay n is on
+var relayMask = 0n;
+var stateVersion = null;
+
+// Cards only exist for banks near the viewport; the rest are placeholders
+var bankSections = [];        // [{bank, relays, element, body, rendered, height}]
+var renderedCards = {};       // relay -> card element
+var bankObserver = null;
+
+// DOM writes are queued and applied once per animation frame
+var pendingStatus = new Map();    // relay -> isOn
+var pendingLoading = new Map();   // relay -> loading
+var frameRequested = false;
+
+function scheduleFrame() {
+    if (!frameRequested) {
+        frameRequested = true;
+        requestAnimationFrame(flushFrame);
+    }
+}
+
+function flushFrame() {
+    frameRequested = false;
+    pendingStatus.forEach(function (isOn, relay) {
+        const card = renderedCards[relay];
+        if (card) {
+            paintStatus(card, isOn);
+        }
+    });
+    pendingLoading.forEach(function (loading, relay) {
+        const card = renderedCards[relay];
+        if (card) {
+            card.classList.toggle('loading', loading);
         }
+    });
+    pendingStatus.clear();
+    pendingLoading.clear();
+    updateSummary();
+    if ($('#on-only').prop('checked')) {
+        // Relays switching on/off change what the filter shows
+        rebuildBanks();
     }
 }
 
+function paintStatus(card, isOn) {
+    const indicator = card.querySelector('.status-indicator');
+    const text = card.querySelector('.status-text');
+    indicator.className = 'status-indicator ' + (isOn ? 'on' : 'off');
+    text.className = 'status-text ' + (isOn ? 'on' : 'off');
+    text.textContent = isOn ? 'مُشغل' : 'مُطفأ';
+}
+
+// Update relay visual status
+function updateRelayStatus(relay, isOn) {
+    relayOn[relay] = isOn;
+    pendingStatus.set(relay, isOn);
+    scheduleFrame();
+}
+
 // Set loading state for relay
 function setRelayLoading(relay, loading) {
-    const card = document.getElementById(`relay-card-${relay}`);
-    if (card) {
-        if (loading) {
-            card.classList.add('loading');
-        } else {
-            card.classList.remove('loading');
+    pendingLoading.set(relay, loading);
+    scheduleFrame();
+}
+
+function setAllLoading(loading) {
+    for (let i = 1; i <= NUM_RELAY_PORTS; i++) {
+        pendingLoading.set(i, loading);
+    }
+    scheduleFrame();
+}
+
+// Apply a new state mask, touching only the relays whose bit changed
+function applyMask(hex, version) {
+    const mask = BigInt(hex);  // relay_mask.to_hex already adds the 0x
+    let changed = mask ^ relayMask;
+    relayMask = mask;
+    stateVersion = version;
+    for (let relay = 1; changed; relay++, changed >>= 1n) {
+        if (changed & 1n) {
+            updateRelayStatus(relay, Boolean((mask >> BigInt(relay - 1)) & 1n));
+        }
+    }
+}
+
+function updateSummary() {
+    let on = 0;
+    for (let i = 1; i <= NUM_RELAY_PORTS; i++) {
+        if (relayOn[i]) {
+            on++;
+        }
+    }
+    $('#relay-summary').text(on + ' / ' + NUM_RELAY_PORTS + ' مُشغل');
+}
+
+// ---------------------------------------------------------------------
+// Banks, filtering and virtualized rendering
+// ---------------------------------------------------------------------
+
+function columnsPerRow() {
+    if (window.innerWidth >= 1200) {
+        return 3;
+    }
+    return window.innerWidth >= 992 ? 2 : 1;
+}
+
+function filteredRelays(bank) {
+    const query = $('#relay-filter').val().trim().toLowerCase();
+    const bankName = $('#bank-filter').val();
+    const onOnly = $('#on-only').prop('checked');
+    if (bankName && bank.name !== bankName) {
+        return [];
+    }
+    return bank.relays.filter(function (relay) {
+        if (onOnly && !relayOn[relay.channel]) {
+            return false;
+        }
+        return !query || relay.name.toLowerCase().includes(query) || String(relay.channel) === query;
+    });
+}
+
+function rebuildBanks() {
+    const container = document.getElementById('relay-banks');
+    if (bankObserver) {
+        bankObserver.disconnect();
+    }
+    renderedCards = {};
+    bankSections = [];
+    const fragment = document.createDocumentFragment();
+    relayBanks.forEach(function (bank) {
+        const relays = filteredRelays(bank);
+        if (!relays.length) {
+            return;
         }
+        const element = document.createElement('section');
+        element.className = 'bank-section';
+        element.innerHTML = '<div class="bank-header"><h2></h2><span class="bank-count"></span></div>' +
+            '<div class="row bank-body"></div>';
+        element.querySelector('h2').textContent = bank.name;
+        element.querySelector('.bank-count').textContent = relays.length + ' ريلي';
+        const section = {
+            bank: bank,
+            relays: relays,
+            element: element,
+            body: element.querySelector('.bank-body'),
+            rendered: false,
+            height: Math.ceil(relays.length / columnsPerRow()) * 290
+        };
+        section.body.style.minHeight = section.height + 'px';
+        element.dataset.index = bankSections.length;
+        bankSections.push(section);
+        fragment.appendChild(element);
+    });
+    container.replaceChildren(fragment);
+
+    bankObserver = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            const section = bankSections[entry.target.dataset.index];
+            if (entry.isIntersecting) {
+                renderBank(section);
+            } else {
+                unrenderBank(section);
+            }
+        });
+    }, {rootMargin: '800px 0px'});
+    bankSections.forEach(function (section) {
+        bankObserver.observe(section.element);
+    });
+}
+
+function renderBank(section) {
+    if (section.rendered) {
+        return;
     }
+    const template = document.getElementById('relay-card-template').content;
+    const fragment = document.createDocumentFragment();
+    section.relays.forEach(function (relay) {
+        const column = template.cloneNode(true).firstElementChild;
+        const card = column.querySelector('.relay-card');
+        card.id = 'relay-card-' + relay.channel;
+        card.dataset.relay = relay.channel;
+        card.querySelector('.relay-name').textContent = relay.name;
+        card.querySelector('.relay-number').textContent = 'ريلي ' + relay.channel;
+        paintStatus(card, Boolean(relayOn[relay.channel]));
+        renderedCards[relay.channel] = card;
+        fragment.appendChild(column);
+    });
+    section.body.replaceChildren(fragment);
+    section.body.style.minHeight = '';
+    section.rendered = true;
 }
 
+function unrenderBank(section) {
+    if (!section.rendered) {
+        return;
+    }
+    // Keep the measured height so the scroll position does not jump
+    section.height = section.body.offsetHeight;
+    section.body.style.minHeight = section.height + 'px';
+    section.relays.forEach(function (relay) {
+        delete renderedCards[relay.channel];
+    });
+    section.body.replaceChildren();
+    section.rendered = false;
+}
+
+// ---------------------------------------------------------------------
+// Commands
+// ---------------------------------------------------------------------
+
 function setRelay(relay, status) {
     console.log("Executing setRelay");
     // Add loading state
@@ -66,30 +249,28 @@ function setAll(status) {
 
 function toggleAll() {
     console.log("Executing toggleAll");
-    for (var i = 1; i < NUM_RELAY_PORTS + 1; i++) {
-        toggleRelay(i);
-    }
+    setAllLoading(true);
+    callApi('toggle_all/');
 }
 
-// API call for specific relay
+// Rejected commands explain themselves, e.g. {msg:"interlock",reason:"..."}
+function failureText(xhr, fallback) {
+    var match = /reason:("(?:[^"\\]|\\.)*")/.exec(xhr.responseText || '');
+    return match ? "Rejected: " + JSON.parse(match[1]) : fallback;
+}
+
+// API call for specific relay; the new state arrives through watchStatus()
 function callApiForRelay(url, relay) {
     console.log("Executing callApiForRelay for relay " + relay);
-    $.get(url, function () {
-        console.log("Sent request to server");
-    }).done(function () {
+    $.get(url).done(function () {
         console.log("Completed request for relay " + relay);
-        // Remove loading state and update status for this specific relay
-        setTimeout(function() {
-            setRelayLoading(relay, false);
-            getRelayStatus(relay);
-        }, 300);
-    }).fail(function () {
+        setRelayLoading(relay, false);
+    }).fail(function (xhr) {
         console.error("Relay status failure for relay " + relay);
-        // Remove loading state
         setRelayLoading(relay, false);
         Swal.fire({
             title: "Pi Relay Controller",
-            text: "Failed to communicate with relay " + relay,
+            text: failureText(xhr, "Failed to communicate with relay " + relay),
             icon: "error"
         });
     });
@@ -98,26 +279,15 @@ function callApiForRelay(url, relay) {
 // API call for all relays (used by setAll function)
 function callApi(url) {
     console.log("Executing callApi");
-    $.get(url, function () {
-        console.log("Sent request to server");
-    }).done(function () {
+    $.get(url).done(function () {
         console.log("Completed request");
-        // Remove loading state and update status for all relays
-        setTimeout(function() {
-            for (let i = 1; i <= NUM_RELAY_PORTS; i++) {
-                setRelayLoading(i, false);
-                getRelayStatus(i);
-            }
-        }, 500);
-    }).fail(function () {
+        setAllLoading(false);
+    }).fail(function (xhr) {
         console.error("Relay status failure");
-        // Remove loading state
-        for (let i = 1; i <= NUM_RELAY_PORTS; i++) {
-            setRelayLoading(i, false);
-        }
+        setAllLoading(false);
         Swal.fire({
             title: "Pi Relay Controller",
-            text: "Server returned an error",
+            text: failureText(xhr, "Server returned an error"),
             icon: "error"
         });
     });
@@ -125,9 +295,7 @@ function callApi(url) {
 
 function getRelayStatus(relay, showAlert = false) {
     console.log("Executing getRelayStatus for relay " + relay);
-    $.get('status/' + relay, function () {
-        console.log("Sent request to server");
-    }).done(function (res) {
+    $.get('status/' + relay).done(function (res) {
         console.log("Completed request for relay " + relay + ", status: " + res);
         const isOn = parseInt(res) > 0;
         updateRelayStatus(relay, isOn);
@@ -160,24 +328,81 @@ function showRelayStatus(relay) {
     getRelayStatus(relay, true);
 }
 
-// Load all relay statuses on page load
+// ---------------------------------------------------------------------
+// State loading
+// ---------------------------------------------------------------------
+
+// Layout and state of every relay with a single bulk request
 function loadAllStatuses() {
-    for (let i = 1; i <= NUM_RELAY_PORTS; i++) {
-        getRelayStatus(i, false);
-    }
+    console.log("Executing loadAllStatuses");
+    return $.getJSON('relays').done(function (res) {
+        NUM_RELAY_PORTS = res.count;
+        relayBanks = res.banks;
+        relayOn = [];
+        relayMask = 0n;
+        applyMask(res.mask, res.version);
+
+        const select = $('#bank-filter');
+        select.find('option:not(:first)').remove();
+        relayBanks.forEach(function (bank) {
+            select.append($('<option>').val(bank.name).text(bank.name));
+        });
+        rebuildBanks();
+        updateSummary();
+    }).fail(function () {
+        console.error("Bulk relay status failure");
+    });
+}
+
+// Long poll for changes; each answer carries the whole mask, but only the
+// relays whose bit changed are repainted
+function watchStatus() {
+    $.getJSON('status', {since: stateVersion, timeout: 25}).done(function (res) {
+        if (res.version !== stateVersion) {
+            applyMask(res.mask, res.version);
+        }
+        watchStatus();
+    }).fail(function () {
+        console.error("Status watch failure, retrying");
+        setTimeout(watchStatus, 2000);
+    });
 }
 
 // Initialize when page loads
 $(document).ready(function() {
-    console.log("Page loaded, updating relay statuses...");
-    // Load statuses after a short delay to ensure page is fully loaded
-    setTimeout(loadAllStatuses, 1500);
+    console.log("Page loaded, loading relays...");
+    loadAllStatuses().done(watchStatus);
+
+    // One delegated handler for every card button
+    $('#relay-banks').on('click', '.control-btn', function () {
+        const button = $(this);
+        const relay = parseInt(button.closest('.relay-card').data('relay'));
+        const action = button.data('action');
+        if (action === 'toggle') {
+            toggleRelay(relay);
+        } else if (action === 'status') {
+            showRelayStatus(relay);
+        } else {
+            setRelay(relay, action);
+        }
+    });
 
-    // Add click handlers to prevent double-clicking
-    $('.control-btn').on('click', function() {
+    // Prevent double-clicking
+    $(document).on('click', '.control-btn', function() {
         $(this).prop('disabled', true);
         setTimeout(() => {
             $(this).prop('disabled', false);
         }, 1000);
     });
+
+    let filterTimer = null;
+    $('#relay-filter').on('input', function () {
+        clearTimeout(filterTimer);
+        filterTimer = setTimeout(rebuildBanks, 150);
+    });
+    $('#bank-filter, #on-only').on('change', rebuildBanks);
+    $(window).on('resize', function () {
+        clearTimeout(filterTimer);
+        filterTimer = setTimeout(rebuildBanks, 250);
+    });
 });
@@ -0,0 +1,61 @@
+"""Shared test setup.
+
+Everything runs against the simulated gpiochip (`gpio_sim`), with the state
+files in a throw-away directory, so the suite never touches real relays.
+The environment is set here because relay_lib reads it at import time.
+"""
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'client'))  # the in-tree relay_client
+
+STATE_DIR = tempfile.mkdtemp(prefix='relay-controller-tests-')
+shutil.copy(os.path.join(ROOT, 'channels.json'), STATE_DIR)
+os.environ.update({
+    'RELAY_GPIO_BACKEND': 'sim',
+    'RELAY_SIM_RELAYS': '16',
+    'RELAY_CONTROLLER_DIR': STATE_DIR,
+    'RELAY_STATE_SHM': os.path.join(STATE_DIR, 'relay_controller_state'),
+})
+os.environ.pop('MQTT_HOST', None)
+# Registered before the server's own exit handlers, so it runs after them
+atexit.register(shutil.rmtree, STATE_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def wait_for():
+    """Poll ``condition()`` until it is truthy; fail after ``timeout`` seconds."""
+    def wait(condition, timeout=2.0, interval=0.005):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                pytest.fail("condition not met within %.1fs" % timeout)
+            time.sleep(interval)
+    return wait
+
+
+@pytest.fixture(scope='session')
+def server():
+    """The Flask app module, imported once on the simulated board."""
+    import server
+    return server
+
+
+@pytest.fixture
+def client(server):
+    """A logged-in test client; every relay starts off."""
+    import relay_mask
+    server.writer.run(server.relay_apply_mask, off_mask=relay_mask.full(server.NUM_RELAY_PORTS))
+    client = server.app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+    return client
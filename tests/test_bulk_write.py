@@ -0,0 +1,29 @@
+"""/set: several relays in one request and one bulk write."""
+
+import relay_lib
+import relay_mask
+
+
+def test_set_switches_on_and_off_together(server, client):
+    assert client.get('/set?on=1,2,7').status_code == 200
+    assert client.get('/set?on=3&off=1,7').status_code == 200
+    assert server.relay_get_status_mask() == relay_mask.from_relays([2, 3])
+
+
+def test_set_refuses_a_relay_in_both_lists(server, client):
+    assert client.get('/set?on=1,2&off=2').status_code == 400
+    assert server.relay_get_status_mask() == 0
+
+
+def test_set_refuses_bad_relays(server, client):
+    assert client.get('/set?on=1,x').status_code == 400
+    assert client.get('/set?on=1,17').status_code == 404
+    assert server.relay_get_status_mask() == 0
+
+
+def test_all_off_clears_only_the_ports_it_is_given(server, client, monkeypatch):
+    monkeypatch.setattr(relay_lib, 'DELAY_TIME', 0)
+    ports = relay_lib.RELAY_PORTS
+    assert client.get('/set?on=1,2,3,4').status_code == 200
+    server.writer.run(relay_lib.relay_all_off, [ports[3], ports[2]])
+    assert server.relay_get_status_mask() == relay_mask.from_relays([1, 2])
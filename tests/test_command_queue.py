@@ -0,0 +1,100 @@
+"""Writer thread priorities, backpressure and preemption."""
+
+import threading
+import time
+
+import pytest
+
+from command_queue import (EMERGENCY, INTERACTIVE, SCHEDULED, CommandQueue, Preempted,
+                           QueueFull)
+
+
+@pytest.fixture
+def queue():
+    return CommandQueue(maxsize=4).start()
+
+
+@pytest.fixture
+def blocked(queue):
+    """Hold the writer until the test sets the returned event."""
+    running, gate = threading.Event(), threading.Event()
+
+    def hold():
+        running.set()
+        gate.wait(5)
+
+    command = queue.submit(hold)
+    running.wait(5)
+    yield gate
+    gate.set()
+    command.wait(5)
+
+
+def test_emergency_first_then_by_priority(queue, blocked):
+    order = []
+    commands = [queue.submit(order.append, name, priority=priority)
+                for name, priority in (('scheduled', SCHEDULED), ('interactive', INTERACTIVE),
+                                       ('emergency', EMERGENCY), ('interactive 2', INTERACTIVE))]
+    blocked.set()
+    for command in commands:
+        command.wait(5)
+    assert order == ['emergency', 'interactive', 'interactive 2', 'scheduled']
+
+
+def test_full_queue_rejects_all_but_emergencies(queue, blocked):
+    for _ in range(queue.maxsize):
+        queue.submit(time.sleep, 0)
+    with pytest.raises(QueueFull):
+        queue.submit(time.sleep, 0)
+    queue.submit(time.sleep, 0, priority=EMERGENCY, interrupt=False)
+    assert queue.stats['rejected'] == 1
+
+
+def test_emergency_interrupts_a_running_command(queue):
+    running = queue.submit(queue.step_sleep, 5)
+    time.sleep(0.05)
+    started = time.monotonic()
+    queue.run(lambda: None, priority=EMERGENCY)
+    with pytest.raises(Preempted):
+        running.wait(1)
+    assert time.monotonic() - started < 1
+
+
+def test_sequence_steps_stop_after_an_emergency(queue):
+    steps = queue.steps()
+    steps.run(lambda: None)
+    # A non-interrupting emergency (e.g. a lease expiry) lets the sequence go on
+    queue.run(lambda: None, priority=EMERGENCY, interrupt=False)
+    steps.sleep(0)
+
+    threading.Timer(0.05, queue.submit, (lambda: None,), {'priority': EMERGENCY}).start()
+    started = time.monotonic()
+    with pytest.raises(Preempted):
+        steps.sleep(5)
+    assert time.monotonic() - started < 1
+    with pytest.raises(Preempted):
+        steps.run(lambda: None)
+
+
+def test_emergency_stop_interrupts_a_reboot(server, client):
+    results = {}
+
+    def reboot():
+        rebooting = server.app.test_client()
+        with rebooting.session_transaction() as session:
+            session['logged_in'] = True
+        results['reboot'] = rebooting.get('/reboot/3').status_code
+
+    assert client.get('/on/3').status_code == 200
+    thread = threading.Thread(target=reboot)
+    thread.start()
+    time.sleep(0.2)  # the reboot is in its 3 s pause, off the writer
+    started = time.monotonic()
+    assert client.get('/on/5').status_code == 200  # the writer is free meanwhile
+    assert client.get('/emergency_stop/').status_code == 200
+    thread.join(5)
+
+    assert results['reboot'] == 409
+    assert time.monotonic() - started < 1
+    # Relay 3 is not switched back on after the emergency stop
+    assert server.relay_get_status_mask() == 0
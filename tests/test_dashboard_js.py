@@ -0,0 +1,42 @@
+"""The dashboard's mask handling, run in node on the real /relays payload."""
+
+import json
+import os
+import re
+import shutil
+import subprocess
+
+import pytest
+
+from conftest import ROOT
+
+NODE = shutil.which('node')
+
+HARNESS = """
+var relayMask = 0n, stateVersion = null, updates = [];
+function updateRelayStatus(relay, isOn) { updates.push([relay, isOn]); }
+%s
+var payload = JSON.parse(process.argv[1]);
+applyMask(payload.mask, payload.version);
+console.log(JSON.stringify({updates: updates, version: stateVersion}));
+"""
+
+
+def apply_mask_source():
+    with open(os.path.join(ROOT, 'static', 'js', 'index.js'), newline='') as f:
+        source = f.read()
+    return re.search(r'^function applyMask\(.*?^}', source, re.M | re.S).group(0)
+
+
+@pytest.mark.skipif(NODE is None, reason="node is not installed")
+def test_apply_mask_reads_the_relays_payload(server, client):
+    assert client.get('/set?on=1,3').status_code == 200
+    payload = client.get('/relays').get_json()
+    assert payload['mask'].startswith('0x')
+
+    result = subprocess.run([NODE, '-e', HARNESS % apply_mask_source(), json.dumps(payload)],
+                            capture_output=True, text=True, timeout=30)
+    assert result.returncode == 0, result.stderr
+    output = json.loads(result.stdout)
+    assert output['updates'] == [[1, True], [3, True]]
+    assert output['version'] == payload['version']
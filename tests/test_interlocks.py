@@ -0,0 +1,74 @@
+"""Interlock rules: compilation, the check, and rejection through the API."""
+
+import pytest
+
+import relay_lib
+import relay_mask
+from interlock import InterlockError, Interlocks
+from relay_client._protocol import InterlockRejected, check_command
+
+RULES = [
+    {'name': 'Heater "A" / cooler', 'exclusive': [3, 4]},
+    {'name': 'CCD supply', 'relay': 2, 'requires': [7]},
+]
+
+
+@pytest.fixture
+def rules(server, monkeypatch):
+    """Install RULES on the running server for one test."""
+    compiled = Interlocks(RULES, server.NUM_RELAY_PORTS)
+    monkeypatch.setattr(server, 'interlocks', compiled)
+    monkeypatch.setattr(relay_lib, 'INTERLOCKS', compiled)
+    return compiled
+
+
+def test_exclusive_and_requires():
+    rules = Interlocks(RULES, 16)
+    bits = relay_mask.from_relays
+    assert rules.violation(bits([3]), on_mask=bits([4]))
+    assert rules.violation(0, on_mask=bits([3, 4]))
+    assert rules.violation(bits([3]), on_mask=bits([4]), off_mask=bits([3])) is None
+    assert rules.violation(0, on_mask=bits([2]))
+    assert rules.violation(0, on_mask=bits([2, 7])) is None
+    # Switching off is never blocked, even from a state that breaks a rule
+    assert rules.violation(bits([2, 3, 4]), off_mask=bits([2, 3, 4])) is None
+
+
+@pytest.mark.parametrize('rule', [
+    {'exclusive': [3]},
+    {'exclusive': [3, 17]},
+    {'relay': 2, 'requires': [2]},
+    {'relays': [1, 2]},
+])
+def test_invalid_rules_are_refused(rule):
+    with pytest.raises(InterlockError):
+        Interlocks([rule], 16)
+
+
+def test_api_rejects_with_reason(server, client, rules):
+    assert client.get('/on/3').status_code == 200
+    response = client.get('/on/4')
+    assert response.status_code == 409
+    with pytest.raises(InterlockRejected) as rejected:
+        check_command(response.status_code, response.get_data(as_text=True), response.headers)
+    assert 'Heater "A" / cooler' in rejected.value.reason
+    assert server.relay_get_status_mask() == relay_mask.bit(3)
+
+
+def test_bulk_write_is_all_or_nothing(server, client, rules):
+    assert client.get('/set?on=1,2').status_code == 409
+    assert server.relay_get_status_mask() == 0
+    assert client.get('/set?on=2,7').status_code == 200
+    assert server.relay_get_status_mask() == relay_mask.from_relays([2, 7])
+
+
+def test_all_on_checks_the_relays_it_switches(server, client, monkeypatch):
+    monkeypatch.setattr(relay_lib, 'DELAY_TIME', 0)
+    monkeypatch.setattr(relay_lib, 'INTERLOCKS', Interlocks([{'exclusive': [1, 2]}], 16))
+    ports = relay_lib.RELAY_PORTS
+    # Relays 3 and 4 only: the rule on 1 and 2 is not involved
+    server.writer.run(relay_lib.relay_all_on, [ports[2], ports[3]])
+    assert server.relay_get_status_mask() == relay_mask.from_relays([3, 4])
+    with pytest.raises(InterlockError):
+        server.writer.run(relay_lib.relay_all_on, [ports[0], ports[1]])
+    assert server.relay_get_status_mask() == relay_mask.from_relays([3, 4])
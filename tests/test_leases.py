@@ -0,0 +1,134 @@
+"""Auto-off leases: expiry, coalescing, restore and the re-grant race."""
+
+import json
+import threading
+import time
+
+import pytest
+
+import relay_mask
+from lease import MAX_LEASE, LeaseTable
+
+
+@pytest.fixture
+def expired():
+    return []
+
+
+@pytest.fixture
+def table(expired):
+    table = LeaseTable(expire=expired.append)
+    table.start()
+    return table
+
+
+def test_due_leases_expire_in_one_write(table, expired, wait_for):
+    table.grant(1, 0.05)
+    table.grant(2, 0.05)
+    table.grant(3, 30)
+    wait_for(lambda: expired)
+    assert expired == [relay_mask.from_relays([1, 2])]
+    assert table.leased_mask == relay_mask.bit(3)
+
+
+def test_renew_and_release(table, expired):
+    table.grant(1, 0.05)
+    table.renew(1, 30)
+    table.grant(2, 0.05)
+    table.release(relay_mask.bit(2))
+    with pytest.raises(KeyError):
+        table.renew(4)
+    time.sleep(0.1)
+    assert expired == []
+    assert list(table.active()) == [1]
+
+
+def test_restore_drops_leases_of_relays_that_are_off(tmp_path):
+    path = tmp_path / 'relay_leases.json'
+    path.write_text(json.dumps({'1': {'expires': 2e9, 'lease': 30},
+                                '2': {'expires': 2e9, 'lease': 30}}))
+    table = LeaseTable(expire=lambda mask: None, path=str(path))
+    assert table.load(on_mask=relay_mask.bit(2)) == 1
+    assert list(table.active()) == [2]
+
+
+def test_restore_drops_unusable_leases(tmp_path):
+    path = tmp_path / 'relay_leases.json'
+    path.write_text('{"1": {"expires": Infinity, "lease": Infinity},'
+                    ' "2": {"expires": 2e9, "lease": 30}}')
+    table = LeaseTable(expire=lambda mask: None, path=str(path))
+    assert table.load() == 1
+    assert list(table.active()) == [2]
+
+
+@pytest.mark.parametrize('seconds', [0, -1, float('inf'), float('nan'), MAX_LEASE + 1, None])
+def test_unusable_lengths_are_refused(table, seconds):
+    with pytest.raises(ValueError):
+        table.grant(1, seconds)
+    table.grant(2, 30)
+    with pytest.raises(ValueError):
+        table.renew(2, seconds if seconds is not None else 0)
+
+
+@pytest.mark.parametrize('lease', ['inf', '1e300', 'nan', '0', '-5', 'soon'])
+def test_api_refuses_unusable_leases(server, client, wait_for, lease):
+    assert client.get(f'/on/6?lease={lease}').status_code == 400
+    assert not relay_mask.is_set(server.relay_get_status_mask(), 6)
+    assert client.get('/on/6?lease=30').status_code == 200
+    assert client.get(f'/renew/6?lease={lease}').status_code == 400
+    # The timer thread is still alive: a short lease still runs out
+    assert client.get('/on/6?lease=0.05').status_code == 200
+    wait_for(lambda: not relay_mask.is_set(server.relay_get_status_mask(), 6))
+
+
+def test_lease_switches_relay_off(server, client, wait_for):
+    assert client.get('/on/5?lease=0.05').status_code == 200
+    assert relay_mask.is_set(server.relay_get_status_mask(), 5)
+    wait_for(lambda: not relay_mask.is_set(server.relay_get_status_mask(), 5))
+    assert client.get('/renew/5').status_code == 404
+
+
+def test_regranted_lease_is_not_cut_short(server, client, wait_for):
+    assert client.get('/on/5?lease=0.05').status_code == 200
+    writes = server.leases.stats['expiry_writes']
+
+    # Hold the writer so the expiry, once due, waits in the queue
+    running, gate = threading.Event(), threading.Event()
+
+    def hold():
+        running.set()
+        gate.wait(5)
+
+    holder = server.writer.submit(hold)
+    running.wait(5)
+    wait_for(lambda: not server.leases.leased_mask)
+    # Granted again (as by another /on/5?lease=) before the expiry write runs
+    server.leases.grant(5, 30)
+    gate.set()
+    holder.wait(5)
+    wait_for(lambda: server.leases.stats['expiry_writes'] == writes + 1)
+
+    assert relay_mask.is_set(server.relay_get_status_mask(), 5)
+    assert 5 in server.leases.active()
+    server.leases.release(relay_mask.bit(5))
+
+
+def test_wall_clock_steps_do_not_move_deadlines(tmp_path):
+    wall = [1.8e9]
+    path = str(tmp_path / 'relay_leases.json')
+    table = LeaseTable(expire=lambda mask: None, path=path, wall_clock=lambda: wall[0])
+    table.grant(1, 30)
+    deadline = table.leases[1][0]
+    assert table.active()[1]['expires'] == pytest.approx(1.8e9 + 30, abs=0.5)
+
+    wall[0] -= 3600  # e.g. NTP stepping the clock back an hour
+    assert table.leases[1][0] == deadline
+    assert table.active()[1]['remaining'] == pytest.approx(30, abs=0.5)
+    table.flush()
+    with open(path) as f:
+        assert json.load(f)['1']['expires'] == pytest.approx(1.8e9 - 3600 + 30, abs=0.5)
+
+    # A restart converts the persisted epoch back to the same remaining time
+    restored = LeaseTable(expire=lambda mask: None, path=path, wall_clock=lambda: wall[0])
+    restored.load()
+    assert restored.active()[1]['remaining'] == pytest.approx(30, abs=0.5)
@@ -0,0 +1,106 @@
+"""MQTTBridge against the in-process LoopbackBroker."""
+
+import json
+
+import pytest
+
+from mqtt_bridge import LoopbackBroker, MQTTBridge
+
+PREFIX = 'relay_controller'
+
+
+@pytest.fixture
+def broker():
+    return LoopbackBroker()
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def bridge(broker, calls):
+    def scene(name):
+        if name != 'park':
+            return False
+        calls.append(('scene', name))
+
+    handlers = {
+        'on': lambda relay: calls.append(('on', relay)),
+        'off': lambda relay: calls.append(('off', relay)),
+        'toggle': lambda relay: calls.append(('toggle', relay)),
+        'all': lambda on: calls.append(('all', on)),
+        'scene': scene,
+    }
+    bridge = MQTTBridge(broker.client('relay_controller'), 16, handlers, batch_window=0.02)
+    bridge.start()
+    yield bridge
+    if bridge.client.is_connected():
+        bridge.stop()
+
+
+def retained(broker, *parts):
+    return broker.retained.get('/'.join((PREFIX,) + parts))
+
+
+def test_commands_reach_handlers(broker, bridge, calls, wait_for):
+    remote = broker.client('remote')
+    remote.loop_start()
+    remote.publish(PREFIX + '/relay/3/set', 'on')
+    remote.publish(PREFIX + '/relay/2/set', 'TOGGLE')
+    remote.publish(PREFIX + '/relay/99/set', 'ON')      # no such relay
+    remote.publish(PREFIX + '/relay/4/set', 'blink')    # unknown command
+    remote.publish(PREFIX + '/scene/set', 'observing')  # unknown scene
+    remote.publish(PREFIX + '/scene/set', 'park')
+    remote.publish(PREFIX + '/all/set', 'OFF')
+
+    wait_for(lambda: len(calls) == 4)
+    assert calls == [('on', 3), ('toggle', 2), ('scene', 'park'), ('all', False)]
+
+
+def test_state_is_published_retained(broker, bridge, wait_for):
+    wait_for(lambda: retained(broker, 'availability') == b'online')
+
+    bridge.on_state_change(0b101)
+    wait_for(lambda: retained(broker, 'relay', '16') is not None)
+
+    state = json.loads(retained(broker, 'state'))
+    assert state['on'] == [1, 3]
+    assert retained(broker, 'relay', '1') == b'ON'
+    assert retained(broker, 'relay', '2') == b'OFF'
+    assert retained(broker, 'relay', '3') == b'ON'
+
+    # A late subscriber gets the whole state from the retained topics
+    late = broker.client('late')
+    seen = {}
+    late.on_message = lambda client, userdata, message: seen.update({message.topic: message.payload})
+    late.loop_start()
+    late.subscribe(PREFIX + '/relay/+')
+    assert len(seen) == 16
+
+
+def test_burst_is_batched(broker, bridge, wait_for):
+    bridge.on_state_change(0)
+    wait_for(lambda: bridge.version == 1 and bridge.outbound.empty())
+
+    updates = []
+    watcher = broker.client('watcher')
+    watcher.on_message = lambda client, userdata, message: updates.append(message)
+    watcher.loop_start()
+    watcher.subscribe(PREFIX + '/relay/+')
+    del updates[:]  # retained replay
+
+    for mask in (0b1, 0b11, 0b111, 0b110):
+        bridge.on_state_change(mask)
+    wait_for(lambda: bridge.version == 2 and bridge.outbound.empty())
+
+    # One bank message and one message per relay that ended up changed
+    assert json.loads(retained(broker, 'state'))['on'] == [2, 3]
+    assert sorted(message.topic for message in updates) == [PREFIX + '/relay/2', PREFIX + '/relay/3']
+
+
+def test_will_marks_bridge_offline(broker, bridge, wait_for):
+    wait_for(lambda: retained(broker, 'availability') == b'online')
+    bridge.client.crash()
+    assert retained(broker, 'availability') == b'offline'
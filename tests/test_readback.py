@@ -0,0 +1,33 @@
+"""Read-back verification around the emergency stop."""
+
+import threading
+
+
+def test_emergency_stop_requeues_cancelled_sweeps(server, client, wait_for):
+    def states():
+        return {relay: line['state'] for relay, line in server.verifier.snapshot()['lines'].items()}
+
+    wait_for(lambda: 'pending' not in states().values())
+
+    # Hold the writer so the next sweep waits in the queue
+    running, gate = threading.Event(), threading.Event()
+
+    def hold():
+        running.set()
+        gate.wait(5)
+
+    holder = server.writer.submit(hold)
+    running.wait(5)
+    server.verifier.touch(1 << 8)  # relay 9
+    wait_for(lambda: server.writer.depth() == 1)
+
+    # The emergency stop drops the queued sweep, then waits for the writer
+    stop = threading.Thread(target=lambda: client.get('/emergency_stop/'))
+    stop.start()
+    wait_for(lambda: server.writer.depth() == 1 and server.writer.metrics()['depth_by_priority']['emergency'])
+    gate.set()
+    holder.wait(5)
+    stop.join(5)
+
+    wait_for(lambda: 'pending' not in states().values())
+    assert states()[9] == 'ok'
@@ -0,0 +1,76 @@
+"""Seqlock protocol of the shared state page."""
+
+import threading
+
+import pytest
+
+from state_shm import SEQ, SEQ_OFFSET, StatePage, StateReader
+
+FULL = (1 << 4096) - 1
+
+
+@pytest.fixture
+def page(tmp_path):
+    page = StatePage(16, path=str(tmp_path / 'state'))
+    yield page
+    page.close()
+
+
+def test_reader_sees_published_state(page):
+    page.publish([True, False, True])
+    reader = StateReader(page.path)
+    try:
+        snapshot = reader.read()
+    finally:
+        reader.close()
+    assert snapshot['version'] == 1
+    assert snapshot['states'][:4] == [True, False, True, False]
+    assert snapshot['num_relays'] == 16
+
+
+def test_reader_gives_up_on_a_half_written_page(page):
+    # A writer that died mid-update leaves the counter odd
+    SEQ.pack_into(page._map, SEQ_OFFSET, page._seq + 1)
+    reader = StateReader(page.path)
+    try:
+        with pytest.raises(RuntimeError):
+            reader.read(timeout=0.05)
+    finally:
+        reader.close()
+
+
+def test_concurrent_writers_and_reader(page):
+    writers, rounds = 4, 2000
+    torn, errors = [], []
+    stop = threading.Event()
+    reader = StateReader(page.path)
+
+    def read():
+        try:
+            while not stop.is_set():
+                bits = reader.read()['bits']
+                if bits not in (0, FULL):
+                    torn.append(bits)
+        except Exception as e:
+            errors.append(e)
+
+    def write(bits):
+        for _ in range(rounds):
+            page.publish_bits(bits)
+
+    reading = threading.Thread(target=read)
+    reading.start()
+    threads = [threading.Thread(target=write, args=(FULL if i & 1 else 0,)) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stop.set()
+    reading.join()
+    reader.close()
+
+    assert not errors
+    assert not torn
+    # No update was lost and the counter ended even (page consistent)
+    assert page.version == writers * rounds
+    assert SEQ.unpack_from(page._map, SEQ_OFFSET)[0] == 2 * (writers * rounds + 1)
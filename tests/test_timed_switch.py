@@ -0,0 +1,88 @@
+"""/switch_at: scheduled off the request thread, fired on the reserved writer."""
+
+import threading
+import time
+
+import relay_mask
+import timed_switch
+from timed_switch import MAX_AHEAD, STAGE_LEAD, realtime
+
+
+def record(client, switch_id):
+    response = client.get(f'/switch_at/{switch_id}')
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_switch_fires_at_target(server, client, wait_for):
+    target = realtime() + STAGE_LEAD + 0.05
+    response = client.get(f'/switch_at?t={target!r}&on=1,2&tag=test')
+    assert response.status_code == 202
+    scheduled = response.get_json()
+    assert scheduled['status'] == 'scheduled'
+    assert server.relay_get_status_mask() == 0
+
+    wait_for(lambda: record(client, scheduled['id'])['status'] != 'scheduled')
+    done = record(client, scheduled['id'])
+    assert done['status'] == 'done'
+    assert done['started'] >= target
+    assert done['tag'] == 'test'
+    assert server.relay_get_status_mask() == relay_mask.from_relays([1, 2])
+
+
+def test_targets_out_of_range_are_refused(server, client):
+    recent = server.switcher.recent()
+    now = realtime()
+    assert client.get(f'/switch_at?t={now + STAGE_LEAD / 2!r}&on=1').status_code == 400
+    assert client.get(f'/switch_at?t={now + MAX_AHEAD + 5!r}&on=1').status_code == 400
+    assert client.get('/switch_at?on=1').status_code == 400
+    for bad in ('nan', 'inf', '-inf'):
+        assert client.get(f'/switch_at?t={bad}&on=1').status_code == 400
+    assert server.switcher.recent() == recent
+    assert client.get('/switch_at/999999').status_code == 404
+
+
+def test_busy_writer_misses_instead_of_firing_late(server, client, wait_for):
+    target = realtime() + STAGE_LEAD + 0.05
+    scheduled = client.get(f'/switch_at?t={target!r}&on=3').get_json()
+
+    running, gate = threading.Event(), threading.Event()
+
+    def hold():
+        running.set()
+        gate.wait(5)
+
+    holder = server.writer.submit(hold)
+    running.wait(5)
+    wait_for(lambda: realtime() > target + 0.02)
+    gate.set()
+    holder.wait(5)
+
+    wait_for(lambda: record(client, scheduled['id'])['status'] != 'scheduled')
+    assert record(client, scheduled['id'])['status'] == 'missed'
+    assert server.relay_get_status_mask() == 0
+
+
+def test_emergency_stop_cancels_scheduled_switches(server, client, wait_for):
+    target = realtime() + STAGE_LEAD + 0.3
+    scheduled = client.get(f'/switch_at?t={target!r}&on=4').get_json()
+    assert client.get('/emergency_stop/').status_code == 200
+    assert record(client, scheduled['id'])['status'] == 'cancelled'
+    wait_for(lambda: realtime() > target + 0.05)
+    assert server.relay_get_status_mask() == 0
+
+
+def test_emergency_stop_interrupts_a_switch_holding_the_writer(server, client, wait_for,
+                                                                monkeypatch):
+    monkeypatch.setattr(timed_switch, 'STAGE_LEAD', 0.5)
+    target = realtime() + 0.7
+    scheduled = client.get(f'/switch_at?t={target!r}&on=4').get_json()
+    wait_for(lambda: server.writer.metrics()['running'] == 'emergency')
+
+    started = time.monotonic()
+    assert client.get('/emergency_stop/').status_code == 200
+    assert time.monotonic() - started < 0.3
+    assert realtime() < target
+    assert record(client, scheduled['id'])['status'] == 'cancelled'
+    wait_for(lambda: realtime() > target + 0.05)
+    assert server.relay_get_status_mask() == 0
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Coordinated Switching Spread Test
+=================================
+Starts several simulated controllers on this machine and measures how far
+apart their relays switch, first with /switch_at (every controller gets the
+same target time) and then with plain /set calls sent one after another.
+
+    python timed_spread.py --instances 4 --rounds 20
+
+The controllers share this machine's clock, so the spread measures the
+scheduling and busy-wait jitter of the servers; across Pis, add the clock
+offset between them (chronyc tracking / pmc shows it).
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def start_instances(count, base_port, relays):
+    """Start ``count`` sim-backed servers; returns [(process, url, workdir)]"""
+    instances = []
+    for i in range(count):
+        workdir = tempfile.mkdtemp(prefix=f'relay-spread-{i}-')
+        shutil.copy(os.path.join(HERE, 'channels.json'), workdir)
+        env = dict(os.environ,
+                   RELAY_GPIO_BACKEND='sim',
+                   RELAY_SIM_RELAYS=str(relays),
+                   RELAY_CONTROLLER_DIR=workdir,
+                   RELAY_STATE_SHM=os.path.join(workdir, 'relay_state.shm'),
+                   RELAY_HTTP_PORT=str(base_port + i))
+        env.pop('MQTT_HOST', None)
+        process = subprocess.Popen([sys.executable, os.path.join(HERE, 'server.py')], env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        instances.append((process, f'http://127.0.0.1:{base_port + i}', workdir))
+    return instances
+
+
+def stop_instances(instances):
+    for process, _, workdir in instances:
+        process.terminate()
+    for process, _, workdir in instances:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+class Session(object):
+    """A logged-in keep-alive-free urllib session with one controller"""
+
+    def __init__(self, url, username, password):
+        self.url = url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                self.opener.open(url + '/healthz', timeout=2).read()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{url} did not come up")
+                time.sleep(0.2)
+        data = urllib.parse.urlencode({'username': username, 'password': password}).encode()
+        self.opener.open(url + '/login', data, timeout=10).read()
+
+    def get(self, path, **params):
+        query = '?' + urllib.parse.urlencode(params) if params else ''
+        with self.opener.open(self.url + path + query, timeout=90) as response:
+            return response.read()
+
+
+def spread_ms(times):
+    return (max(times) - min(times)) * 1000
+
+
+def round_switch_at(sessions, lead, relay, on):
+    target = time.time() + lead
+    records = [None] * len(sessions)
+    key = 'on' if on else 'off'
+
+    def fire(i, session):
+        record = json.loads(session.get('/switch_at', t=repr(target), **{key: relay},
+                                        tag='spread-test'))
+        # The server answers at once; fetch the outcome after the target
+        time.sleep(max(0.0, target - time.time()))
+        while record['status'] == 'scheduled':
+            time.sleep(0.02)
+            record = json.loads(session.get(f"/switch_at/{record['id']}"))
+        records[i] = record
+
+    threads = [threading.Thread(target=fire, args=(i, s)) for i, s in enumerate(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return records
+
+
+def round_sequential(sessions, relay, on):
+    # What a script without /switch_at does: one call after another.  The
+    # switch time is only known as "before the response arrived".
+    key = 'on' if on else 'off'
+    done = []
+    for session in sessions:
+        session.get('/set', **{key: relay})
+        done.append(time.time())
+    return done
+
+
+def summary(name, values):
+    values = sorted(values)
+    p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+    print(f"{name:<22}{statistics.median(values):>10.3f}{p95:>10.3f}{values[-1]:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the switching spread of several controllers")
+    parser.add_argument('--instances', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--lead', type=float, default=0.3,
+                        help="seconds between sending /switch_at and the target time")
+    parser.add_argument('--port', type=int, default=5100, help="port of the first instance")
+    parser.add_argument('--relays', type=int, default=16)
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='relay123')
+    args = parser.parse_args()
+
+    print(f"Starting {args.instances} simulated controllers...")
+    instances = start_instances(args.instances, args.port, args.relays)
+    try:
+        sessions = [Session(url, args.username, args.password) for _, url, _ in instances]
+        spreads, late, writes, sequential = [], [], [], []
+        missed = 0
+        for i in range(args.rounds):
+            records = round_switch_at(sessions, args.lead, 1, on=not i & 1)
+            missed += sum(r['status'] != 'done' for r in records)
+            records = [r for r in records if r['status'] == 'done']
+            if not records:
+                continue
+            spreads.append(spread_ms([r['started'] for r in records]))
+            late.extend(r['late_ms'] for r in records)
+            writes.extend(r['write_us'] / 1000 for r in records)
+            sequential.append(spread_ms(round_sequential(sessions, 2, on=not i & 1)))
+        print(f"\n{args.instances} controllers, {args.rounds} rounds (ms)")
+        print(f"{'':<22}{'median':>10}{'p95':>10}{'max':>10}")
+        summary('switch_at spread', spreads)
+        summary('switch_at lateness', late)
+        summary('write duration', writes)
+        summary('sequential /set spread', sequential)
+        if missed:
+            print(f"{missed} timed switches were missed or failed")
+    finally:
+        stop_instances(instances)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Switch relays at an agreed wall-clock time ("switch at timestamp T").
+
+Controllers whose clocks are disciplined by NTP/chrony or PTP share
+CLOCK_REALTIME to well under a millisecond, so the best way to switch
+relays on several Pis together is to send every controller the same target
+time ahead of it rather than racing HTTP calls.  Each controller:
+
+1. accepts the request right away and keeps it in a heap served by one
+   timer thread, so no server thread waits for T;
+2. `STAGE_LEAD` seconds before T hands the job to the writer thread as an
+   emergency command that does not interrupt anything, so it runs as soon
+   as the current write is done and then holds the writer until T;
+3. stages the bulk write (interlock check, per-line values) so firing it
+   is a single ``set_values()`` call with gpiod;
+4. sleeps until `SPIN` seconds before T and busy-waits the rest on
+   ``CLOCK_REALTIME``, with the garbage collector paused and a short GIL
+   switch interval so no other server thread delays the write;
+5. writes, reads the clock again and records when the write started and
+   finished, so the skew between controllers can be audited afterwards.
+
+If the writer only gets to the job after T, the switch is not made and the
+record says ``missed``: a late switch is worse than none when the point is
+to switch together.  An emergency stop cancels every switch that has not
+been written yet (`cancel_pending`), including one holding the writer.
+"""
+
+import collections
+import gc
+import heapq
+import itertools
+import math
+import sys
+import threading
+import time
+
+# Hand the job to the writer this long before T (and refuse closer targets)
+STAGE_LEAD = 0.1
+# Busy-wait the last stretch instead of trusting sleep()
+SPIN = 0.002
+# Refuse targets further ahead than this
+MAX_AHEAD = 60.0
+# Refuse new switches while this many are waiting for their target
+MAX_PENDING = 64
+# GIL switch interval while firing: other threads of the server (Flask,
+# timers) would otherwise hold the GIL for up to 5 ms when the wait ends
+FIRE_SWITCH_INTERVAL = 0.0001
+
+
+def realtime():
+    """Seconds since the epoch from CLOCK_REALTIME (the PTP/NTP-disciplined clock)"""
+    return time.clock_gettime(time.CLOCK_REALTIME)
+
+
+def wait_until(target, spin=SPIN, clock=realtime, sleep=time.sleep):
+    """Sleep until ``spin`` seconds before ``target``, then busy-wait until it"""
+    remaining = target - clock() - spin
+    if remaining > 0:
+        sleep(remaining)
+    while clock() < target:
+        pass
+
+
+class TimedSwitcher(object):
+    """Fires pre-staged bulk writes at a wall-clock time and keeps an audit log.
+
+    Every switch has a record (a dict) whose ``status`` goes from
+    ``scheduled`` to ``done``, ``missed``, ``cancelled`` or ``failed``.
+
+    Args:
+        stage (callable): ``stage(on_mask, off_mask)`` returns ``(write,
+            commit)`` (see `relay_lib.relay_stage_mask`) or None.
+        submit (callable): ``submit(func)`` queues ``func`` on the hardware
+            writer ahead of ordinary commands and returns without waiting.
+        sleep (callable): Sleeps on the writer until shortly before the
+            target; it should raise when an emergency stop interrupts it
+            (e.g. `command_queue.CommandQueue.step_sleep`).
+        history (int): How many switches to keep for `recent`.
+    """
+
+    def __init__(self, stage, submit, sleep=time.sleep, history=100, clock=realtime):
+        self.stage = stage
+        self.submit = submit
+        self.sleep = sleep
+        self.clock = clock
+        self._history = collections.deque(maxlen=history)
+        self._pending = []        # (target, id, record, on_mask, off_mask)
+        self._unfinished = {}     # id -> record, until the switch is written or dropped
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+
+    def start(self):
+        thread = threading.Thread(target=self._run, name='timed-switch', daemon=True)
+        thread.start()
+        return thread
+
+    def switch_at(self, target, on_mask=0, off_mask=0, tag=None):
+        """Schedule a switch at ``target`` (epoch seconds) and return its record.
+
+        Raises:
+            ValueError: If ``target`` is not finite, too far ahead, too close
+                to stage the write in time, or too many switches are pending.
+        """
+        if not math.isfinite(target):
+            # NaN would pass both range checks below and fire at once
+            raise ValueError(f"target must be a finite timestamp, not {target}")
+        now = self.clock()
+        if target - now > MAX_AHEAD:
+            raise ValueError(f"target is {target - now:.1f}s ahead (max {MAX_AHEAD:.0f}s)")
+        if target - now < STAGE_LEAD:
+            raise ValueError(f"target is {target - now:.3f}s ahead, "
+                             f"at least {STAGE_LEAD}s is needed to reserve the writer")
+        with self._cond:
+            if len(self._pending) >= MAX_PENDING:
+                raise ValueError(f"{MAX_PENDING} timed switches are already pending")
+            record = {'id': next(self._ids), 'tag': tag, 'target': target, 'received': now,
+                      'status': 'scheduled', 'started': None, 'written': None,
+                      'late_ms': None, 'write_us': None, 'error': None}
+            self._history.append(record)
+            self._unfinished[record['id']] = record
+            heapq.heappush(self._pending, (target, record['id'], record, on_mask, off_mask))
+            self._cond.notify()
+            return dict(record)
+
+    def cancel_pending(self, reason="cancelled by an emergency stop"):
+        """Drop every switch not written yet; returns how many were cancelled.
+
+        A switch already holding the writer is interrupted by the emergency
+        command itself; it sees its record cancelled and does not write.
+        """
+        with self._cond:
+            records = list(self._unfinished.values())
+            self._unfinished.clear()
+            self._pending = []
+            for record in records:
+                record.update(status='cancelled', error=reason)
+        for record in records:
+            print(f"Timed switch {record['id']} cancelled: {reason}")
+        return len(records)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending or self._pending[0][0] - STAGE_LEAD > self.clock():
+                    timeout = self._pending[0][0] - STAGE_LEAD - self.clock() if self._pending else None
+                    self._cond.wait(timeout)
+                target, _, record, on_mask, off_mask = heapq.heappop(self._pending)
+            try:
+                self.submit(lambda: self._fire(record, target, on_mask, off_mask))
+            except Exception as e:
+                self._finish(record, status='failed', error=str(e))
+
+    def _fire(self, record, target, on_mask, off_mask):
+        """Runs on the writer thread: stage, spin until ``target``, write"""
+        if record['status'] != 'scheduled':
+            return  # cancelled while it waited for the writer
+        if self.clock() >= target:
+            self._finish(record, status='missed', error="writer was busy until after the target")
+            return
+        try:
+            staged = self.stage(on_mask, off_mask)
+        except Exception as e:
+            self._finish(record, status='failed', error=str(e))
+            return
+        if staged is None:
+            self._finish(record, status='done')
+            return
+        write, commit = staged
+        gc_was_enabled = gc.isenabled()
+        switch_interval = sys.getswitchinterval()
+        gc.disable()
+        sys.setswitchinterval(FIRE_SWITCH_INTERVAL)
+        try:
+            try:
+                wait_until(target, clock=self.clock, sleep=self.sleep)
+            except Exception as e:
+                # Interrupted by an emergency command while holding the writer
+                if record['status'] == 'scheduled':
+                    self._finish(record, status='cancelled', error=str(e))
+                return
+            if record['status'] != 'scheduled':
+                return
+            started = self.clock()
+            write()
+            written = self.clock()
+        except Exception as e:
+            self._finish(record, status='failed', error=str(e))
+            return
+        finally:
+            sys.setswitchinterval(switch_interval)
+            if gc_was_enabled:
+                gc.enable()
+        commit()
+        self._finish(record, status='done', started=started, written=written,
+                     late_ms=round((started - target) * 1000, 3),
+                     write_us=round((written - started) * 1e6, 1))
+        print(f"Timed switch {record['id']} fired {record['late_ms']} ms after target")
+
+    def _finish(self, record, **fields):
+        with self._cond:
+            self._unfinished.pop(record['id'], None)
+            record.update(fields)
+        if fields.get('error'):
+            print(f"Timed switch {record['id']} {fields['status']}: {fields['error']}")
+
+    def get(self, switch_id):
+        """The record of one switch, or None if it is unknown or too old"""
+        with self._cond:
+            for record in self._history:
+                if record['id'] == switch_id:
+                    return dict(record)
+        return None
+
+    def recent(self):
+        with self._cond:
+            return [dict(record) for record in self._history]